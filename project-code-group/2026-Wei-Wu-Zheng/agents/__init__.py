@@ -2,8 +2,12 @@
 Agents package for the Drowsiness Detection System
 """
 
-from .agent1_filter import SignalFilterAgent
-from .agent2_features import FeatureExtractionAgent
-from .agent3_decision import DecisionAgent
+from .agent1_filter import SignalFilterAgent, OnlineArtifactDetector
+from .agent2_features import (FeatureExtractionAgent, FeatureResult, PanTompkinsDetector, HRVAccumulator,
+                              SpectralHRVTracker)
+from .agent3_decision import DecisionAgent, DecisionResult
+from .baseline_store import BaselineStore
 
-__all__ = ['SignalFilterAgent', 'FeatureExtractionAgent', 'DecisionAgent']
+__all__ = ['SignalFilterAgent', 'OnlineArtifactDetector', 'FeatureExtractionAgent', 'FeatureResult',
+           'PanTompkinsDetector', 'HRVAccumulator', 'SpectralHRVTracker', 'DecisionAgent',
+           'DecisionResult', 'BaselineStore']
@@ -3,18 +3,277 @@ Agent 1: Signal Processing Agent
 Responsible for ECG signal cleaning and artifact removal
 """
 
+import contextlib
+import tracemalloc
+
 import numpy as np
 from scipy import signal
 
+# Samples per block in low-memory mode (bounds temporary allocations)
+LOW_MEMORY_BLOCK_SIZE = 65536
+
+# Filter banks already designed, keyed by (sampling_rate, highpass, lowpass, order, notch_freq, notch_q)
+_FILTER_BANK_CACHE = {}
+
+class FilterBank:
+    """
+    Precompiled ECG filter bank
+
+    Designs the highpass, lowpass and notch stages once and fuses them
+    into a single second-order-sections cascade, so the whole chain is
+    applied with one sosfilt pass over the signal.
+    """
+
+    def __init__(self, sampling_rate=250, highpass_cutoff=0.5, lowpass_cutoff=40,
+                 filter_order=4, notch_freq=50, notch_quality=30):
+        self.sampling_rate = sampling_rate
+        self.highpass_cutoff = highpass_cutoff
+        self.lowpass_cutoff = lowpass_cutoff
+        self.filter_order = filter_order
+        self.notch_freq = notch_freq
+        self.notch_quality = notch_quality
+
+        self.sos_high = signal.butter(filter_order, highpass_cutoff, 'highpass',
+                                      fs=sampling_rate, output='sos')
+        self.sos_low = signal.butter(filter_order, lowpass_cutoff, 'lowpass',
+                                     fs=sampling_rate, output='sos')
+
+        # The notch is only defined below Nyquist (e.g. 50 Hz cannot be notched at 100 Hz)
+        self.notch_enabled = notch_freq is not None and notch_freq < sampling_rate / 2
+        if self.notch_enabled:
+            b_notch, a_notch = signal.iirnotch(notch_freq, notch_quality, sampling_rate)
+            self.sos_notch = signal.tf2sos(b_notch, a_notch)
+        else:
+            self.sos_notch = np.empty((0, 6))
+
+        # Fused cascade: highpass -> lowpass -> notch
+        self.sos = np.vstack([self.sos_high, self.sos_low, self.sos_notch])
+
+    @property
+    def key(self):
+        """Cache key of this filter bank"""
+        return (self.sampling_rate, self.highpass_cutoff, self.lowpass_cutoff,
+                self.filter_order, self.notch_freq, self.notch_quality)
+
+    def apply(self, raw_signal):
+        """
+        Run the fused cascade over a signal in a single pass
+
+        Args:
+            raw_signal: Raw ECG data (numpy array), filtered along the last axis
+
+        Returns:
+            numpy array: Filtered signal
+        """
+        return signal.sosfilt(self.sos, raw_signal, axis=-1)
+
+def get_filter_bank(sampling_rate=250, highpass_cutoff=0.5, lowpass_cutoff=40,
+                    filter_order=4, notch_freq=50, notch_quality=30):
+    """
+    Get a cached filter bank, designing it only on first use
+
+    Returns:
+        FilterBank: Filter bank for the given parameters
+    """
+    key = (sampling_rate, highpass_cutoff, lowpass_cutoff, filter_order, notch_freq, notch_quality)
+    bank = _FILTER_BANK_CACHE.get(key)
+    if bank is None:
+        bank = FilterBank(*key)
+        _FILTER_BANK_CACHE[key] = bank
+    return bank
+
+def merge_stats(count, mean, m2, segment):
+    """
+    Merge a segment into running (count, mean, M2) statistics
+
+    Uses the parallel Welford update (Chan et al.), so variance stays
+    numerically stable however the data is split.
+
+    Returns:
+        tuple: Updated (count, mean, m2); variance is m2 / count
+    """
+    n = len(segment)
+    if n == 0:
+        return count, mean, m2
+    seg_mean = np.mean(segment, dtype=np.float64)
+    seg_m2 = np.sum(np.square(segment - seg_mean, dtype=np.float64))
+    total = count + n
+    delta = seg_mean - mean
+    mean += delta * n / total
+    m2 += seg_m2 + delta ** 2 * count * n / total
+    return total, mean, m2
+
+@contextlib.contextmanager
+def track_peak_memory(profile, stage):
+    """
+    Record the peak traced memory of a processing stage
+
+    Args:
+        profile: dict receiving {stage: peak bytes}, or None to skip tracking
+        stage: Stage name
+    """
+    if profile is None:
+        yield
+        return
+
+    started = not tracemalloc.is_tracing()
+    if started:
+        tracemalloc.start()
+    tracemalloc.reset_peak()
+    baseline = tracemalloc.get_traced_memory()[0]
+    try:
+        yield
+    finally:
+        profile[stage] = tracemalloc.get_traced_memory()[1] - baseline
+        if started:
+            tracemalloc.stop()
+
+def describe_artifacts(artifact_count, n_windows, overall_std):
+    """
+    Describe artifact detection results
+
+    Args:
+        artifact_count: Number of artifact windows
+        n_windows: Number of windows checked
+        overall_std: Overall signal std
+
+    Returns:
+        list: Detected artifact descriptions
+    """
+    artifacts = []
+
+    # Describe based on artifact count
+    if artifact_count > n_windows * 0.3:
+        artifacts.append(f"[WARN] Detected heavy motion artifacts ({artifact_count}/{n_windows} segments)")
+        artifacts.append("   Possible cause: Continuous head movement or speaking")
+    elif artifact_count > n_windows * 0.1:
+        artifacts.append(f"[WARN] Detected motion artifacts ({artifact_count}/{n_windows} segments)")
+        artifacts.append("   Possible cause: Occasional body movement")
+
+    # Check overall signal quality
+    if overall_std > 2.0:
+        artifacts.append("[WARN] High overall signal variance, may contain significant noise")
+
+    if not artifacts:
+        artifacts.append("[OK] Signal quality good, no obvious artifacts detected")
+
+    return artifacts
+
+class OnlineArtifactDetector:
+    """
+    Online companion to SignalFilterAgent.detect_artifacts
+
+    Keeps running (Welford) mean/variance for the whole stream and for the
+    current window, so each sample is handled in O(1) and history is never
+    re-scanned. A window is flagged when its std exceeds
+    threshold_multiplier x the std of everything seen so far.
+    """
+
+    def __init__(self, sampling_rate=250, threshold_multiplier=3.0, window_seconds=1.0):
+        self.sampling_rate = sampling_rate
+        self.threshold_multiplier = threshold_multiplier
+        self.window_size = max(1, int(round(sampling_rate * window_seconds)))
+        self.reset()
+
+    def reset(self):
+        """Clear all running statistics and events"""
+        # Global running statistics
+        self.count = 0
+        self.mean = 0.0
+        self.m2 = 0.0
+
+        # Current window running statistics
+        self.window_count = 0
+        self.window_mean = 0.0
+        self.window_m2 = 0.0
+
+        self.n_windows = 0
+        self.artifact_count = 0
+        self.events = []
+
+    @property
+    def overall_std(self):
+        """Std of all samples seen so far"""
+        return np.sqrt(self.m2 / self.count) if self.count else 0.0
+
+    def update(self, samples):
+        """
+        Feed new samples and flag any windows they complete
+
+        Args:
+            samples: New samples (scalar or numpy array)
+
+        Returns:
+            list: Artifact events for windows completed by these samples,
+                  each with start/end sample indices (end exclusive)
+        """
+        samples = np.atleast_1d(np.asarray(samples, dtype=float))
+        new_events = []
+
+        pos = 0
+        while pos < len(samples):
+            take = min(self.window_size - self.window_count, len(samples) - pos)
+            segment = samples[pos:pos + take]
+            pos += take
+
+            self.count, self.mean, self.m2 = merge_stats(self.count, self.mean, self.m2, segment)
+            self.window_count, self.window_mean, self.window_m2 = merge_stats(
+                self.window_count, self.window_mean, self.window_m2, segment)
+
+            if self.window_count == self.window_size:
+                window_std = np.sqrt(self.window_m2 / self.window_count)
+                threshold = self.overall_std * self.threshold_multiplier
+                if window_std > threshold:
+                    end = self.count
+                    event = {
+                        "type": "artifact",
+                        "start": end - self.window_size,
+                        "end": end,
+                        "window_std": float(window_std),
+                        "threshold": float(threshold)
+                    }
+                    new_events.append(event)
+                    self.artifact_count += 1
+
+                self.n_windows += 1
+                self.window_count, self.window_mean, self.window_m2 = 0, 0.0, 0.0
+
+        self.events.extend(new_events)
+        return new_events
+
+    def summary(self):
+        """Text summary in the same format as detect_artifacts"""
+        return describe_artifacts(self.artifact_count, self.n_windows, self.overall_std)
+
 class SignalFilterAgent:
     """Agent 1: Responsible for ECG signal cleaning"""
 
-    def __init__(self):
+    def __init__(self, highpass_cutoff=0.5, lowpass_cutoff=40, filter_order=4,
+                 notch_freq=50, notch_quality=30):
         self.name = "Signal Filter Agent"
         self.status = "Standby"
         self.processing_log = []
 
-    def filter_ecg(self, raw_signal, sampling_rate=250):
+        # Filter settings (change notch_freq to 60 Hz for US and other regions)
+        self.highpass_cutoff = highpass_cutoff
+        self.lowpass_cutoff = lowpass_cutoff
+        self.filter_order = filter_order
+        self.notch_freq = notch_freq
+        self.notch_quality = notch_quality
+
+        # Peak memory per stage from the last profiled call (bytes)
+        self.memory_profile = {}
+
+        # Streaming state (see process_chunk)
+        self.reset_stream()
+
+    def get_filter_bank(self, sampling_rate=250):
+        """Get the cached filter bank for this agent's settings"""
+        return get_filter_bank(sampling_rate, self.highpass_cutoff, self.lowpass_cutoff,
+                               self.filter_order, self.notch_freq, self.notch_quality)
+
+    def filter_ecg(self, raw_signal, sampling_rate=250, low_memory=False, out=None,
+                   dtype=None, profile_memory=False):
         """
         Clean ECG signal by removing noise
 
@@ -23,36 +282,167 @@ class SignalFilterAgent:
         2. Lowpass filter: Remove high-frequency noise
         3. Notch filter: Remove power line interference (50/60 Hz)
 
+        The three stages come from a cached FilterBank and are applied
+        as one fused SOS cascade (single causal pass).
+
+        Low-memory mode (1-D only) filters block by block into one output
+        buffer (float32 by default) and normalizes it in place, so the only
+        full-length allocation is the output itself. Pass out=raw_signal to
+        filter fully in place.
+
+        Args:
+            raw_signal: Raw ECG data (numpy array), 1-D or 2-D (n_recordings, n_samples)
+            sampling_rate: Sampling rate (Hz)
+            low_memory: Use the blocked, in-place path
+            out: Optional output buffer for low-memory mode
+            dtype: Output dtype for low-memory mode (default float32)
+            profile_memory: Record peak memory per stage in self.memory_profile
+
+        Returns:
+            cleaned_signal: Cleaned signal, same shape as raw_signal
+        """
+        self.status = "Processing..."
+        self.processing_log = []
+        profile = {} if profile_memory else None
+
+        try:
+            bank = self.get_filter_bank(sampling_rate)
+
+            # 1-3. Highpass, lowpass and notch in one pass
+            with track_peak_memory(profile, "filter"):
+                if low_memory:
+                    cleaned_signal, stats = self._filter_blocks(raw_signal, bank, out, dtype)
+                else:
+                    cleaned_signal = bank.apply(raw_signal)
+            self.processing_log.append(f"[OK] Baseline wander removed (highpass {bank.highpass_cutoff} Hz)")
+            self.processing_log.append(f"[OK] High-frequency noise removed (lowpass {bank.lowpass_cutoff} Hz)")
+            if bank.notch_enabled:
+                self.processing_log.append(f"[OK] Power line interference removed (notch {bank.notch_freq} Hz)")
+            else:
+                self.processing_log.append(f"[SKIP] Notch {bank.notch_freq} Hz above Nyquist, not applied")
+
+            # 4. Normalization (per recording for 2-D input)
+            with track_peak_memory(profile, "normalize"):
+                if low_memory:
+                    count, mean, m2 = stats
+                    cleaned_signal -= mean
+                    cleaned_signal /= np.sqrt(m2 / count)
+                else:
+                    cleaned_signal -= np.mean(cleaned_signal, axis=-1, keepdims=True)
+                    cleaned_signal /= np.std(cleaned_signal, axis=-1, keepdims=True)
+            if cleaned_signal.ndim > 1:
+                self.processing_log.append(f"[OK] {cleaned_signal.shape[0]} recordings normalized")
+            else:
+                self.processing_log.append("[OK] Signal normalized")
+
+            if profile is not None:
+                self.memory_profile = profile
+                for stage, peak in profile.items():
+                    self.processing_log.append(f"[MEM] {stage}: {peak / 1e6:.2f} MB peak")
+
+            self.status = "Done"
+
+            return cleaned_signal
+
+        except Exception as e:
+            self.status = f"Error: {str(e)}"
+            self.processing_log.append(f"[FAIL] Processing failed: {str(e)}")
+            raise
+
+    def _filter_blocks(self, raw_signal, bank, out=None, dtype=None):
+        """
+        Filter a 1-D signal block by block into an output buffer
+
+        Carries the SOS state across blocks (identical to one pass) and
+        collects mean/variance on the way, so normalization needs no
+        extra pass or temporary array.
+
+        Returns:
+            tuple: (output buffer, (count, mean, m2) of the filtered signal)
+        """
+        raw_signal = np.asarray(raw_signal)
+        if raw_signal.ndim != 1:
+            raise ValueError("low_memory mode expects a 1-D signal")
+
+        if out is None:
+            out = np.empty(raw_signal.shape, dtype=dtype or np.float32)
+        elif out.shape != raw_signal.shape:
+            raise ValueError(f"out has shape {out.shape}, expected {raw_signal.shape}")
+
+        stats = (0, 0.0, 0.0)
+        blocks = (raw_signal[start:start + LOW_MEMORY_BLOCK_SIZE]
+                  for start in range(0, len(raw_signal), LOW_MEMORY_BLOCK_SIZE))
+
+        start = 0
+        for block in self._iter_filtered_blocks(bank, blocks):
+            out[start:start + len(block)] = block
+            start += len(block)
+            stats = merge_stats(*stats, block)
+
+        return out, stats
+
+    def _iter_filtered_blocks(self, bank, blocks):
+        """
+        Filter consecutive blocks, carrying the SOS state between them
+
+        Because the state is carried, block seams are invisible: the
+        concatenated output equals one pass over the whole signal.
+        Filtering runs in float64 (a float32 0.5 Hz highpass drifts badly
+        with a DC offset), at most LOW_MEMORY_BLOCK_SIZE samples at a
+        time; callers cast when writing the output.
+        """
+        zi = np.zeros((bank.sos.shape[0], 2))
+        for block in blocks:
+            for start in range(0, len(block), LOW_MEMORY_BLOCK_SIZE):
+                piece = np.asarray(block[start:start + LOW_MEMORY_BLOCK_SIZE], dtype=np.float64)
+                filtered, zi = signal.sosfilt(bank.sos, piece, zi=zi)
+                yield filtered
+
+    def filter_to_file(self, chunks, out_path, sampling_rate=250, dtype=np.float32):
+        """
+        Clean a long recording out of core
+
+        Filters an iterable of raw chunks (e.g. from utils.long_recording)
+        into a raw binary file, then normalizes that file in place through
+        a memory map. Peak memory is bounded by the chunk size, whatever
+        the recording length.
+
         Args:
-            raw_signal: Raw ECG data (numpy array)
+            chunks: Iterable of raw ECG chunks (numpy arrays)
+            out_path: Path of the cleaned output file (raw binary, dtype)
             sampling_rate: Sampling rate (Hz)
+            dtype: Output dtype
 
         Returns:
-            cleaned_signal: Cleaned signal
+            numpy.memmap: Cleaned signal backed by out_path
         """
         self.status = "Processing..."
         self.processing_log = []
 
         try:
-            # 1. Remove baseline wander (highpass filter, cutoff 0.5 Hz)
-            sos_high = signal.butter(4, 0.5, 'highpass', fs=sampling_rate, output='sos')
-            signal_high = signal.sosfilt(sos_high, raw_signal)
-            self.processing_log.append("[OK] Baseline wander removed (highpass 0.5 Hz)")
-
-            # 2. Remove high-frequency noise (lowpass filter, cutoff 40 Hz)
-            sos_low = signal.butter(4, 40, 'lowpass', fs=sampling_rate, output='sos')
-            signal_filtered = signal.sosfilt(sos_low, signal_high)
-            self.processing_log.append("[OK] High-frequency noise removed (lowpass 40 Hz)")
-
-            # 3. Remove power line interference (notch filter, 50 Hz)
-            # Note: Change to 60 Hz for US and other regions
-            b_notch, a_notch = signal.iirnotch(50, 30, sampling_rate)
-            cleaned_signal = signal.filtfilt(b_notch, a_notch, signal_filtered)
-            self.processing_log.append("[OK] Power line interference removed (notch 50 Hz)")
-
-            # 4. Normalization
-            cleaned_signal = (cleaned_signal - np.mean(cleaned_signal)) / np.std(cleaned_signal)
+            bank = self.get_filter_bank(sampling_rate)
+            stats = (0, 0.0, 0.0)
+
+            # Pass 1: filter chunk by chunk, appending to the output file
+            with open(out_path, "wb") as f:
+                for block in self._iter_filtered_blocks(bank, chunks):
+                    block.astype(dtype, copy=False).tofile(f)
+                    stats = merge_stats(*stats, block)
+            count, mean, m2 = stats
+            if count == 0:
+                raise ValueError("Recording contains no samples")
+            self.processing_log.append(f"[OK] {count} samples filtered out of core (fused SOS cascade)")
+
+            # Pass 2: normalize the memory-mapped output in place
+            cleaned_signal = np.memmap(out_path, dtype=dtype, mode="r+", shape=(count,))
+            std = np.sqrt(m2 / count)
+            for start in range(0, count, LOW_MEMORY_BLOCK_SIZE):
+                block = cleaned_signal[start:start + LOW_MEMORY_BLOCK_SIZE]
+                block -= mean
+                block /= std
+            cleaned_signal.flush()
             self.processing_log.append("[OK] Signal normalized")
+            self.processing_log.append(f"[OK] Cleaned signal written to {out_path}")
 
             self.status = "Done"
 
@@ -63,87 +453,252 @@ class SignalFilterAgent:
             self.processing_log.append(f"[FAIL] Processing failed: {str(e)}")
             raise
 
-    def detect_artifacts(self, signal_data, threshold_multiplier=3.0):
+    def reset_stream(self, sampling_rate=250):
         """
-        Detect motion artifacts
+        Reset streaming state before a new live session
 
-        Uses simple statistical method:
-        - If a segment's std exceeds N times the overall std, it's considered an artifact
+        Args:
+            sampling_rate: Sampling rate of the incoming stream (Hz)
+        """
+        bank = self.get_filter_bank(sampling_rate)
+        self.stream_sampling_rate = sampling_rate
+        self.stream_zi = np.zeros((bank.sos.shape[0], 2))
+        self.stream_count = 0
+        self.stream_mean = 0.0
+        self.stream_m2 = 0.0
+
+    def process_chunk(self, chunk, sampling_rate=None):
+        """
+        Clean the next chunk of a live ECG stream
+
+        Carries the SOS filter state between chunks and normalizes with
+        running mean/std (Welford), so each call costs O(len(chunk)).
+        Filtered samples are identical to filter_ecg on the full buffer;
+        normalized samples converge to it once the running statistics
+        have warmed up.
 
         Args:
-            signal_data: Signal data
-            threshold_multiplier: Threshold multiplier
+            chunk: New raw ECG samples (numpy array)
+            sampling_rate: Sampling rate (Hz), resets the stream if it changes
 
         Returns:
-            list: Detected artifact descriptions
+            cleaned_chunk: Cleaned samples for this chunk
         """
-        artifacts = []
+        if sampling_rate is not None and sampling_rate != self.stream_sampling_rate:
+            self.reset_stream(sampling_rate)
 
-        # Calculate overall statistics
-        overall_std = np.std(signal_data)
-        overall_mean = np.mean(signal_data)
+        # A live feed can deliver no new samples (sosfilt rejects empty input)
+        if len(chunk) == 0:
+            return np.empty(0)
+
+        bank = self.get_filter_bank(self.stream_sampling_rate)
+        filtered, self.stream_zi = signal.sosfilt(bank.sos, chunk, zi=self.stream_zi)
+
+        self.stream_count, self.stream_mean, self.stream_m2 = merge_stats(
+            self.stream_count, self.stream_mean, self.stream_m2, filtered)
+
+        std = np.sqrt(self.stream_m2 / self.stream_count)
+        if std == 0:
+            return filtered - self.stream_mean
+        filtered -= self.stream_mean
+        filtered /= std
+        return filtered
+
+    def detect_artifact_windows(self, signal_data, sampling_rate=250, threshold_multiplier=3.0,
+                                window_seconds=1.0):
+        """
+        Flag artifact windows (vectorized)
+
+        A window is an artifact if its std exceeds N times the overall std.
+
+        Args:
+            signal_data: Signal data (1-D)
+            sampling_rate: Sampling rate (Hz)
+            threshold_multiplier: Threshold multiplier
+            window_seconds: Window length (seconds)
 
-        # Check segments (1 second each)
-        window_size = 250  # Assuming 250 Hz sampling rate
+        Returns:
+            dict: Window size, per-window std and artifact mask, and merged
+                  artifact intervals as (start, end) sample indices (end exclusive)
+        """
+        signal_data = np.asarray(signal_data)
+        window_size = max(1, int(round(sampling_rate * window_seconds)))
         n_windows = len(signal_data) // window_size
 
-        artifact_count = 0
-        for i in range(n_windows):
-            start = i * window_size
-            end = start + window_size
-            window = signal_data[start:end]
+        overall_std = np.std(signal_data)
 
-            window_std = np.std(window)
+        # One row per complete window, std over each row
+        windows = signal_data[:n_windows * window_size].reshape(n_windows, window_size)
+        window_std = np.std(windows, axis=1)
+        mask = window_std > overall_std * threshold_multiplier
 
-            # If this segment's std is abnormally high
-            if window_std > overall_std * threshold_multiplier:
-                artifact_count += 1
+        # Merge runs of consecutive artifact windows into intervals
+        edges = np.diff(np.concatenate(([0], mask.view(np.int8), [0])))
+        starts = np.flatnonzero(edges == 1)
+        ends = np.flatnonzero(edges == -1)
+        intervals = np.column_stack((starts, ends)) * window_size
 
-        # Describe based on artifact count
-        if artifact_count > n_windows * 0.3:
-            artifacts.append(f"[WARN] Detected heavy motion artifacts ({artifact_count}/{n_windows} segments)")
-            artifacts.append("   Possible cause: Continuous head movement or speaking")
-        elif artifact_count > n_windows * 0.1:
-            artifacts.append(f"[WARN] Detected motion artifacts ({artifact_count}/{n_windows} segments)")
-            artifacts.append("   Possible cause: Occasional body movement")
+        return {
+            "window_size": window_size,
+            "n_windows": n_windows,
+            "overall_std": overall_std,
+            "window_std": window_std,
+            "mask": mask,
+            "intervals": intervals
+        }
 
-        # Check overall signal quality
-        if overall_std > 2.0:
-            artifacts.append("[WARN] High overall signal variance, may contain significant noise")
+    def detect_artifacts(self, signal_data, threshold_multiplier=3.0, sampling_rate=250,
+                         return_details=False):
+        """
+        Detect motion artifacts
 
-        if not artifacts:
-            artifacts.append("[OK] Signal quality good, no obvious artifacts detected")
+        Uses simple statistical method:
+        - If a segment's std exceeds N times the overall std, it's considered an artifact
 
+        Args:
+            signal_data: Signal data
+            threshold_multiplier: Threshold multiplier
+            sampling_rate: Sampling rate (Hz), sets the 1-second segment size
+            return_details: Also return the window mask and artifact intervals
+
+        Returns:
+            list: Detected artifact descriptions
+            (list, dict) if return_details, dict from detect_artifact_windows
+        """
+        details = self.detect_artifact_windows(signal_data, sampling_rate, threshold_multiplier)
+        artifacts = describe_artifacts(
+            int(np.count_nonzero(details["mask"])),
+            details["n_windows"],
+            details["overall_std"]
+        )
+
+        if return_details:
+            return artifacts, details
         return artifacts
 
-    def get_quality_metrics(self, raw_signal, cleaned_signal):
+    def get_quality_metrics(self, raw_signal, cleaned_signal, sampling_rate=250, window_seconds=None,
+                            profile_memory=False):
         """
         Calculate signal quality metrics
 
+        All sums are gathered per window in a single blockwise pass, with
+        no full-length squared or noise arrays. Set window_seconds to also
+        get the per-window SNR and noise-reduction series (e.g. to locate
+        bad stretches in long drives).
+
         Args:
-            raw_signal: Raw signal
-            cleaned_signal: Cleaned signal
+            raw_signal: Raw signal, 1-D or 2-D (n_recordings, n_samples)
+            cleaned_signal: Cleaned signal, same shape as raw_signal
+            sampling_rate: Sampling rate (Hz), used with window_seconds
+            window_seconds: Resolution of the per-window series (None to skip)
+            profile_memory: Record peak memory in self.memory_profile
 
         Returns:
-            dict: Quality metrics
+            dict: Quality metrics (list of dicts, one per row, for 2-D input)
+        """
+        raw_signal = np.asarray(raw_signal)
+        cleaned_signal = np.asarray(cleaned_signal)
+        profile = {} if profile_memory else None
+
+        if window_seconds is not None:
+            window_size = max(1, int(round(window_seconds * sampling_rate)))
+        else:
+            window_size = LOW_MEMORY_BLOCK_SIZE
+
+        with track_peak_memory(profile, "quality_metrics"):
+            sums = self._window_quality_sums(raw_signal, cleaned_signal, window_size)
+
+        if profile is not None:
+            self.memory_profile.update(profile)
+
+        totals = {key: np.sum(value, axis=-1) for key, value in sums.items()}
+        noise_reduction, snr = self._quality_ratios(totals)
+
+        # Std from per-window (count, sum, sum of squares), combined with the parallel update
+        raw_std = self._combined_std(sums["n"], sums["raw_sum"], sums["raw_sq"])
+        cleaned_std = self._combined_std(sums["n"], sums["cleaned_sum"], sums["cleaned_sq"])
+
+        if window_seconds is not None:
+            window_noise_reduction, window_snr = self._quality_ratios(sums)
+
+        metrics = []
+        for row in range(noise_reduction.size):
+            row_metrics = {
+                "noise_reduction_percent": round(noise_reduction.flat[row], 2),
+                "signal_to_noise_ratio_db": round(snr.flat[row], 2),
+                "raw_std": round(raw_std.flat[row], 4),
+                "cleaned_std": round(cleaned_std.flat[row], 4)
+            }
+            if window_seconds is not None:
+                row_metrics["window_seconds"] = window_seconds
+                row_metrics["window_snr_db"] = window_snr.reshape(-1, window_snr.shape[-1])[row]
+                row_metrics["window_noise_reduction_percent"] = \
+                    window_noise_reduction.reshape(-1, window_snr.shape[-1])[row]
+            metrics.append(row_metrics)
+
+        return metrics if raw_signal.ndim > 1 else metrics[0]
+
+    def _window_quality_sums(self, raw_signal, cleaned_signal, window_size):
         """
-        # Calculate signal energy reduction percentage (represents noise removed)
-        raw_energy = np.sum(raw_signal ** 2)
-        cleaned_energy = np.sum(cleaned_signal ** 2)
-        noise_reduction = (1 - cleaned_energy / raw_energy) * 100
+        Per-window sums for quality metrics in one blockwise pass
 
-        # Calculate Signal-to-Noise Ratio (SNR)
-        signal_power = np.mean(cleaned_signal ** 2)
-        noise = raw_signal - cleaned_signal
-        noise_power = np.mean(noise ** 2)
-        snr = 10 * np.log10(signal_power / noise_power) if noise_power > 0 else float('inf')
+        A trailing partial window is kept as a shorter last window.
 
-        return {
-            "noise_reduction_percent": round(noise_reduction, 2),
-            "signal_to_noise_ratio_db": round(snr, 2),
-            "raw_std": round(np.std(raw_signal), 4),
-            "cleaned_std": round(np.std(cleaned_signal), 4)
-        }
+        Returns:
+            dict: Arrays of shape (..., n_windows) with the sample count, the
+                  sums and sums of squares of both signals, and the noise energy
+        """
+        n_samples = raw_signal.shape[-1]
+        block_size = window_size * max(1, LOW_MEMORY_BLOCK_SIZE // window_size)
+        keys = ("n", "raw_sum", "raw_sq", "cleaned_sum", "cleaned_sq", "noise_sq")
+        parts = {key: [] for key in keys}
+
+        for start in range(0, n_samples, block_size):
+            stop = min(start + block_size, n_samples)
+            raw_block = raw_signal[..., start:stop].astype(np.float64)
+            cleaned_block = cleaned_signal[..., start:stop].astype(np.float64)
+
+            # Split the block into complete windows plus an optional tail
+            n_full = (stop - start) // window_size
+            pieces = [(raw_block[..., :n_full * window_size], cleaned_block[..., :n_full * window_size],
+                       n_full, window_size)]
+            if n_full * window_size < stop - start:
+                pieces.append((raw_block[..., n_full * window_size:], cleaned_block[..., n_full * window_size:],
+                               1, stop - start - n_full * window_size))
+
+            for raw_piece, cleaned_piece, n_win, size in pieces:
+                if n_win == 0:
+                    continue
+                raw_w = raw_piece.reshape(raw_piece.shape[:-1] + (n_win, size))
+                cleaned_w = cleaned_piece.reshape(cleaned_piece.shape[:-1] + (n_win, size))
+                parts["n"].append(np.full(raw_w.shape[:-1], size, dtype=np.float64))
+                parts["raw_sum"].append(raw_w.sum(axis=-1))
+                parts["raw_sq"].append(np.einsum('...i,...i->...', raw_w, raw_w))
+                parts["cleaned_sum"].append(cleaned_w.sum(axis=-1))
+                parts["cleaned_sq"].append(np.einsum('...i,...i->...', cleaned_w, cleaned_w))
+                raw_w -= cleaned_w  # noise, reusing the block buffer
+                parts["noise_sq"].append(np.einsum('...i,...i->...', raw_w, raw_w))
+
+        return {key: np.concatenate(value, axis=-1) for key, value in parts.items()}
+
+    @staticmethod
+    def _quality_ratios(sums):
+        """Noise reduction (%) and SNR (dB) from energy sums"""
+        with np.errstate(divide='ignore', invalid='ignore'):
+            noise_reduction = (1 - sums["cleaned_sq"] / sums["raw_sq"]) * 100
+            snr = np.where(sums["noise_sq"] > 0,
+                           10 * np.log10(sums["cleaned_sq"] / sums["noise_sq"]), np.inf)
+        return noise_reduction, snr
+
+    @staticmethod
+    def _combined_std(n, total, total_sq):
+        """Population std from per-window count, sum and sum of squares"""
+        window_mean = total / n
+        window_m2 = np.maximum(total_sq - total * window_mean, 0.0)
+        count = np.sum(n, axis=-1, keepdims=True)
+        mean = np.sum(total, axis=-1, keepdims=True) / count
+        m2 = np.sum(window_m2 + n * (window_mean - mean) ** 2, axis=-1)
+        return np.sqrt(m2 / count[..., 0])
 
     def get_log(self):
         """Get processing log"""
@@ -183,16 +738,99 @@ if __name__ == "__main__":
 
     # Detect artifacts
     print("\nArtifact detection:")
-    artifacts = agent1.detect_artifacts(test_signal)
+    artifacts = agent1.detect_artifacts(test_signal, sampling_rate=250)
     for artifact in artifacts:
         print(f"  {artifact}")
 
+    # Injected burst must be located at any sampling rate
+    for fs in (100, 250, 1000):
+        burst_signal = np.random.randn(60 * fs) * 0.1
+        burst_signal[5 * fs:7 * fs] += np.random.randn(2 * fs) * 5
+        _, details = agent1.detect_artifacts(burst_signal, sampling_rate=fs, return_details=True)
+        assert details["intervals"].tolist() == [[5 * fs, 7 * fs]], details["intervals"]
+    print("  [OK] Artifact intervals located at 100/250/1000 Hz")
+
+    # Online detector flags the same burst while samples stream in
+    burst_signal = np.random.randn(60 * 250) * 0.1
+    burst_signal[30 * 250:32 * 250] += np.random.randn(2 * 250) * 5
+    detector = OnlineArtifactDetector(sampling_rate=250)
+    for chunk in np.array_split(burst_signal, 97):
+        detector.update(chunk)
+    flagged = [(e["start"], e["end"]) for e in detector.events]
+    assert flagged == [(30 * 250, 31 * 250), (31 * 250, 32 * 250)], flagged
+    print(f"  [OK] Online detector flagged {len(flagged)} windows as they arrived")
+
     # Quality metrics
     print("\nSignal quality metrics:")
     metrics = agent1.get_quality_metrics(test_signal, cleaned)
     for key, value in metrics.items():
         print(f"  {key}: {value}")
 
+    # Streaming mode must match the batch path after warm-up
+    print("\nStreaming check:")
+    agent1.reset_stream(sampling_rate=250)
+    chunks = np.array_split(test_signal, 40)
+    chunks.insert(20, test_signal[:0])  # an update with no new samples
+    streamed = np.concatenate([agent1.process_chunk(c) for c in chunks])
+    warm_up = 5 * 250  # 5 seconds
+    max_diff = np.max(np.abs(streamed[warm_up:] - cleaned[warm_up:]))
+    print(f"  Max difference after warm-up: {max_diff:.4f}")
+    assert max_diff < 0.1, "Streaming output diverges from batch output"
+    # By the last chunk the running statistics cover the whole buffer
+    assert np.allclose(streamed[-len(chunks[-1]):], cleaned[-len(chunks[-1]):])
+    print("  [OK] Streaming output matches batch output")
+
+    # Batched 2-D input must match per-recording calls
+    print("\nBatch check:")
+    batch = np.vstack([test_signal, 2 * test_signal + 0.1])
+    cleaned_batch = agent1.filter_ecg(batch, sampling_rate=250)
+    assert np.allclose(cleaned_batch[0], cleaned)
+    assert np.allclose(cleaned_batch[1], agent1.filter_ecg(batch[1], sampling_rate=250))
+    batch_metrics = agent1.get_quality_metrics(batch, cleaned_batch)
+    assert batch_metrics[0] == metrics
+    print(f"  [OK] {len(batch_metrics)} recordings match single-recording output")
+
+    # Low-memory float32 path must match the default path
+    print("\nLow-memory check:")
+    lean = agent1.filter_ecg(test_signal, sampling_rate=250, low_memory=True, profile_memory=True)
+    assert lean.dtype == np.float32 and np.allclose(lean, cleaned, atol=1e-3)
+    lean_metrics = agent1.get_quality_metrics(test_signal, lean)
+    assert abs(lean_metrics["signal_to_noise_ratio_db"] - metrics["signal_to_noise_ratio_db"]) < 0.05
+    for stage, peak in agent1.memory_profile.items():
+        print(f"  {stage}: {peak / 1e3:.1f} KB peak")
+    print("  [OK] float32 output matches default path")
+
+    # Out-of-core path: chunks streamed into a memory-mapped file
+    print("\nOut-of-core check:")
+    import os
+    import tempfile
+    out_path = os.path.join(tempfile.mkdtemp(), "cleaned.f32")
+    mapped = agent1.filter_to_file(np.array_split(test_signal, 7), out_path, sampling_rate=250)
+    assert isinstance(mapped, np.memmap) and len(mapped) == len(test_signal)
+    assert np.allclose(mapped, cleaned, atol=1e-3)
+    print(f"  {len(mapped)} samples written to {os.path.basename(out_path)}")
+    print("  [OK] Out-of-core output matches default path")
+
+    # Both paths filter in float64, so a large DC offset at 1000 Hz stays exact
+    t_hour = np.arange(3600 * 1000) / 1000
+    offset_signal = np.sin(2 * np.pi * 1.2 * t_hour) + 0.2 * np.random.randn(len(t_hour)) + 500
+    offset_cleaned = agent1.filter_ecg(offset_signal, sampling_rate=1000)
+    offset_lean = agent1.filter_ecg(offset_signal, sampling_rate=1000, low_memory=True)
+    offset_mapped = agent1.filter_to_file(np.array_split(offset_signal, 50), out_path, sampling_rate=1000)
+    lean_error = np.max(np.abs(offset_lean - offset_cleaned))
+    mapped_error = np.max(np.abs(offset_mapped - offset_cleaned))
+    print(f"  1 h at 1000 Hz, +500 offset: max error {lean_error:.1e} (low-memory), {mapped_error:.1e} (out-of-core)")
+    assert lean_error < 1e-3 and mapped_error < 1e-3
+    print("  [OK] float32 outputs match default path with DC offset")
+
+    # Per-window SNR map at 1-second resolution
+    print("\nPer-window quality check:")
+    window_metrics = agent1.get_quality_metrics(test_signal, cleaned, sampling_rate=250, window_seconds=1)
+    assert len(window_metrics["window_snr_db"]) == 10
+    assert window_metrics["signal_to_noise_ratio_db"] == metrics["signal_to_noise_ratio_db"]
+    print(f"  Window SNR (dB): {np.round(window_metrics['window_snr_db'], 1)}")
+    print("  [OK] Per-window series consistent with totals")
+
     print("\n" + "=" * 50)
     print("[OK] Agent 1 test complete!")
     print("=" * 50)
@@ -3,16 +3,922 @@ Agent 2: Feature Extraction Agent
 Responsible for calculating heart rate and HRV metrics from cleaned ECG signal
 """
 
+import json
+from collections import deque
+from collections.abc import MutableMapping
+from functools import lru_cache
+
 import numpy as np
 from scipy import signal as scipy_signal
+from scipy.ndimage import maximum_filter1d, median_filter
+from scipy.spatial import cKDTree
+
+# HRV frequency bands (Hz), Task Force 1996
+HRV_BANDS = {
+    "vlf": (0.003, 0.04),
+    "lf": (0.04, 0.15),
+    "hf": (0.15, 0.4)
+}
+
+# Evenly resampled RR series rate for the FFT path (Hz)
+RR_RESAMPLE_RATE = 4.0
+
+@lru_cache(maxsize=32)
+def _fft_spectrum_setup(n_samples, resample_rate):
+    """Cached Hann window, its power, and band masks for an n-point FFT"""
+    window = scipy_signal.windows.hann(n_samples, sym=False)
+    freqs = np.fft.rfftfreq(n_samples, 1 / resample_rate)
+    masks = {band: (freqs >= lo) & (freqs < hi) for band, (lo, hi) in HRV_BANDS.items()}
+    return window, float(np.sum(window ** 2)), masks, freqs[1] - freqs[0]
+
+@lru_cache(maxsize=4)
+def _lomb_grid(f_max=0.5, step=0.001):
+    """Cached Lomb-Scargle frequency grid, angular frequencies and band masks"""
+    freqs = np.arange(step, f_max, step)
+    masks = {band: (freqs >= lo) & (freqs < hi) for band, (lo, hi) in HRV_BANDS.items()}
+    return freqs, 2 * np.pi * freqs, masks
+
+# Multi-lead fusion: R-peaks of different leads closer than this are one beat (ms)
+FUSION_TOLERANCE_MS = 75
+
+# Per-beat RR flags from correct_rr_intervals
+RR_NORMAL = 0
+RR_ECTOPIC = 1
+RR_MISSED = 2
+RR_EXTRA = 3
+RR_ARTIFACT = 4
+
+# DFA short-term scaling range (beats), Peng et al. 1995
+DFA_ALPHA1_SCALES = np.arange(4, 17)
+
+# Structured dtype of FeatureExtractionAgent.extract_features_batch results
+BATCH_FEATURE_DTYPE = np.dtype([
+    ("heart_rate", np.float64),
+    ("hrv_sdnn", np.float64),
+    ("hrv_rmssd", np.float64),
+    ("num_beats", np.int64),
+    ("mean_rr", np.float64),
+    ("min_hr", np.float64),
+    ("max_hr", np.float64),
+    ("num_valid_rr", np.int64),
+    ("num_corrected_rr", np.int64)
+])
+
+def resample_rr(rr_intervals, resample_rate=RR_RESAMPLE_RATE):
+    """
+    Linearly interpolate an RR series onto an even time grid
+
+    Each RR value is placed at the time of the beat that ends it.
+
+    Returns:
+        numpy array: RR values (ms) sampled at resample_rate
+    """
+    beat_times = np.cumsum(rr_intervals) / 1000.0
+    grid = np.arange(beat_times[0], beat_times[-1], 1 / resample_rate)
+    return np.interp(grid, beat_times, rr_intervals)
+
+def band_powers_fft(resampled_rr, resample_rate=RR_RESAMPLE_RATE):
+    """
+    VLF/LF/HF power (ms^2) from an evenly sampled RR series
+
+    Hann-windowed periodogram; the window and band masks are cached per length.
+    """
+    window, window_power, masks, df = _fft_spectrum_setup(len(resampled_rr), resample_rate)
+    x = resampled_rr - np.mean(resampled_rr)
+    spectrum = np.fft.rfft(x * window)
+    psd = 2 * np.abs(spectrum) ** 2 / (resample_rate * window_power)
+    return {band: float(np.sum(psd[mask]) * df) for band, mask in masks.items()}
+
+def band_powers_lomb(rr_intervals):
+    """
+    VLF/LF/HF power (ms^2) from an unevenly sampled RR series (Lomb-Scargle)
+
+    The periodogram is scaled so the integrated spectrum equals the RR variance.
+    """
+    freqs, angular, masks = _lomb_grid()
+    beat_times = np.cumsum(rr_intervals) / 1000.0
+    x = rr_intervals - np.mean(rr_intervals)
+    periodogram = scipy_signal.lombscargle(beat_times, x, angular)
+    df = freqs[1] - freqs[0]
+    total = np.sum(periodogram) * df
+    scale = np.var(x) / total if total > 0 else 0.0
+    return {band: float(np.sum(periodogram[mask]) * df * scale) for band, mask in masks.items()}
+
+def frequency_features(powers):
+    """Feature dict from band powers"""
+    lf, hf = powers["lf"], powers["hf"]
+    return {
+        "vlf_power": round(powers["vlf"], 2),
+        "lf_power": round(lf, 2),
+        "hf_power": round(hf, 2),
+        "lf_hf_ratio": round(lf / hf, 3) if hf > 0 else 0
+    }
+
+def correct_rr_intervals(rr_intervals, window=11, threshold=0.2, lower_limit=300, upper_limit=2000):
+    """
+    Detect ectopic, missed and extra beats and correct the RR series
+
+    Each interval is compared with the median of its neighbouring
+    `window` intervals. It is suspicious when it deviates from that local
+    median by more than `threshold` (relative) and also jumps by more than
+    that from the previous or next interval, so slow rate changes are not
+    flagged. Suspicious intervals are classified as:
+    - ectopic: a short interval followed by a long one (premature beat
+      with compensatory pause)
+    - missed: a long interval of about twice the local median
+    - extra: two short intervals that add up to about the local median
+    - artifact: anything else, including values outside the physiological
+      range
+    Flagged intervals are replaced by linear interpolation between the
+    nearest normal intervals, so the series keeps its length and beat
+    order (RMSSD is computed on a continuous series). Every step is a
+    fixed-size filter or elementwise operation, so the cost is O(n).
+
+    Args:
+        rr_intervals: RR intervals (ms)
+        window: Local median length (beats)
+        threshold: Relative deviation from the local median to flag
+        lower_limit: Lower limit (ms), corresponds to ~200 bpm
+        upper_limit: Upper limit (ms), corresponds to ~30 bpm
+
+    Returns:
+        tuple: (corrected NN intervals (ms), per-interval flags as int8,
+               RR_NORMAL / RR_ECTOPIC / RR_MISSED / RR_EXTRA / RR_ARTIFACT)
+    """
+    rr = np.asarray(rr_intervals, dtype=np.float64)
+    flags = np.zeros(len(rr), dtype=np.int8)
+    if len(rr) < 3:
+        return rr.copy(), flags
+
+    # Local reference, with out-of-range values replaced so they cannot skew it
+    out_of_range = (rr < lower_limit) | (rr > upper_limit)
+    reference = rr
+    if np.any(out_of_range) and not np.all(out_of_range):
+        reference = np.where(out_of_range, np.median(rr[~out_of_range]), rr)
+    local = median_filter(reference, size=window, mode="nearest")
+    tolerance = threshold * local
+    deviation = rr - local
+
+    # Successive-difference criterion: a jump into or out of the interval
+    step = np.abs(np.diff(rr)) > tolerance[1:]
+    jump = np.zeros(len(rr), dtype=bool)
+    jump[1:] |= step
+    jump[:-1] |= step
+
+    short = (deviation < -tolerance) & jump
+    long = (deviation > tolerance) & jump
+    flags[short | long | out_of_range] = RR_ARTIFACT
+
+    missed = long & (np.abs(rr - 2 * local) < 2 * tolerance)
+    flags[missed] = RR_MISSED
+
+    extra = short[:-1] & short[1:] & (np.abs(rr[:-1] + rr[1:] - local[:-1]) < tolerance[:-1])
+    flags[:-1][extra] = RR_EXTRA
+    flags[1:][extra] = RR_EXTRA
+
+    ectopic = short[:-1] & long[1:]
+    flags[:-1][ectopic] = RR_ECTOPIC
+    flags[1:][ectopic] = RR_ECTOPIC
+
+    # Interpolate flagged intervals from the normal ones
+    nn = rr.copy()
+    normal = flags == RR_NORMAL
+    if np.count_nonzero(normal) >= 2 and not np.all(normal):
+        flagged = np.flatnonzero(~normal)
+        nn[flagged] = np.interp(flagged, np.flatnonzero(normal), rr[normal])
+
+    return nn, flags
+
+def lead_quality(cleaned_leads):
+    """
+    Signal quality index per lead (kSQI)
+
+    Excess kurtosis of each lead, clipped at 0: a lead with sharp QRS
+    complexes scores well above 0, Gaussian-like noise scores about 0.
+    Moments of all leads are computed together in three array passes.
+
+    Args:
+        cleaned_leads: Cleaned ECG, shape (leads, samples)
+
+    Returns:
+        numpy array: One SQI per lead
+    """
+    centered = cleaned_leads - np.mean(cleaned_leads, axis=1, keepdims=True)
+    squared = centered * centered
+    m2 = np.mean(squared, axis=1)
+    m4 = np.einsum("ij,ij->i", squared, squared) / cleaned_leads.shape[1]
+    excess = np.divide(m4, m2 * m2, out=np.full(len(m2), 3.0), where=m2 > 0) - 3.0
+    return np.maximum(excess, 0.0)
+
+def fuse_r_peaks(lead_peaks, weights, sampling_rate, tolerance_ms=FUSION_TOLERANCE_MS, min_vote=0.5):
+    """
+    Merge per-lead R-peaks into one beat series by weighted voting
+
+    Peaks of all leads are sorted together and grouped into beats
+    wherever consecutive peaks are within tolerance_ms. A beat is kept
+    when the summed weight of the leads voting for it reaches min_vote
+    of the total weight, and is placed at the weighted mean position of
+    its votes. Sorting dominates the cost: O(P log P) for P peaks in total.
+
+    Args:
+        lead_peaks: List of R-peak index arrays, one per lead
+        weights: Weight (e.g. SQI) of each lead
+        sampling_rate: Sampling rate (Hz)
+        tolerance_ms: Maximum spread of one beat across leads (ms)
+        min_vote: Fraction of the total weight a beat needs
+
+    Returns:
+        numpy array: Fused R-peak indices
+    """
+    weights = np.asarray(weights, dtype=np.float64)
+    if not np.any(weights > 0):
+        weights = np.ones(len(lead_peaks))
+
+    positions = np.concatenate([np.asarray(p, dtype=np.int64) for p in lead_peaks])
+    if len(positions) == 0:
+        return np.array([], dtype=np.int64)
+    votes_from = np.repeat(weights, [len(p) for p in lead_peaks])
+
+    order = np.argsort(positions, kind="stable")
+    positions, votes_from = positions[order], votes_from[order]
+
+    tolerance = tolerance_ms / 1000 * sampling_rate
+    beat = np.concatenate(([0], np.cumsum(np.diff(positions) > tolerance)))
+    votes = np.bincount(beat, weights=votes_from)
+    centre = np.bincount(beat, weights=votes_from * positions) / np.maximum(votes, 1e-12)
+
+    keep = votes >= min_vote * np.sum(weights)
+    return np.round(centre[keep]).astype(np.int64)
+
+def select_peaks_by_distance(peaks, heights, distance, chunk_size=10000):
+    """
+    Keep the highest of any peaks closer than distance, as find_peaks does
+
+    Lets peak candidates found window by window be thinned exactly like
+    one find_peaks(distance=...) call over the whole signal, chains of
+    close peaks across window seams included. Gaps of distance or more
+    never interact, so candidates are re-placed on a compact signal with
+    those gaps shortened to distance and find_peaks is run on that, a
+    chunk of candidates at a time (chunks are cut at such gaps).
+
+    Args:
+        peaks: Sorted candidate indices (local maxima)
+        heights: Signal value at each candidate
+        distance: Minimum distance between kept peaks (samples)
+        chunk_size: Approximate number of candidates per find_peaks call
+
+    Returns:
+        numpy array: Kept peak indices
+    """
+    peaks = np.asarray(peaks, dtype=np.int64)
+    heights = np.asarray(heights, dtype=np.float64)
+    if len(peaks) < 2 or distance <= 1:
+        return peaks
+
+    # Independent cut points, about chunk_size candidates apart
+    breaks = np.flatnonzero(np.diff(peaks) >= distance) + 1
+    cuts = []
+    if len(breaks):
+        targets = np.arange(chunk_size, len(peaks), chunk_size)
+        cuts = np.unique(breaks[np.minimum(np.searchsorted(breaks, targets), len(breaks) - 1)])
+
+    kept = []
+    for chunk_peaks, chunk_heights in zip(np.split(peaks, cuts), np.split(heights, cuts)):
+        positions = np.concatenate(([1], 1 + np.cumsum(np.minimum(np.diff(chunk_peaks), distance))))
+        compact = np.full(positions[-1] + 2, chunk_heights.min() - 1.0)
+        compact[positions] = chunk_heights
+        selected, _ = scipy_signal.find_peaks(compact, distance=distance)
+        kept.append(chunk_peaks[np.searchsorted(positions, selected)])
+    return np.concatenate(kept)
+
+def poincare_sd(rr_intervals):
+    """
+    Poincare plot SD1 (short-term) and SD2 (long-term) in ms
+
+    Returns:
+        tuple: (sd1, sd2)
+    """
+    var_diff = np.var(np.diff(rr_intervals), ddof=1)
+    var_rr = np.var(rr_intervals, ddof=1)
+    sd1 = np.sqrt(var_diff / 2)
+    sd2 = np.sqrt(max(2 * var_rr - var_diff / 2, 0.0))
+    return float(sd1), float(sd2)
+
+def _embed(x, m, n_templates):
+    """First n_templates delay vectors of length m as an (n_templates, m) view"""
+    return np.lib.stride_tricks.sliding_window_view(x, m)[:n_templates]
+
+def sample_entropy(rr_intervals, m=2, r=None):
+    """
+    Sample entropy (Richman & Moorman 2000)
+
+    Template matches (Chebyshev distance <= r, self-matches excluded) are
+    counted with a k-d tree instead of comparing all pairs, which keeps
+    24 h of beats tractable.
+
+    Args:
+        rr_intervals: RR intervals (ms)
+        m: Template length
+        r: Tolerance (default 0.2 * SD of the series)
+
+    Returns:
+        float: SampEn, 0 if no matches were found
+    """
+    x = np.asarray(rr_intervals, dtype=np.float64)
+    n_templates = len(x) - m
+    if n_templates < 2:
+        return 0.0
+    if r is None:
+        r = 0.2 * np.std(x)
+
+    matches = []
+    for length in (m, m + 1):
+        tree = cKDTree(_embed(x, length, n_templates))
+        # Ordered pairs including self-matches -> unordered distinct pairs
+        matches.append((tree.count_neighbors(tree, r, p=np.inf) - n_templates) / 2)
+
+    b, a = matches
+    if a == 0 or b == 0:
+        return 0.0
+    return float(-np.log(a / b))
+
+def approximate_entropy(rr_intervals, m=2, r=None):
+    """
+    Approximate entropy (Pincus 1991)
+
+    Per-template match counts (self-matches included) come from k-d tree
+    ball queries rather than an all-pairs distance matrix.
+
+    Args:
+        rr_intervals: RR intervals (ms)
+        m: Template length
+        r: Tolerance (default 0.2 * SD of the series)
+
+    Returns:
+        float: ApEn
+    """
+    x = np.asarray(rr_intervals, dtype=np.float64)
+    if len(x) <= m + 1:
+        return 0.0
+    if r is None:
+        r = 0.2 * np.std(x)
+
+    phi = []
+    for length in (m, m + 1):
+        n_templates = len(x) - length + 1
+        templates = _embed(x, length, n_templates)
+        counts = cKDTree(templates).query_ball_point(templates, r, p=np.inf, return_length=True)
+        phi.append(np.mean(np.log(counts / n_templates)))
+
+    return float(phi[0] - phi[1])
+
+def dfa_alpha1(rr_intervals, scales=DFA_ALPHA1_SCALES):
+    """
+    Short-term detrended fluctuation analysis exponent alpha1
+
+    For each box size the integrated series is cut into non-overlapping
+    boxes and detrended by one matrix product with the box's linear-fit
+    projection, so every scale costs O(n).
+
+    Returns:
+        float: alpha1, 0 if the series is too short
+    """
+    x = np.asarray(rr_intervals, dtype=np.float64)
+    profile = np.cumsum(x - np.mean(x))
+    scales = [n for n in scales if len(profile) // n >= 2]
+    if len(scales) < 2:
+        return 0.0
+
+    fluctuations = []
+    for n in scales:
+        boxes = profile[:len(profile) // n * n].reshape(-1, n)
+        design = np.column_stack((np.ones(n), np.arange(n)))
+        projection = design @ np.linalg.pinv(design)
+        residual = boxes - boxes @ projection.T
+        fluctuations.append(np.sqrt(np.mean(residual ** 2)))
+
+    slope = np.polyfit(np.log(scales), np.log(fluctuations), 1)[0]
+    return float(slope)
+
+def nonlinear_features(rr_intervals):
+    """Nonlinear HRV feature dict (Poincare, entropies, DFA alpha1)"""
+    sd1, sd2 = poincare_sd(rr_intervals)
+    return {
+        "sd1": round(sd1, 2),
+        "sd2": round(sd2, 2),
+        "sd1_sd2_ratio": round(sd1 / sd2, 3) if sd2 > 0 else 0,
+        "sample_entropy": round(sample_entropy(rr_intervals), 3),
+        "approximate_entropy": round(approximate_entropy(rr_intervals), 3),
+        "dfa_alpha1": round(dfa_alpha1(rr_intervals), 3)
+    }
+
+class SpectralHRVTracker:
+    """
+    Sliding-window LF/HF tracker for live sessions
+
+    RR intervals are pushed as beats arrive. Only the new stretch of the
+    evenly resampled series is interpolated (earlier grid points are
+    reused), and the spectrum is refreshed once per hop on the last
+    window of grid points with a cached window and band masks.
+    """
+
+    def __init__(self, window_seconds=300, hop_seconds=5, resample_rate=RR_RESAMPLE_RATE):
+        self.resample_rate = resample_rate
+        self.window_samples = int(window_seconds * resample_rate)
+        self.hop_samples = max(1, int(hop_seconds * resample_rate))
+        self.reset()
+
+    def reset(self):
+        """Clear the session"""
+        self.grid_values = deque(maxlen=self.window_samples)
+        self.last_beat_time = None
+        self.last_rr = None
+        self.elapsed = 0.0
+        self.next_grid_time = None
+        self.since_update = 0
+        self.features = None
+
+    def push(self, rr_interval):
+        """
+        Add one RR interval (ms)
+
+        Returns:
+            dict: Refreshed frequency features if a hop completed, else None
+        """
+        rr_interval = float(rr_interval)
+        self.elapsed += rr_interval / 1000.0
+
+        if self.last_beat_time is None:
+            self.last_beat_time, self.last_rr = self.elapsed, rr_interval
+            self.next_grid_time = self.elapsed
+            return None
+
+        # Interpolate only the grid points between the previous beat and this one
+        n_new = int(np.floor((self.elapsed - self.next_grid_time) * self.resample_rate)) + 1
+        if n_new > 0:
+            times = self.next_grid_time + np.arange(n_new) / self.resample_rate
+            fraction = (times - self.last_beat_time) / (self.elapsed - self.last_beat_time)
+            self.grid_values.extend(self.last_rr + (rr_interval - self.last_rr) * fraction)
+            self.next_grid_time += n_new / self.resample_rate
+            self.since_update += n_new
+
+        self.last_beat_time, self.last_rr = self.elapsed, rr_interval
+
+        if self.since_update >= self.hop_samples and len(self.grid_values) == self.window_samples:
+            self.since_update = 0
+            values = np.fromiter(self.grid_values, dtype=np.float64, count=self.window_samples)
+            self.features = frequency_features(band_powers_fft(values, self.resample_rate))
+            return self.features
+        return None
+
+class PanTompkinsDetector:
+    """
+    Streaming Pan-Tompkins style R-peak detector
+
+    Stages (all causal, state carried between chunks):
+    1. Bandpass 5-15 Hz
+    2. Five-point derivative
+    3. Squaring
+    4. Moving-window integration (150 ms)
+    5. Adaptive signal/noise thresholds (SPKI/NPKI) with refractory
+       period and search-back for missed beats
+
+    Each chunk costs O(len(chunk)). Because every filter carries its exact
+    state and candidates are decided in order, feeding a signal in any
+    chunking gives exactly the same peaks as feeding it at once.
+    """
+
+    def __init__(self, sampling_rate=250, learning_seconds=2.0):
+        self.sampling_rate = sampling_rate
+        self.learning_samples = int(learning_seconds * sampling_rate)
+        self.refractory = int(0.2 * sampling_rate)
+        self.window = max(1, int(0.15 * sampling_rate))
+
+        # R-peak search window before an integrator peak, and input history kept for it
+        self.lookback = self.window + int(0.05 * sampling_rate)
+        self.history = int(4 * sampling_rate)
+
+        self.sos_bandpass = scipy_signal.butter(2, [5, 15], 'bandpass', fs=sampling_rate, output='sos')
+        self.b_derivative = np.array([2, 1, 0, -1, -2]) * sampling_rate / 8.0
+        self.b_integrator = np.ones(self.window) / self.window
+        self.reset()
+
+    def reset(self):
+        """Clear all state before a new recording"""
+        self.zi_bandpass = np.zeros((self.sos_bandpass.shape[0], 2))
+        self.zi_derivative = np.zeros(len(self.b_derivative) - 1)
+        self.zi_integrator = np.zeros(self.window - 1)
+
+        self.samples_seen = 0
+        self.x_history = np.empty(0)
+
+        # Integrator samples whose local-maximum test is still open
+        # (zero padding lets the first samples be tested too)
+        self.mwi_tail = np.zeros(self.refractory)
+
+        # Learning phase
+        self.learned = False
+        self.learning_max = 0.0
+        self.pending = []
+
+        # Adaptive thresholds
+        self.spki = 0.0
+        self.npki = 0.0
+        self.last_qrs = None
+        self.last_r = None
+        self.rr_recent = deque(maxlen=8)
+        self.noise_candidates = []
+
+    @property
+    def threshold1(self):
+        """Primary detection threshold"""
+        return self.npki + 0.25 * (self.spki - self.npki)
+
+    def process(self, chunk):
+        """
+        Feed the next chunk of cleaned ECG
+
+        Args:
+            chunk: ECG samples (numpy array)
+
+        Returns:
+            numpy array: Global sample indices of R-peaks confirmed by this chunk
+        """
+        chunk = np.asarray(chunk, dtype=np.float64)
+        if len(chunk) == 0:
+            return np.array([], dtype=np.int64)
+        start = self.samples_seen
+
+        # 1-4. Vectorized preprocessing with carried state
+        bandpassed, self.zi_bandpass = scipy_signal.sosfilt(self.sos_bandpass, chunk, zi=self.zi_bandpass)
+        derivative, self.zi_derivative = scipy_signal.lfilter(
+            self.b_derivative, 1.0, bandpassed, zi=self.zi_derivative)
+        integrated, self.zi_integrator = scipy_signal.lfilter(
+            self.b_integrator, 1.0, derivative ** 2, zi=self.zi_integrator)
+
+        self.x_history = np.concatenate((self.x_history, chunk))
+        self.samples_seen += len(chunk)
+
+        # Learning phase: peak integrator level over the first seconds
+        if not self.learned:
+            n_learn = min(len(integrated), max(0, self.learning_samples - start))
+            if n_learn > 0:
+                self.learning_max = max(self.learning_max, float(np.max(integrated[:n_learn])))
+
+        # Integrator peaks that are the maximum within +/- the refractory period
+        # (vectorized); the last 2 x refractory samples stay open for the next chunk
+        k = self.refractory
+        ext = np.concatenate((self.mwi_tail, integrated))
+        ext_start = self.samples_seen - len(ext)
+        if len(ext) > 2 * k:
+            local_max = maximum_filter1d(ext, size=2 * k + 1)
+            inner = slice(k, len(ext) - k)
+            is_peak = (ext[inner] == local_max[inner]) & (ext[inner] > ext[k - 1:len(ext) - k - 1])
+            positions = np.flatnonzero(is_peak) + k
+            self.pending.extend(zip((positions + ext_start).tolist(), ext[positions].tolist()))
+            self.mwi_tail = ext[-2 * k:]
+        else:
+            self.mwi_tail = ext
+
+        if not self.learned and self.samples_seen >= self.learning_samples:
+            self._finish_learning()
+
+        peaks = []
+        if self.learned:
+            peaks = self._decide_pending()
+
+        # Keep only the input history needed for R-peak search and search-back
+        if len(self.x_history) > self.history:
+            self.x_history = self.x_history[-self.history:]
+
+        return np.array(peaks, dtype=np.int64)
+
+    def flush(self):
+        """
+        Decide any remaining candidates at the end of a recording
+
+        Returns:
+            numpy array: Global sample indices of the remaining R-peaks
+        """
+        if not self.learned:
+            self._finish_learning()
+        return np.array(self._decide_pending(), dtype=np.int64)
+
+    def _finish_learning(self):
+        """Initialize thresholds from the learning phase"""
+        self.spki = 0.25 * self.learning_max
+        self.npki = 0.125 * self.learning_max
+        self.learned = True
+
+    def _locate_r(self, candidate):
+        """R-peak position: largest input sample in the window before an integrator peak"""
+        history_start = self.samples_seen - len(self.x_history)
+        lo = max(candidate - self.lookback, history_start, 0)
+        hi = candidate + 1
+        if hi <= lo:
+            return None
+        return lo + int(np.argmax(self.x_history[lo - history_start:hi - history_start]))
+
+    def _accept(self, candidate, value, search_back=False):
+        """Register a QRS detection and return its R-peak position (or None)"""
+        weight = 0.25 if search_back else 0.125
+        self.spki = weight * value + (1 - weight) * self.spki
+        if self.last_qrs is not None:
+            self.rr_recent.append(candidate - self.last_qrs)
+        self.last_qrs = candidate
+        self.noise_candidates = []
+
+        r_peak = self._locate_r(candidate)
+        if r_peak is None or (self.last_r is not None and r_peak - self.last_r < self.refractory):
+            return None
+        self.last_r = r_peak
+        return r_peak
+
+    def _decide_pending(self):
+        """Classify queued integrator peaks in order"""
+        peaks = []
+
+        for candidate, value in self.pending:
+            # Search-back: no beat for 1.66 x the recent RR, take the best noise peak
+            if self.last_qrs is not None and self.rr_recent and self.noise_candidates:
+                rr_average = sum(self.rr_recent) / len(self.rr_recent)
+                if candidate - self.last_qrs > 1.66 * rr_average:
+                    threshold2 = 0.5 * self.threshold1
+                    best = max(self.noise_candidates, key=lambda c: c[1])
+                    if best[1] > threshold2:
+                        r_peak = self._accept(*best, search_back=True)
+                        if r_peak is not None:
+                            peaks.append(r_peak)
+
+            if self.last_qrs is not None and candidate - self.last_qrs < self.refractory:
+                continue
+
+            if value > self.threshold1:
+                r_peak = self._accept(candidate, value)
+                if r_peak is not None:
+                    peaks.append(r_peak)
+            else:
+                self.npki = 0.125 * value + 0.875 * self.npki
+                # Search-back only looks inside the kept input history
+                self.noise_candidates.append((candidate, value))
+                horizon = candidate - (self.history - self.lookback)
+                self.noise_candidates = [c for c in self.noise_candidates if c[0] >= horizon]
+
+        self.pending = []
+        return peaks
+
+class HRVAccumulator:
+    """
+    Sliding-window HRV accumulator
+
+    Serves mean HR, SDNN (ddof=1) and RMSSD in O(1) per beat:
+    - mean and M2 of the RR values use Welford add/remove updates
+    - RMSSD keeps the sum of squared successive differences, adding the
+      new difference on push and removing the oldest one on pop
+
+    The running sums are recomputed from the window every
+    `resync_every` removals, which bounds floating-point drift over long
+    drives at amortized O(1) cost.
+    """
+
+    def __init__(self, max_beats=None, max_duration_ms=None, resync_every=10000):
+        """
+        Args:
+            max_beats: Keep at most this many RR intervals (None for no limit)
+            max_duration_ms: Keep at most this much RR time, e.g. 300000 for 5 minutes
+            resync_every: Removals between exact recomputations of the sums
+        """
+        self.max_beats = max_beats
+        self.max_duration_ms = max_duration_ms
+        self.resync_every = resync_every
+        self.reset()
+
+    def reset(self):
+        """Empty the window"""
+        self.rr = deque()
+        self.mean = 0.0
+        self.m2 = 0.0
+        self.total_ms = 0.0
+        self.diff_sq_sum = 0.0
+        self.removals = 0
+
+    def __len__(self):
+        return len(self.rr)
+
+    def push(self, rr_interval):
+        """
+        Add the newest RR interval (ms), evicting old ones past the window limits
+
+        Returns:
+            int: Number of intervals evicted
+        """
+        rr_interval = float(rr_interval)
+        if self.rr:
+            self.diff_sq_sum += (rr_interval - self.rr[-1]) ** 2
+        self.rr.append(rr_interval)
+        self.total_ms += rr_interval
+
+        n = len(self.rr)
+        delta = rr_interval - self.mean
+        self.mean += delta / n
+        self.m2 += delta * (rr_interval - self.mean)
+
+        evicted = 0
+        while (self.max_beats is not None and len(self.rr) > self.max_beats) or \
+                (self.max_duration_ms is not None and self.total_ms > self.max_duration_ms and len(self.rr) > 1):
+            self.pop()
+            evicted += 1
+        return evicted
+
+    def extend(self, rr_intervals):
+        """Push several RR intervals in order"""
+        for rr_interval in rr_intervals:
+            self.push(rr_interval)
+
+    def pop(self):
+        """
+        Remove the oldest RR interval
+
+        Returns:
+            float: The removed RR interval (ms)
+        """
+        rr_interval = self.rr.popleft()
+        self.total_ms -= rr_interval
+        if self.rr:
+            self.diff_sq_sum -= (self.rr[0] - rr_interval) ** 2
+
+        n = len(self.rr)
+        if n == 0:
+            self.mean = 0.0
+            self.m2 = 0.0
+            self.total_ms = 0.0
+            self.diff_sq_sum = 0.0
+        else:
+            delta = rr_interval - self.mean
+            self.mean -= delta / n
+            self.m2 -= delta * (rr_interval - self.mean)
+
+        self.removals += 1
+        if self.removals % self.resync_every == 0:
+            self._resync()
+        return rr_interval
+
+    def _resync(self):
+        """Recompute all running sums exactly from the window"""
+        values = np.fromiter(self.rr, dtype=np.float64, count=len(self.rr))
+        if len(values) == 0:
+            return
+        self.mean = float(np.mean(values))
+        self.m2 = float(np.sum((values - self.mean) ** 2))
+        self.total_ms = float(np.sum(values))
+        self.diff_sq_sum = float(np.sum(np.diff(values) ** 2))
+
+    @property
+    def heart_rate(self):
+        """Mean heart rate (bpm), as FeatureExtractionAgent._calculate_hr"""
+        return 60000 / self.mean if self.rr else 0
+
+    @property
+    def sdnn(self):
+        """SDNN (ms, ddof=1), as FeatureExtractionAgent._calculate_sdnn"""
+        if not self.rr:
+            return 0
+        if len(self.rr) < 2:
+            return float('nan')
+        return float(np.sqrt(max(self.m2, 0.0) / (len(self.rr) - 1)))
+
+    @property
+    def rmssd(self):
+        """RMSSD (ms), as FeatureExtractionAgent._calculate_rmssd"""
+        if len(self.rr) < 2:
+            return 0
+        return float(np.sqrt(max(self.diff_sq_sum, 0.0) / (len(self.rr) - 1)))
+
+    def get_features(self):
+        """Current window HR/HRV using the same keys and rounding as extract_features"""
+        return {
+            "heart_rate": round(self.heart_rate, 2),
+            "hrv_sdnn": round(self.sdnn, 2),
+            "hrv_rmssd": round(self.rmssd, 2),
+            "num_beats": len(self.rr) + 1 if self.rr else 0,
+            "mean_rr": round(self.mean, 2)
+        }
+
+class FeatureResult(MutableMapping):
+    """
+    Compact feature result from Agent 2
+
+    Scalars live in slots, and the RR intervals (float32) and per-beat RR
+    flags (int8) stay numpy arrays (no Python list is built). It behaves like the features dict callers
+    already use (features['heart_rate'], .get, .items, ...); optional
+    features such as LF/HF are kept in a small extras dict. Use
+    to_dict() / to_json() when a plain serializable copy is needed.
+    """
+
+    __slots__ = ("heart_rate", "hrv_sdnn", "hrv_rmssd", "rr_intervals", "rr_flags", "num_beats",
+                 "mean_rr", "min_hr", "max_hr", "extras")
+
+    CORE_KEYS = ("heart_rate", "hrv_sdnn", "hrv_rmssd", "rr_intervals", "rr_flags", "num_beats",
+                 "mean_rr", "min_hr", "max_hr")
+
+    # Per-beat arrays, left out of repr and optionally out of JSON
+    SERIES_KEYS = ("rr_intervals", "rr_flags")
+
+    def __init__(self, heart_rate=0, hrv_sdnn=0, hrv_rmssd=0, rr_intervals=None, num_beats=0,
+                 mean_rr=0, min_hr=0, max_hr=0, rr_flags=None, **extras):
+        self.heart_rate = heart_rate
+        self.hrv_sdnn = hrv_sdnn
+        self.hrv_rmssd = hrv_rmssd
+        self.rr_intervals = np.asarray(rr_intervals if rr_intervals is not None else [], dtype=np.float32)
+        self.rr_flags = np.asarray(rr_flags if rr_flags is not None else [], dtype=np.int8)
+        self.num_beats = num_beats
+        self.mean_rr = mean_rr
+        self.min_hr = min_hr
+        self.max_hr = max_hr
+        self.extras = extras
+
+    def __getitem__(self, key):
+        if key in self.CORE_KEYS:
+            return getattr(self, key)
+        return self.extras[key]
+
+    def __setitem__(self, key, value):
+        if key == "rr_intervals":
+            value = np.asarray(value, dtype=np.float32)
+        elif key == "rr_flags":
+            value = np.asarray(value, dtype=np.int8)
+        if key in self.CORE_KEYS:
+            setattr(self, key, value)
+        else:
+            self.extras[key] = value
+
+    def __delitem__(self, key):
+        if key in self.CORE_KEYS:
+            raise KeyError(f"Cannot delete core feature: {key}")
+        del self.extras[key]
+
+    def __iter__(self):
+        yield from self.CORE_KEYS
+        yield from self.extras
+
+    def __len__(self):
+        return len(self.CORE_KEYS) + len(self.extras)
+
+    def __repr__(self):
+        scalars = ", ".join(f"{key}={self[key]}" for key in self if key not in self.SERIES_KEYS)
+        return f"FeatureResult({scalars}, rr_intervals=<{len(self.rr_intervals)} float32>)"
+
+    @staticmethod
+    def _plain(value):
+        """Convert numpy values to JSON-serializable Python values"""
+        if isinstance(value, np.ndarray):
+            return value.tolist()
+        if isinstance(value, np.generic):
+            return value.item()
+        return value
+
+    def to_dict(self):
+        """Plain dict copy (RR intervals as a list), built on demand"""
+        return {key: self._plain(self[key]) for key in self}
+
+    def to_json(self, include_rr=True):
+        """
+        JSON string of the features
+
+        Args:
+            include_rr: Include the RR interval and flag lists (can be long)
+        """
+        data = {key: self._plain(self[key]) for key in self
+                if include_rr or key not in self.SERIES_KEYS}
+        return json.dumps(data)
 
 class FeatureExtractionAgent:
     """Agent 2: Responsible for calculating physiological features"""
 
-    def __init__(self):
+    def __init__(self, peak_method="find_peaks", frequency_method=None, nonlinear=False):
+        """
+        Args:
+            peak_method: R-peak detector, "find_peaks" (global threshold)
+                         or "pan_tompkins" (adaptive, streaming-capable)
+            frequency_method: Also compute VLF/LF/HF power and LF/HF ratio,
+                              "fft" (resampled RR) or "lomb" (Lomb-Scargle); None to skip
+            nonlinear: Also compute Poincare SD1/SD2, sample/approximate
+                       entropy and DFA alpha1
+        """
+        if peak_method not in ("find_peaks", "pan_tompkins"):
+            raise ValueError(f"Unknown peak_method: {peak_method}")
+        if frequency_method not in (None, "fft", "lomb"):
+            raise ValueError(f"Unknown frequency_method: {frequency_method}")
+
         self.name = "Feature Extraction Agent"
         self.status = "Standby"
         self.extraction_log = []
+        self.peak_method = peak_method
+        self.frequency_method = frequency_method
+        self.nonlinear = nonlinear
+
+        # Streaming state (see process_chunk)
+        self.stream_detector = None
 
     def extract_features(self, cleaned_signal, sampling_rate=250):
         """
@@ -29,7 +935,7 @@ class FeatureExtractionAgent:
             sampling_rate: Sampling rate (Hz)
 
         Returns:
-            features: dict containing HR, HRV metrics
+            features: FeatureResult (dict-like) containing HR, HRV metrics
         """
         self.status = "Analyzing..."
         self.extraction_log = []
@@ -39,49 +945,428 @@ class FeatureExtractionAgent:
             r_peaks = self._detect_r_peaks(cleaned_signal, sampling_rate)
             self.extraction_log.append(f"[OK] Detected {len(r_peaks)} R-peaks")
 
-            if len(r_peaks) < 5:
-                self.status = "Warning: Too few R-peaks"
-                self.extraction_log.append("[FAIL] Insufficient R-peaks for HRV calculation")
-                return self._get_default_features()
+            return self._features_from_peaks(r_peaks, sampling_rate)
+
+        except Exception as e:
+            self.status = f"Error: {str(e)}"
+            self.extraction_log.append(f"[FAIL] Feature extraction failed: {str(e)}")
+            return self._get_default_features()
+
+    def extract_features_long(self, cleaned_signal, sampling_rate=250, window_seconds=60):
+        """
+        Extract features from a long recording window by window
+
+        Works on memory-mapped signals (e.g. from SignalFilterAgent.filter_to_file):
+        only one window plus a small overlap is read at a time, so peak
+        memory stays bounded whatever the recording length. Each window
+        yields its peak candidates above the threshold; the minimum peak
+        distance is then applied to all candidates together with
+        select_peaks_by_distance, so the R-peaks are the same as from one
+        find_peaks call over the whole signal.
+
+        Args:
+            cleaned_signal: Cleaned ECG signal (numpy array or memmap)
+            sampling_rate: Sampling rate (Hz)
+            window_seconds: Window length (seconds)
+
+        Returns:
+            features: FeatureResult (dict-like) containing HR, HRV metrics
+        """
+        self.status = "Analyzing..."
+        self.extraction_log = []
+
+        try:
+            n_samples = len(cleaned_signal)
+            window_size = int(window_seconds * sampling_rate)
+            min_distance = int(sampling_rate * 60 / 180)
+
+            if self.peak_method == "pan_tompkins":
+                # The streaming detector carries its own state across windows
+                detector = PanTompkinsDetector(sampling_rate)
+                peak_blocks = [detector.process(cleaned_signal[start:start + window_size])
+                               for start in range(0, n_samples, window_size)]
+                peak_blocks.append(detector.flush())
+                r_peaks = np.concatenate(peak_blocks)
+                self.extraction_log.append(
+                    f"[OK] Detected {len(r_peaks)} R-peaks (Pan-Tompkins) in windows of {window_seconds} s")
+                return self._features_from_peaks(r_peaks, sampling_rate)
+
+            # Global threshold from a blockwise pass (same rule as _detect_r_peaks)
+            total = total_sq = 0.0
+            for start in range(0, n_samples, window_size):
+                block = np.asarray(cleaned_signal[start:start + window_size], dtype=np.float64)
+                total += np.sum(block)
+                total_sq += np.dot(block, block)
+            mean = total / n_samples
+            threshold = np.sqrt(max(total_sq / n_samples - mean ** 2, 0.0)) * 0.5
+
+            # 1. Peak candidates window by window (padded so local maxima
+            #    and plateaus at the seams are judged on both sides)
+            peak_blocks, height_blocks = [], []
+            for start in range(0, n_samples, window_size):
+                stop = min(start + window_size, n_samples)
+                lo = max(0, start - min_distance)
+                hi = min(n_samples, stop + min_distance)
+                segment = np.asarray(cleaned_signal[lo:hi])
+                peaks, properties = scipy_signal.find_peaks(segment, height=threshold)
+                peaks += lo
+                in_window = (peaks >= start) & (peaks < stop)
+                peak_blocks.append(peaks[in_window])
+                height_blocks.append(properties["peak_heights"][in_window])
+
+            # 2. Minimum distance over all candidates at once
+            if peak_blocks:
+                r_peaks = select_peaks_by_distance(np.concatenate(peak_blocks), np.concatenate(height_blocks),
+                                                   min_distance)
+            else:
+                r_peaks = np.array([], dtype=int)
+            self.extraction_log.append(
+                f"[OK] Detected {len(r_peaks)} R-peaks in {len(peak_blocks)} windows of {window_seconds} s")
+
+            return self._features_from_peaks(r_peaks, sampling_rate)
+
+        except Exception as e:
+            self.status = f"Error: {str(e)}"
+            self.extraction_log.append(f"[FAIL] Feature extraction failed: {str(e)}")
+            return self._get_default_features()
+
+    def extract_features_windowed(self, cleaned_signal, sampling_rate=250, window_s=60, hop_s=10):
+        """
+        Extract a feature time series over sliding windows
+
+        R-peaks are detected once for the whole signal. Each RR interval is
+        placed at the time of the beat that ends it, and every window's
+        statistics come from cumulative sums over the beat series, so the
+        cost is O(beats + windows) however much the windows overlap. RR
+        intervals are corrected with correct_rr_intervals over the whole
+        series first; any left outside 300-2000 ms are masked out.
+        Windows with fewer than 5 valid RR intervals get zeros, like
+        _get_default_features.
+
+        Args:
+            cleaned_signal: Cleaned ECG signal
+            sampling_rate: Sampling rate (Hz)
+            window_s: Window length (seconds)
+            hop_s: Step between window starts (seconds)
+
+        Returns:
+            dict: Columns of equal-length numpy arrays (window_start_s,
+                  window_end_s, heart_rate, hrv_sdnn, hrv_rmssd, num_beats,
+                  mean_rr, min_hr, max_hr); pass to pandas.DataFrame for charts
+        """
+        self.status = "Analyzing..."
+        self.extraction_log = []
+
+        duration = len(cleaned_signal) / sampling_rate
+        n_windows = max(0, int(np.floor((duration - window_s) / hop_s)) + 1)
+        starts = np.arange(n_windows) * hop_s
+        table = {
+            "window_start_s": starts.astype(np.float64),
+            "window_end_s": starts + float(window_s)
+        }
+        for column in ("heart_rate", "hrv_sdnn", "hrv_rmssd", "mean_rr", "min_hr", "max_hr"):
+            table[column] = np.zeros(n_windows)
+        table["num_beats"] = np.zeros(n_windows, dtype=np.int64)
+
+        r_peaks = self._detect_r_peaks(cleaned_signal, sampling_rate)
+        self.extraction_log.append(f"[OK] Detected {len(r_peaks)} R-peaks")
+        if len(r_peaks) < 2 or n_windows == 0:
+            self.status = "Warning: Too few R-peaks"
+            return table
+
+        beat_times = r_peaks[1:] / sampling_rate
+        rr, _ = correct_rr_intervals(np.diff(r_peaks) / sampling_rate * 1000)
+        valid = (rr >= 300) & (rr <= 2000)
+
+        # Centered values keep the cumulative sums well conditioned
+        offset = np.mean(rr[valid]) if np.any(valid) else 0.0
+        centered = np.where(valid, rr - offset, 0.0)
+        diffs = np.diff(rr)
+        diff_valid = valid[1:] & valid[:-1]
+        diff_sq = np.where(diff_valid, diffs ** 2, 0.0)
+
+        def cumulative(values):
+            return np.concatenate(([0], np.cumsum(values)))
+
+        c_count = cumulative(valid.astype(np.int64))
+        c_sum = cumulative(centered)
+        c_sq = cumulative(centered ** 2)
+        c_diff_count = cumulative(diff_valid.astype(np.int64))
+        c_diff_sq = cumulative(diff_sq)
+
+        # Beat index range [lo, hi) of every window
+        lo = np.searchsorted(beat_times, table["window_start_s"], side="left")
+        hi = np.searchsorted(beat_times, table["window_end_s"], side="left")
+
+        n = c_count[hi] - c_count[lo]
+        mean_centered = (c_sum[hi] - c_sum[lo]) / np.maximum(n, 1)
+        m2 = (c_sq[hi] - c_sq[lo]) - n * mean_centered ** 2
+        # Successive differences fully inside the window
+        d_lo = np.minimum(lo, len(diff_sq))
+        d_hi = np.maximum(d_lo, hi - 1)
+        n_diff = c_diff_count[d_hi] - c_diff_count[d_lo]
+        diff_sum = c_diff_sq[d_hi] - c_diff_sq[d_lo]
+
+        # Min/max RR per window (invalid beats as NaN, ignored by fmin/fmax;
+        # a trailing NaN keeps hi == len(rr) a valid reduceat index)
+        rr_masked = np.append(np.where(valid, rr, np.nan), np.nan)
+        ok = n >= 5
+        bounds = np.column_stack((lo, hi)).ravel()[np.repeat(ok, 2)]
+        if len(bounds):
+            min_rr = np.fmin.reduceat(rr_masked, bounds)[::2]
+            max_rr = np.fmax.reduceat(rr_masked, bounds)[::2]
+        else:
+            min_rr = max_rr = np.empty(0)
+
+        mean_rr = offset + mean_centered[ok]
+        table["heart_rate"][ok] = np.round(60000 / mean_rr, 2)
+        table["hrv_sdnn"][ok] = np.round(np.sqrt(np.maximum(m2[ok], 0) / (n[ok] - 1)), 2)
+        table["hrv_rmssd"][ok] = np.round(np.sqrt(diff_sum[ok] / np.maximum(n_diff[ok], 1)), 2)
+        table["mean_rr"][ok] = np.round(mean_rr, 2)
+        table["min_hr"][ok] = np.round(60000 / max_rr, 2)
+        table["max_hr"][ok] = np.round(60000 / min_rr, 2)
+        table["num_beats"][ok] = n[ok] + 1
+
+        self.extraction_log.append(f"[OK] {int(np.count_nonzero(ok))}/{n_windows} windows with valid features")
+        self.status = "Done"
+
+        return table
+
+    def extract_features_batch(self, recordings=None, sampling_rate=250, buffer=None, offsets=None):
+        """
+        Extract features from many recordings of different lengths
+
+        R-peaks are detected and RR intervals corrected per recording. The
+        NN intervals are then concatenated and the statistics run as
+        segment reductions (np.add.reduceat etc.) over the whole batch.
+        Results match extract_features recording by recording.
+
+        Args:
+            recordings: List of 1-D cleaned ECG arrays, or None when using buffer/offsets
+            sampling_rate: Sampling rate (Hz)
+            buffer: Concatenated cleaned ECG of all recordings
+            offsets: Start index of each recording in buffer (optionally
+                     followed by the end of the last recording)
+
+        Returns:
+            numpy structured array: One row per recording (BATCH_FEATURE_DTYPE);
+                                    recordings without enough beats get zeros
+        """
+        self.status = "Analyzing..."
+        self.extraction_log = []
+
+        if recordings is None:
+            bounds = list(offsets)
+            if len(bounds) == 0 or bounds[-1] != len(buffer):
+                bounds.append(len(buffer))
+            recordings = [buffer[start:stop] for start, stop in zip(bounds[:-1], bounds[1:])]
+
+        n_recordings = len(recordings)
+        result = np.zeros(n_recordings, dtype=BATCH_FEATURE_DTYPE)
+
+        # 1. Detect R-peaks per recording
+        peaks = [self._detect_r_peaks(np.asarray(rec), sampling_rate) for rec in recordings]
+        n_peaks = np.array([len(p) for p in peaks], dtype=np.int64)
+        enough_peaks = n_peaks >= 5
+
+        # 2. Corrected NN intervals of all usable recordings in one buffer
+        # (the correction is O(n) per recording and must not see across recordings)
+        segment_ids = np.flatnonzero(enough_peaks)
+        if len(segment_ids) == 0:
+            self.status = "Warning: Too few R-peaks"
+            return result
+        corrected = [correct_rr_intervals(np.diff(peaks[i]) / sampling_rate * 1000) for i in segment_ids]
+        nn = np.concatenate([values for values, _ in corrected])
+        flags = np.concatenate([rr_flags for _, rr_flags in corrected])
+        rr_counts = n_peaks[segment_ids] - 1
+        starts = np.concatenate(([0], np.cumsum(rr_counts)[:-1]))
+        segment = np.repeat(np.arange(len(segment_ids)), rr_counts)
+
+        n_normal = np.add.reduceat((flags == RR_NORMAL).astype(np.int64), starts)
+        ok = n_normal >= 5
+
+        # 3. Statistics as segment reductions over the NN buffer
+        if np.any(ok):
+            mean = np.add.reduceat(nn, starts) / rr_counts
+            m2 = np.add.reduceat((nn - mean[segment]) ** 2, starts)
+            rr_min = np.minimum.reduceat(nn, starts)
+            rr_max = np.maximum.reduceat(nn, starts)
+
+            # Successive differences, dropping those that cross a recording boundary
+            diffs_sq = np.diff(nn) ** 2
+            same = segment[1:] == segment[:-1]
+            diff_sum = np.bincount(segment[1:][same], weights=diffs_sq[same], minlength=len(segment_ids))
+
+            rows = segment_ids[ok]
+            n = rr_counts[ok]
+            result["heart_rate"][rows] = np.round(60000 / mean[ok], 2)
+            result["hrv_sdnn"][rows] = np.round(np.sqrt(m2[ok] / (n - 1)), 2)
+            result["hrv_rmssd"][rows] = np.round(np.sqrt(diff_sum[ok] / (n - 1)), 2)
+            result["num_beats"][rows] = n_peaks[rows]
+            result["mean_rr"][rows] = np.round(mean[ok], 2)
+            result["min_hr"][rows] = np.round(60000 / rr_max[ok], 2)
+            result["max_hr"][rows] = np.round(60000 / rr_min[ok], 2)
+            result["num_valid_rr"][rows] = n_normal[ok]
+            result["num_corrected_rr"][rows] = n - n_normal[ok]
+
+        self.extraction_log.append(
+            f"[OK] {int(np.count_nonzero(ok))}/{n_recordings} recordings with valid features")
+        self.status = "Done"
+
+        return result
+
+    def extract_features_multilead(self, cleaned_leads, sampling_rate=250):
+        """
+        Extract features from a multi-lead ECG
 
-            # 2. Calculate RR intervals (milliseconds)
-            rr_intervals = np.diff(r_peaks) / sampling_rate * 1000
-            self.extraction_log.append(f"[OK] Calculated {len(rr_intervals)} RR intervals")
+        Lead quality (lead_quality) is computed for all leads at once.
+        R-peaks are detected only on leads with a non-zero SQI, since the
+        others carry no vote, and merged by SQI-weighted voting
+        (fuse_r_peaks), so a noisy or detached lead cannot add or hide
+        beats. The fused beats then go through the usual feature path
+        once, instead of once per lead.
 
-            # 3. Filter abnormal RR intervals (possible artifacts)
-            rr_intervals = self._filter_rr_intervals(rr_intervals)
-            self.extraction_log.append(f"[OK] {len(rr_intervals)} valid RR intervals after filtering")
+        Args:
+            cleaned_leads: Cleaned ECG, shape (leads, samples), e.g. from
+                           SignalFilterAgent.filter_ecg on a 2-D array
+            sampling_rate: Sampling rate (Hz)
 
-            if len(rr_intervals) < 5:
-                self.status = "Warning: Too few valid RR intervals"
-                return self._get_default_features()
+        Returns:
+            features: FeatureResult (dict-like) with HR, HRV metrics,
+                      plus num_leads and lead_sqi
+        """
+        self.status = "Analyzing..."
+        self.extraction_log = []
 
-            # 4. Calculate features
-            features = {
-                "heart_rate": self._calculate_hr(rr_intervals),
-                "hrv_sdnn": self._calculate_sdnn(rr_intervals),
-                "hrv_rmssd": self._calculate_rmssd(rr_intervals),
-                "rr_intervals": rr_intervals.tolist(),
-                "num_beats": len(r_peaks),
-                "mean_rr": round(np.mean(rr_intervals), 2),
-                "min_hr": round(60000 / np.max(rr_intervals), 2),
-                "max_hr": round(60000 / np.min(rr_intervals), 2)
-            }
+        try:
+            cleaned_leads = np.atleast_2d(np.asarray(cleaned_leads, dtype=np.float64))
 
-            self.extraction_log.append("[OK] All features calculated")
-            self.status = "Done"
+            # 1. Detect R-peaks on every lead and fuse them
+            sqi = lead_quality(cleaned_leads)
+            voting = np.flatnonzero(sqi > 0) if np.any(sqi > 0) else np.arange(len(sqi))
+            lead_peaks = [self._detect_r_peaks(cleaned_leads[lead], sampling_rate) for lead in voting]
+            r_peaks = fuse_r_peaks(lead_peaks, sqi[voting], sampling_rate)
+            for lead, peaks in zip(voting, lead_peaks):
+                self.extraction_log.append(f"[OK] Lead {lead}: {len(peaks)} R-peaks, SQI {sqi[lead]:.2f}")
+            self.extraction_log.append(
+                f"[OK] Fused {len(r_peaks)} R-peaks from {len(voting)}/{len(sqi)} leads")
 
-            return features
+            features = self._features_from_peaks(r_peaks, sampling_rate)
 
         except Exception as e:
             self.status = f"Error: {str(e)}"
             self.extraction_log.append(f"[FAIL] Feature extraction failed: {str(e)}")
+            features = self._get_default_features()
+            sqi = np.zeros(len(cleaned_leads))
+
+        features["num_leads"] = len(sqi)
+        features["lead_sqi"] = [round(float(q), 2) for q in sqi]
+        return features
+
+    def _features_from_peaks(self, r_peaks, sampling_rate):
+        """
+        Calculate features from detected R-peak positions
+
+        Args:
+            r_peaks: R-peak position indices
+            sampling_rate: Sampling rate (Hz)
+
+        Returns:
+            features: FeatureResult (dict-like) containing HR, HRV metrics
+        """
+        if len(r_peaks) < 5:
+            self.status = "Warning: Too few R-peaks"
+            self.extraction_log.append("[FAIL] Insufficient R-peaks for HRV calculation")
             return self._get_default_features()
 
+        # 2. Calculate RR intervals (milliseconds)
+        rr_intervals = np.diff(r_peaks) / sampling_rate * 1000
+        self.extraction_log.append(f"[OK] Calculated {len(rr_intervals)} RR intervals")
+
+        # 3. Correct ectopic/missed/extra beats and artifacts
+        rr_intervals, rr_flags = correct_rr_intervals(rr_intervals)
+        n_normal = int(np.count_nonzero(rr_flags == RR_NORMAL))
+        self.extraction_log.append(
+            f"[OK] {len(rr_flags) - n_normal} RR intervals corrected, {n_normal} normal")
+
+        if n_normal < 5:
+            self.status = "Warning: Too few valid RR intervals"
+            return self._get_default_features()
+
+        # 4. Calculate features
+        features = FeatureResult(
+            heart_rate=self._calculate_hr(rr_intervals),
+            hrv_sdnn=self._calculate_sdnn(rr_intervals),
+            hrv_rmssd=self._calculate_rmssd(rr_intervals),
+            rr_intervals=rr_intervals,
+            rr_flags=rr_flags,
+            num_beats=len(r_peaks),
+            mean_rr=round(np.mean(rr_intervals), 2),
+            min_hr=round(60000 / np.max(rr_intervals), 2),
+            max_hr=round(60000 / np.min(rr_intervals), 2)
+        )
+
+        # 5. Frequency-domain HRV (optional)
+        if self.frequency_method is not None:
+            features.update(self.calculate_frequency_features(rr_intervals))
+            self.extraction_log.append(f"[OK] LF/HF calculated ({self.frequency_method})")
+
+        # 6. Nonlinear HRV (optional)
+        if self.nonlinear:
+            features.update(self.calculate_nonlinear_features(rr_intervals))
+            self.extraction_log.append("[OK] Nonlinear HRV calculated")
+
+        self.extraction_log.append("[OK] All features calculated")
+        self.status = "Done"
+
+        return features
+
+    def reset_stream(self, sampling_rate=250):
+        """
+        Reset streaming R-peak detection before a new live session
+
+        Args:
+            sampling_rate: Sampling rate of the incoming stream (Hz)
+        """
+        self.stream_detector = PanTompkinsDetector(sampling_rate)
+
+    def process_chunk(self, chunk, sampling_rate=250):
+        """
+        Detect R-peaks in the next chunk of a live cleaned ECG stream
+
+        Uses the Pan-Tompkins detector with carried state, so each update
+        costs O(len(chunk)). Peaks are returned with a short delay (up to
+        the refractory period) and match the batch detector exactly.
+
+        Args:
+            chunk: New cleaned ECG samples
+            sampling_rate: Sampling rate (Hz), resets the stream if it changes
+
+        Returns:
+            numpy array: Global sample indices of newly confirmed R-peaks
+        """
+        if self.stream_detector is None or self.stream_detector.sampling_rate != sampling_rate:
+            self.reset_stream(sampling_rate)
+        return self.stream_detector.process(chunk)
+
+    def flush_stream(self):
+        """
+        Confirm the R-peaks still pending at the end of a live session
+
+        Returns:
+            numpy array: Global sample indices of the remaining R-peaks
+        """
+        if self.stream_detector is None:
+            return np.array([], dtype=np.int64)
+        return self.stream_detector.flush()
+
     def _detect_r_peaks(self, signal_data, sampling_rate):
         """
         Detect R-peaks using simple peak detection
 
+        With peak_method="pan_tompkins" the adaptive-threshold detector
+        is run over the whole signal in one chunk instead.
+
         Args:
             signal_data: ECG signal
             sampling_rate: Sampling rate
@@ -89,6 +1374,10 @@ class FeatureExtractionAgent:
         Returns:
             r_peaks: R-peak position indices (numpy array)
         """
+        if self.peak_method == "pan_tompkins":
+            detector = PanTompkinsDetector(sampling_rate)
+            return np.concatenate((detector.process(signal_data), detector.flush()))
+
         # Set minimum distance (assuming HR won't exceed 180 bpm)
         min_distance = int(sampling_rate * 60 / 180)  # ~0.33 seconds
 
@@ -104,32 +1393,6 @@ class FeatureExtractionAgent:
 
         return peaks
 
-    def _filter_rr_intervals(self, rr_intervals, lower_limit=300, upper_limit=2000):
-        """
-        Filter abnormal RR intervals
-
-        Args:
-            rr_intervals: RR interval array
-            lower_limit: Lower limit (ms), corresponds to ~200 bpm
-            upper_limit: Upper limit (ms), corresponds to ~30 bpm
-
-        Returns:
-            filtered_rr: Filtered RR intervals
-        """
-        # Remove values outside physiological range
-        mask = (rr_intervals >= lower_limit) & (rr_intervals <= upper_limit)
-        filtered_rr = rr_intervals[mask]
-
-        # If too many filtered out, relax constraints
-        if len(filtered_rr) < len(rr_intervals) * 0.5:
-            # Use looser range
-            mean_rr = np.mean(rr_intervals)
-            std_rr = np.std(rr_intervals)
-            mask = np.abs(rr_intervals - mean_rr) < 3 * std_rr
-            filtered_rr = rr_intervals[mask]
-
-        return filtered_rr
-
     def _calculate_hr(self, rr_intervals):
         """Calculate average heart rate (bpm)"""
         if len(rr_intervals) == 0:
@@ -158,18 +1421,48 @@ class FeatureExtractionAgent:
         rmssd = np.sqrt(np.mean(diff_rr ** 2))
         return round(rmssd, 2)
 
+    def calculate_frequency_features(self, rr_intervals, method=None):
+        """
+        Calculate frequency-domain HRV (VLF/LF/HF power, LF/HF ratio)
+
+        Args:
+            rr_intervals: RR intervals (ms)
+            method: "fft" or "lomb" (default: the agent's frequency_method, else "fft")
+
+        Returns:
+            dict: vlf_power, lf_power, hf_power (ms^2) and lf_hf_ratio
+        """
+        method = method or self.frequency_method or "fft"
+        rr_intervals = np.asarray(rr_intervals, dtype=np.float64)
+
+        if method == "lomb":
+            powers = band_powers_lomb(rr_intervals)
+        else:
+            powers = band_powers_fft(resample_rr(rr_intervals))
+        return frequency_features(powers)
+
+    def calculate_nonlinear_features(self, rr_intervals):
+        """
+        Calculate nonlinear HRV (Poincare SD1/SD2, SampEn, ApEn, DFA alpha1)
+
+        Args:
+            rr_intervals: RR intervals (ms)
+
+        Returns:
+            dict: sd1, sd2 (ms), sd1_sd2_ratio, sample_entropy,
+                  approximate_entropy and dfa_alpha1
+        """
+        return nonlinear_features(np.asarray(rr_intervals, dtype=np.float64))
+
     def _get_default_features(self):
         """Return default features (when extraction fails)"""
-        return {
-            "heart_rate": 0,
-            "hrv_sdnn": 0,
-            "hrv_rmssd": 0,
-            "rr_intervals": [],
-            "num_beats": 0,
-            "mean_rr": 0,
-            "min_hr": 0,
-            "max_hr": 0
-        }
+        features = FeatureResult()
+        if self.frequency_method is not None:
+            features.update({"vlf_power": 0, "lf_power": 0, "hf_power": 0, "lf_hf_ratio": 0})
+        if self.nonlinear:
+            features.update({"sd1": 0, "sd2": 0, "sd1_sd2_ratio": 0, "sample_entropy": 0,
+                             "approximate_entropy": 0, "dfa_alpha1": 0})
+        return features
 
     def get_log(self):
         """Get extraction log"""
@@ -258,7 +1551,7 @@ if __name__ == "__main__":
 
     print("\nExtracted features:")
     for key, value in features.items():
-        if key != "rr_intervals":  # Don't display full RR interval list
+        if key not in FeatureResult.SERIES_KEYS:  # Don't display full per-beat arrays
             print(f"  {key}: {value}")
 
     print("\nFeature interpretation:")
@@ -266,6 +1559,186 @@ if __name__ == "__main__":
     for interp in interpretations:
         print(f"  {interp}")
 
+    # Pan-Tompkins: streaming chunks must give exactly the batch peaks
+    print("\nPan-Tompkins check:")
+    agent2_pt = FeatureExtractionAgent(peak_method="pan_tompkins")
+    batch_peaks = agent2_pt._detect_r_peaks(test_signal, sampling_rate)
+    agent2_pt.reset_stream(sampling_rate)
+    stream_chunks = np.array_split(test_signal, 53)
+    stream_chunks.insert(26, test_signal[:0])  # an update with no new samples
+    stream_peaks = np.concatenate(
+        [agent2_pt.process_chunk(c, sampling_rate) for c in stream_chunks]
+        + [agent2_pt.flush_stream()])
+    assert np.array_equal(batch_peaks, stream_peaks), "Streaming peaks differ from batch peaks"
+    print(f"  Batch: {len(batch_peaks)} peaks, streaming: {len(stream_peaks)} peaks (expected ~{len(beat_times)})")
+    print("  [OK] Streaming and batch peaks identical")
+
+    # HRV accumulator: sliding-window values must match the batch functions
+    print("\nHRV accumulator check:")
+    rng = np.random.default_rng(0)
+    for trial in range(20):
+        rr_series = rng.normal(rng.uniform(600, 1100), rng.uniform(5, 120), size=rng.integers(50, 500))
+        window = int(rng.integers(5, 60))
+        accumulator = HRVAccumulator(max_beats=window)
+        for i, rr in enumerate(rr_series):
+            accumulator.push(rr)
+            current = rr_series[max(0, i + 1 - window):i + 1]
+            if len(current) >= 2:
+                assert abs(accumulator.heart_rate - 60000 / np.mean(current)) < 1e-6
+                assert abs(accumulator.sdnn - np.std(current, ddof=1)) < 1e-6
+                assert abs(accumulator.rmssd - np.sqrt(np.mean(np.diff(current) ** 2))) < 1e-6
+        assert abs(accumulator.get_features()["hrv_sdnn"] - agent2._calculate_sdnn(current)) <= 0.01
+        assert abs(accumulator.get_features()["hrv_rmssd"] - agent2._calculate_rmssd(current)) <= 0.01
+    print("  [OK] 20 random sliding windows agree with the batch functions")
+
+    # Frequency domain: a 0.1 Hz (LF) RR oscillation must dominate with both methods
+    print("\nFrequency-domain check:")
+    beat_rr = [800.0]
+    while sum(beat_rr) < 300000:
+        beat_rr.append(800 + 40 * np.sin(2 * np.pi * 0.1 * sum(beat_rr) / 1000))
+    beat_rr = np.array(beat_rr)
+    for method in ("fft", "lomb"):
+        spectral = agent2.calculate_frequency_features(beat_rr, method=method)
+        assert spectral["lf_hf_ratio"] > 10, spectral
+        print(f"  {method}: LF={spectral['lf_power']} ms^2, HF={spectral['hf_power']} ms^2, LF/HF={spectral['lf_hf_ratio']}")
+    tracker = SpectralHRVTracker(window_seconds=120, hop_seconds=5)
+    updates = [f for f in map(tracker.push, beat_rr) if f is not None]
+    assert updates and updates[-1]["lf_hf_ratio"] > 10
+    print(f"  [OK] Sliding tracker refreshed {len(updates)} times")
+
+    # Windowed features must match extract_features on each window's beats
+    print("\nWindowed features check:")
+    long_signal = np.tile(test_signal, 4)
+    table = agent2.extract_features_windowed(long_signal, sampling_rate, window_s=30, hop_s=10)
+    peaks = agent2._detect_r_peaks(long_signal, sampling_rate)
+    rr_all, _ = correct_rr_intervals(np.diff(peaks) / sampling_rate * 1000)
+    for i, start in enumerate(table["window_start_s"]):
+        in_window = (peaks[1:] / sampling_rate >= start) & (peaks[1:] / sampling_rate < start + 30)
+        window_rr = rr_all[in_window]
+        window_rr = window_rr[(window_rr >= 300) & (window_rr <= 2000)]
+        assert abs(table["hrv_sdnn"][i] - agent2._calculate_sdnn(window_rr)) <= 0.01
+        assert abs(table["heart_rate"][i] - agent2._calculate_hr(window_rr)) <= 0.01
+        assert abs(table["hrv_rmssd"][i] - agent2._calculate_rmssd(window_rr)) <= 0.01
+        assert abs(table["min_hr"][i] - round(60000 / np.max(window_rr), 2)) <= 0.01
+        assert abs(table["max_hr"][i] - round(60000 / np.min(window_rr), 2)) <= 0.01
+    print(f"  {len(table['window_start_s'])} windows, HR: {table['heart_rate']}")
+
+    # A window ending at the last beat must include the final RR interval
+    last_beats = np.arange(0, int(18.5 * sampling_rate), int(0.8 * sampling_rate))
+    last_beats = np.append(last_beats, last_beats[-1] + int(0.948 * sampling_rate))
+    last_signal = np.zeros(20 * sampling_rate + 1)
+    last_signal[last_beats] = 1.0
+    last_table = agent2.extract_features_windowed(last_signal, sampling_rate, window_s=10, hop_s=5)
+    assert last_table["min_hr"][-1] == round(60000 / 948, 2), last_table["min_hr"]
+    print(f"  Last window min HR {last_table['min_hr'][-1]} bpm (final RR 948 ms)")
+    print("  [OK] Windowed features match per-window calculation")
+
+    # Window-by-window detection must find the same beats as one pass,
+    # also where close candidates chain across window seams
+    print("\nLong-recording check:")
+    import os
+    import tempfile
+    rng_long = np.random.default_rng(3)
+    noisy_signal = np.tile(test_signal, 8) + rng_long.normal(0, 0.3, 8 * len(test_signal))
+    long_path = os.path.join(tempfile.mkdtemp(), "cleaned.f64")
+    noisy_signal.tofile(long_path)
+    mapped_signal = np.memmap(long_path, dtype=np.float64, mode="r")
+    whole = agent2.extract_features(noisy_signal, sampling_rate)
+    for window_seconds in (60, 7, 1):
+        windowed = agent2.extract_features_long(mapped_signal, sampling_rate, window_seconds=window_seconds)
+        assert np.array_equal(windowed["rr_intervals"], whole["rr_intervals"]), window_seconds
+    print(f"  {whole['num_beats']} beats in {len(noisy_signal) / sampling_rate:.0f} s (60/7/1 s windows)")
+    print("  [OK] Memory-mapped window-by-window detection matches extract_features")
+
+    # FeatureResult stays dict-compatible and serializes on demand
+    print("\nFeatureResult check:")
+    assert isinstance(features, FeatureResult) and features.rr_intervals.dtype == np.float32
+    assert set(features.to_dict()) == set(FeatureResult.CORE_KEYS)
+    assert json.loads(features.to_json())["num_beats"] == features["num_beats"]
+    print(f"  {features!r}")
+    print("  [OK] Dict keys and JSON serialization work")
+
+    # Ectopic, missed and extra beats are flagged and interpolated in place
+    print("\nRR correction check:")
+    rng_rr = np.random.default_rng(2)
+    clean_rr = 850 + 30 * np.sin(np.arange(200) / 8) + rng_rr.normal(0, 5, 200)
+    noisy_rr = clean_rr.copy()
+    noisy_rr[40], noisy_rr[41] = 0.6 * clean_rr[40], clean_rr[41] + 0.4 * clean_rr[40]
+    noisy_rr[90] = clean_rr[90] * 2
+    noisy_rr[140], noisy_rr[141] = 0.45 * clean_rr[140], 0.55 * clean_rr[140]
+    noisy_rr[170] = 2500
+    nn, rr_flags = correct_rr_intervals(noisy_rr)
+    assert rr_flags[40] == rr_flags[41] == RR_ECTOPIC
+    assert rr_flags[90] == RR_MISSED
+    assert rr_flags[140] == rr_flags[141] == RR_EXTRA
+    assert rr_flags[170] == RR_ARTIFACT
+    assert np.count_nonzero(rr_flags) == 6 and len(nn) == len(noisy_rr)
+    assert np.max(np.abs(nn - clean_rr)) < 40
+    print(f"  RMSSD raw {agent2._calculate_rmssd(noisy_rr)} ms -> corrected {agent2._calculate_rmssd(nn)} ms "
+          f"(clean {agent2._calculate_rmssd(clean_rr)} ms)")
+    print("  [OK] Ectopic, missed, extra and artifact beats flagged and corrected")
+
+    # Multi-lead fusion: a noise-only lead must not change the beats
+    print("\nMulti-lead fusion check:")
+    rng_leads = np.random.default_rng(3)
+    leads = np.vstack((test_signal,
+                       0.6 * test_signal + rng_leads.normal(0, 0.2, len(test_signal)),
+                       rng_leads.normal(0, 1, len(test_signal))))
+    lead_peaks = [agent2._detect_r_peaks(lead, sampling_rate) for lead in leads]
+    single_peaks = lead_peaks[0]
+    features_leads = agent2.extract_features_multilead(leads, sampling_rate)
+    assert features_leads["lead_sqi"][2] == 0
+    assert any("from 2/3 leads" in log for log in agent2.get_log())  # noise lead skipped
+    fused = fuse_r_peaks(lead_peaks, lead_quality(leads), sampling_rate)
+    matched = np.min(np.abs(fused[:, None] - single_peaks[None, :]), axis=1) <= 2
+    assert np.mean(matched) > 0.9 and abs(len(fused) - len(single_peaks)) <= 3
+    print(f"  Lead SQI: {features_leads['lead_sqi']}, peaks per lead: {[len(p) for p in lead_peaks]}")
+    print(f"  Fused: {len(fused)} peaks (lead 0 alone: {len(single_peaks)}), "
+          f"HR {features_leads['heart_rate']} vs {features['heart_rate']} bpm")
+    print("  [OK] Fused peaks follow the clean leads")
+
+    # Batch extraction over ragged recordings must match per-recording calls
+    print("\nBatch extraction check:")
+    lengths = [30, 12, 45, 1, 20]
+    ragged = [test_signal[:n * sampling_rate // 2] * (1 + 0.1 * i) for i, n in enumerate(lengths)]
+    batch = agent2.extract_features_batch(ragged, sampling_rate)
+    offsets = np.cumsum([0] + [len(r) for r in ragged[:-1]])
+    batch_buffer = agent2.extract_features_batch(buffer=np.concatenate(ragged), offsets=offsets,
+                                                 sampling_rate=sampling_rate)
+    assert np.array_equal(batch, batch_buffer)
+    for recording, row in zip(ragged, batch):
+        single = agent2.extract_features(recording, sampling_rate)
+        for key in ("heart_rate", "hrv_sdnn", "hrv_rmssd", "num_beats", "mean_rr", "min_hr", "max_hr"):
+            assert abs(row[key] - single[key]) < 1e-9, (key, row[key], single[key])
+    print(f"  [OK] {len(batch)} ragged recordings match extract_features")
+
+    # Tree-based entropies must equal the all-pairs definitions
+    print("\nNonlinear HRV check:")
+    rng = np.random.default_rng(1)
+    rr_test = 800 + np.cumsum(rng.normal(0, 10, 300)) * 0.2 + rng.normal(0, 20, 300)
+    tol = 0.2 * np.std(rr_test)
+
+    def brute_counts(length, n_templates):
+        templates = np.array([rr_test[i:i + length] for i in range(n_templates)])
+        dist = np.max(np.abs(templates[:, None, :] - templates[None, :, :]), axis=2)
+        return np.sum(dist <= tol, axis=1)
+
+    n_sampen = len(rr_test) - 2
+    b = (np.sum(brute_counts(2, n_sampen)) - n_sampen) / 2
+    a = (np.sum(brute_counts(3, n_sampen)) - n_sampen) / 2
+    assert abs(sample_entropy(rr_test) + np.log(a / b)) < 1e-12
+    phi = [np.mean(np.log(brute_counts(k, len(rr_test) - k + 1) / (len(rr_test) - k + 1))) for k in (2, 3)]
+    assert abs(approximate_entropy(rr_test) - (phi[0] - phi[1])) < 1e-12
+    white_alpha = dfa_alpha1(rng.normal(800, 50, 20000))
+    assert 0.35 < white_alpha < 0.65, white_alpha
+
+    agent2_nonlinear = FeatureExtractionAgent(nonlinear=True)
+    features_nonlinear = agent2_nonlinear.extract_features(test_signal, sampling_rate)
+    for key in ("sd1", "sd2", "sd1_sd2_ratio", "sample_entropy", "approximate_entropy", "dfa_alpha1"):
+        print(f"  {key}: {features_nonlinear[key]}")
+    print(f"  DFA alpha1 of white noise: {white_alpha:.3f}")
+    print("  [OK] Entropies match all-pairs counting")
+
     print("\n" + "=" * 50)
     print("[OK] Agent 2 test complete!")
     print("=" * 50)
@@ -3,32 +3,255 @@ Agent 3: Decision Agent (Rule-based + MCP Tool Integration)
 Responsible for comprehensive analysis and decision making
 """
 
+import asyncio
+from collections.abc import MutableMapping
 import sys
 import os
+import threading
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime
+from functools import partial
+
+import numpy as np
 
 # Ensure tools can be imported
 sys.path.append(os.path.dirname(os.path.dirname(__file__)))
 
 try:
-    from tools.mcp_tools import MCPTools
+    from tools.mcp_tools import MCPTools, CachedMCPTools
+    from tools.risk_rules import RiskRules, load_rules
+except ImportError:
+    from mcp_tools import MCPTools, CachedMCPTools
+    from risk_rules import RiskRules, load_rules
+
+try:
+    from agents.baseline_store import BaselineStore
 except ImportError:
-    from mcp_tools import MCPTools
+    from baseline_store import BaselineStore
+
+# Per-tool deadlines and overall latency budget of analyze_async (seconds)
+TOOL_TIMEOUTS = {
+    "weather": 1.0,
+    "time_risk": 0.5,
+    "duration_risk": 0.5,
+    "medical_info": 0.5
+}
+ANALYSIS_BUDGET = 1.5
+
+# Fields of a time/duration tool result that come from the rule set
+RISK_KEYS = ("risk_level", "reason", "risk_score")
+
+# Features shown in the report (copied into each DecisionResult)
+REPORT_FEATURES = ("heart_rate", "hrv_sdnn", "hrv_rmssd", "num_beats")
+
+# Report template, split into sections that are filled with str.format
+REPORT_HEADER = (
+    "## Multi-Modal Analysis Report\n\n"
+    "### 1. Physiological Metrics Assessment\n\n"
+    "- **Heart Rate**: {heart_rate} bpm\n"
+    "- **HRV (SDNN)**: {hrv_sdnn} ms\n"
+    "- **HRV (RMSSD)**: {hrv_rmssd} ms\n"
+    "- **Detected Beats**: {num_beats}\n\n"
+    "### 2. Environmental Context Analysis\n\n"
+)
+REPORT_WEATHER = "**Weather Condition**: {description}\n- Fatigue Impact Factor: {fatigue_factor}\n\n"
+REPORT_TIME_RISK = "**Time Risk**: {current_time}\n- Risk Level: {risk_level}\n- Description: {reason}\n\n"
+REPORT_DURATION_RISK = ("**Driving Duration**: {duration_hours:.1f} hours\n"
+                        "- Risk Level: {risk_level}\n- Description: {reason}\n\n")
+REPORT_FACTORS = "### 3. Risk Factor Identification\n\n{factors}\n"
+REPORT_NO_FACTORS = "- No significant risk factors identified\n"
+REPORT_ASSESSMENT = (
+    "### 4. Comprehensive Assessment\n\n"
+    "**Risk Score**: {risk_score} / 100\n\n"
+    "**Risk Level**: {risk_level}\n\n"
+    "### 5. Recommended Actions\n\n"
+)
+REPORT_REST_AREA = "- {name} ({distance}, approx. {eta})\n"
+REPORT_ACTIONS = {
+    "Very High": (
+        "**IMMEDIATE ACTION REQUIRED!**\n\n"
+        "1. Find a safe place to stop immediately\n"
+        "2. Rest for at least 20-30 minutes\n"
+        "3. Get out and stretch your body\n"
+        "4. Stay hydrated, avoid excessive caffeine\n"
+        "5. If fatigue persists, find a place to sleep\n\n"
+    ),
+    "High": (
+        "**ATTENTION NEEDED!**\n\n"
+        "1. Stay highly alert\n"
+        "2. Consider stopping at the next rest area\n"
+        "3. Stay hydrated\n"
+        "4. Adjust car environment (music, temperature, ventilation)\n"
+        "5. If traveling with others, consider switching drivers\n"
+    ),
+    "Medium": (
+        "**STAY ALERT**\n\n"
+        "1. Pay attention to road conditions, avoid distractions\n"
+        "2. If driving over 2 hours, consider taking a break\n"
+        "3. Ensure comfortable car temperature\n"
+    ),
+    "Low": (
+        "**CURRENT STATUS: GOOD**\n\n"
+        "Continue safe driving. Recommended to take a break every 2 hours.\n"
+    )
+}
+
+def render_report(features, tool_results, reasons, risk_level, risk_score, tools):
+    """
+    Render the markdown analysis report from the section templates
+
+    Args:
+        features: Physiological features
+        tool_results: Tool query results
+        reasons: Risk factor list
+        risk_level: Risk level
+        risk_score: Risk score
+        tools: MCP tool provider (rest areas for "Very High")
+
+    Returns:
+        str: Analysis report
+    """
+    parts = [REPORT_HEADER.format(heart_rate=features['heart_rate'], hrv_sdnn=features['hrv_sdnn'],
+                                  hrv_rmssd=features['hrv_rmssd'], num_beats=features['num_beats'])]
+
+    if 'weather' in tool_results:
+        parts.append(REPORT_WEATHER.format(**tool_results['weather']))
+    if 'time_risk' in tool_results:
+        parts.append(REPORT_TIME_RISK.format(**tool_results['time_risk']))
+    if 'duration_risk' in tool_results:
+        parts.append(REPORT_DURATION_RISK.format(**tool_results['duration_risk']))
+
+    factors = "".join(f"- {reason}\n" for reason in reasons) or REPORT_NO_FACTORS
+    parts.append(REPORT_FACTORS.format(factors=factors))
+    parts.append(REPORT_ASSESSMENT.format(risk_score=risk_score, risk_level=risk_level))
+    parts.append(REPORT_ACTIONS.get(risk_level, REPORT_ACTIONS["Low"]))
+
+    # Nearest rest areas
+    if risk_level == "Very High" and 'weather' in tool_results:
+        parts.append("**Nearest Rest Areas**:\n")
+        parts.extend(REPORT_REST_AREA.format(**area) for area in tools.get_rest_area()[:2])
+
+    return "".join(parts)
+
+class DecisionResult(MutableMapping):
+    """
+    Decision from Agent 3
+
+    Holds the risk level, score, alert flag, reasons and tool results.
+    It behaves like the decision dict callers already use
+    (decision['risk_score'], .get('analysis'), ...), but the markdown
+    report under 'analysis' is only rendered when first read and then
+    cached, so loops that only need risk_score / alert_needed never
+    build report text. The feature values and tool results the report
+    shows are copied when the decision is made, so a caller reusing its
+    features dict still gets the report of this decision.
+    """
+
+    __slots__ = ("risk_level", "risk_score", "alert_needed", "reasons", "tool_results",
+                 "features", "tools", "_analysis", "extras")
+
+    KEYS = ("risk_level", "risk_score", "alert_needed", "analysis", "reasons", "tool_results")
+
+    def __init__(self, risk_level, risk_score, alert_needed, reasons, tool_results, features, tools):
+        self.risk_level = risk_level
+        self.risk_score = risk_score
+        self.alert_needed = alert_needed
+        self.reasons = reasons
+        self.tool_results = {key: dict(value) if isinstance(value, dict) else value
+                             for key, value in tool_results.items()}
+        self.features = {key: features.get(key) for key in REPORT_FEATURES}
+        self.tools = tools
+        self._analysis = None
+        self.extras = {}
+
+    @property
+    def analysis(self):
+        """Markdown report, rendered on first access"""
+        if self._analysis is None:
+            self._analysis = render_report(self.features, self.tool_results, self.reasons,
+                                           self.risk_level, self.risk_score, self.tools)
+        return self._analysis
+
+    def __getitem__(self, key):
+        if key in self.KEYS:
+            return getattr(self, key)
+        return self.extras[key]
+
+    def __setitem__(self, key, value):
+        if key == "analysis":
+            self._analysis = value
+        elif key in self.KEYS:
+            setattr(self, key, value)
+        else:
+            self.extras[key] = value
+
+    def __delitem__(self, key):
+        if key in self.KEYS:
+            raise KeyError(f"Cannot delete decision field: {key}")
+        del self.extras[key]
+
+    def __iter__(self):
+        yield from self.KEYS
+        yield from self.extras
+
+    def __len__(self):
+        return len(self.KEYS) + len(self.extras)
+
+    def __repr__(self):
+        return (f"DecisionResult(risk_level={self.risk_level!r}, risk_score={self.risk_score}, "
+                f"alert_needed={self.alert_needed}, reasons=<{len(self.reasons)}>)")
+
+    def to_dict(self):
+        """Plain dict copy, including the rendered report"""
+        return {key: self[key] for key in self}
 
 class DecisionAgent:
     """Agent 3: Smart decision making using rule engine with MCP tool integration"""
 
-    def __init__(self):
+    def __init__(self, tools=None, rules=None, baseline_store=None):
+        """
+        Args:
+            tools: MCP tool provider (default: MCPTools behind a TTL cache,
+                   so context lookups in analyze do not wait on the tools)
+            rules: Rule file path or compiled RiskRules (default: tools/risk_rules.json)
+            baseline_store: SQLite file path or BaselineStore holding
+                            per-driver baselines (default: none, only set_baseline)
+        """
         self.name = "Decision Agent (Rule-based + MCP)"
         self.status = "Standby"
-        self.tools = MCPTools()
+        self.tools = tools if tools is not None else CachedMCPTools()
         self.decision_log = []
         self.baseline = None
+        self.rules = rules if isinstance(rules, RiskRules) else load_rules(rules)
+        self.owns_baseline_store = baseline_store is not None and not isinstance(baseline_store, BaselineStore)
+        self.baseline_store = BaselineStore(baseline_store) if self.owns_baseline_store else baseline_store
+
+        # Worker threads for analyze_async; a tool still running after its
+        # deadline finishes here without holding up the caller. Each lookup
+        # has at most one call in flight (in_flight), so a hanging tool
+        # holds one worker instead of filling the pool.
+        self.executor = ThreadPoolExecutor(max_workers=8, thread_name_prefix="mcp-tool")
+        self.in_flight = {}
+        self.in_flight_lock = threading.Lock()
+
+    def close(self):
+        """Stop the tool worker threads and close a baseline store opened from a path"""
+        self.executor.shutdown(wait=False, cancel_futures=True)
+        if self.owns_baseline_store:
+            self.baseline_store.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
 
     def set_baseline(self, features):
         """
         Set personalized baseline
 
         Establish baseline during first 10-15 minutes of driving
+        (for per-driver baselines learned over time, see baseline_store)
 
         Args:
             features: Feature dictionary
@@ -40,7 +263,7 @@ class DecisionAgent:
         }
         self.decision_log.append(f"[OK] Baseline established: HR={self.baseline['heart_rate']} bpm, SDNN={self.baseline['hrv_sdnn']} ms")
 
-    def analyze(self, features, driving_duration_minutes=0):
+    def analyze(self, features, driving_duration_minutes=0, driver_id=None):
         """
         Analyze physiological features and make decisions
 
@@ -50,49 +273,246 @@ class DecisionAgent:
         3. Determine risk level based on total score
         4. Generate analysis report
 
+        With a driver_id and a baseline store, the driver's baseline for
+        the current hour bucket replaces self.baseline, and windows that
+        do not raise an alert are added to it.
+
+        Args:
+            features: dict, feature data from Agent 2
+            driving_duration_minutes: Driving duration (minutes)
+            driver_id: Driver identifier for the stored baseline
+
+        Returns:
+            decision: DecisionResult (dict-like) with risk assessment; the report is rendered on demand
+        """
+        self.status = "Analyzing..."
+        self.decision_log = []
+
+        # === 1. Query MCP Tools ===
+        tool_results = {'weather': self.tools.get_weather(), 'time_risk': self.tools.get_time_risk()}
+        if driving_duration_minutes > 0:
+            tool_results['duration_risk'] = self.tools.get_driving_duration_risk(driving_duration_minutes)
+        medical = {symptom: self.tools.get_medical_info(symptom) for symptom in self._medical_queries(features)}
+
+        return self._decide(features, tool_results, medical, driver_id)
+
+    async def analyze_async(self, features, driving_duration_minutes=0, timeouts=None, budget=ANALYSIS_BUDGET,
+                            driver_id=None):
+        """
+        Analyze with all MCP tool lookups running concurrently
+
+        Every lookup runs at once in a worker thread under its own
+        deadline (TOOL_TIMEOUTS) and all of them under the overall budget,
+        so latency is bounded by the slowest tool (at most the budget)
+        instead of the sum. A tool that misses its deadline or fails
+        contributes nothing to the score and is listed in
+        tool_results['timed_out'] or tool_results['failed']. A lookup
+        whose call from an earlier window is still running is not called
+        again and counts as timed out.
+
         Args:
             features: dict, feature data from Agent 2
             driving_duration_minutes: Driving duration (minutes)
+            timeouts: Per-tool deadline overrides (seconds)
+            budget: Overall deadline for all lookups (seconds)
+            driver_id: Driver identifier for the stored baseline (see analyze)
 
         Returns:
-            decision: dict containing risk assessment and recommendations
+            decision: DecisionResult (dict-like) with risk assessment; the report is rendered on demand
         """
         self.status = "Analyzing..."
         self.decision_log = []
+        timeouts = dict(TOOL_TIMEOUTS, **(timeouts or {}))
+
+        # (result key, tool name for the timeout, call)
+        calls = [('weather', 'weather', self.tools.get_weather),
+                 ('time_risk', 'time_risk', self.tools.get_time_risk)]
+        if driving_duration_minutes > 0:
+            calls.append(('duration_risk', 'duration_risk',
+                          partial(self.tools.get_driving_duration_risk, driving_duration_minutes)))
+        for symptom in self._medical_queries(features):
+            calls.append((f"medical_info:{symptom}", 'medical_info', partial(self.tools.get_medical_info, symptom)))
+
+        tasks, still_running = {}, []
+        with self.in_flight_lock:
+            for key, tool, call in calls:
+                previous = self.in_flight.get(key)
+                if previous is not None and not previous.done():
+                    still_running.append(key)
+                    continue
+                future = self.in_flight[key] = self.executor.submit(call)
+                tasks[key] = asyncio.ensure_future(asyncio.wait_for(asyncio.wrap_future(future), timeouts[tool]))
+        if tasks:
+            done, pending = await asyncio.wait(tasks.values(), timeout=budget)
+            for task in pending:
+                task.cancel()
+
+        tool_results, medical, timed_out, failed = {}, {}, list(still_running), []
+        for key, task in tasks.items():
+            if task not in done or isinstance(task.exception(), asyncio.TimeoutError):
+                timed_out.append(key)
+            elif task.exception() is not None:
+                failed.append(key)
+            elif key.startswith("medical_info:"):
+                medical[key.split(":", 1)[1]] = task.result()
+            else:
+                tool_results[key] = task.result()
+
+        decision = self._decide(features, tool_results, medical, driver_id)
+        if still_running:
+            self.decision_log.append(f"[WARN] Tools still busy with an earlier call (skipped): {', '.join(still_running)}")
+        if timed_out:
+            self.decision_log.append(f"[WARN] Tools timed out (neutral contribution): {', '.join(timed_out)}")
+        if failed:
+            self.decision_log.append(f"[FAIL] Tools failed (neutral contribution): {', '.join(failed)}")
+        decision['tool_results']['timed_out'] = timed_out
+        decision['tool_results']['failed'] = failed
+        return decision
+
+    def analyze_concurrent(self, features, driving_duration_minutes=0, timeouts=None, budget=ANALYSIS_BUDGET,
+                           driver_id=None):
+        """
+        Synchronous wrapper around analyze_async (for callers without an event loop)
+
+        Returns:
+            decision: DecisionResult (dict-like) with risk assessment; the report is rendered on demand
+        """
+        return asyncio.run(self.analyze_async(features, driving_duration_minutes, timeouts, budget, driver_id))
+
+    def analyze_batch(self, features_table, context_table=None):
+        """
+        Score many feature windows at once
+
+        Applies the same rules as analyze (weather, time and duration
+        scores, HR/SDNN thresholds, baseline deltas, level cutoffs) as
+        NumPy masks over whole columns. No tools are queried and no
+        report is built; context comes from context_table instead.
+
+        Args:
+            features_table: Columns heart_rate and hrv_sdnn (dict of arrays,
+                            pandas DataFrame or structured array, e.g. from
+                            FeatureExtractionAgent.extract_features_batch)
+            context_table: Optional columns (missing ones use the defaults):
+                           weather_fatigue_factor ("High"/"Medium"/"Low", default "Low"),
+                           hour (0-23, default the current hour),
+                           driving_duration_minutes (default 0),
+                           baseline_heart_rate / baseline_hrv_sdnn
+                           (per-row baseline, default self.baseline),
+                           driver_id (baselines looked up in the baseline
+                           store when no baseline columns are given)
+
+        Returns:
+            dict: risk_score (int array), risk_level (str array),
+                  alert_needed (bool array)
+        """
+        hr = np.asarray(features_table['heart_rate'], dtype=np.float64)
+        sdnn = np.asarray(features_table['hrv_sdnn'], dtype=np.float64)
+        n_rows = len(hr)
+        context = context_table if context_table is not None else {}
+
+        def context_column(name, default):
+            if name in context:
+                return np.asarray(context[name])
+            return np.full(n_rows, default)
+
+        rules = self.rules
+        risk_score = np.zeros(n_rows, dtype=np.int64)
+
+        # 1. Context: weather, time and duration scores
+        weather = context_column('weather_fatigue_factor', "Low")
+        for factor, score in rules.weather_scores.items():
+            risk_score += np.where(weather == factor, score, 0)
+        risk_score += rules.hour_scores[context_column('hour', datetime.now().hour).astype(np.int64)]
+        duration = context_column('driving_duration_minutes', 0)
+        # Like analyze: no duration risk unless a driving duration is given
+        risk_score += np.where(duration > 0, rules.duration_scores_batch(duration), 0)
+
+        # 2. Physiological thresholds
+        risk_score += np.where(hr < rules.hr_low, rules.hr_low_score,
+                               np.where(hr > rules.hr_high, rules.hr_high_score, 0))
+        risk_score += np.where(sdnn > rules.sdnn_high, rules.sdnn_high_score,
+                               np.where(sdnn < rules.sdnn_low, rules.sdnn_low_score, 0))
+
+        # 3. Baseline deltas
+        if 'driver_id' in context and 'baseline_heart_rate' not in context and self.baseline_store is not None:
+            context = dict(context, **self.baseline_store.baseline_columns(
+                context['driver_id'], context_column('hour', datetime.now().hour)))
+        baseline = self.baseline or {}
+        if 'baseline_heart_rate' in context or baseline:
+            base_hr = context_column('baseline_heart_rate', baseline.get('heart_rate', np.nan)).astype(np.float64)
+            base_sdnn = context_column('baseline_hrv_sdnn', baseline.get('hrv_sdnn', np.nan)).astype(np.float64)
+            risk_score += np.where(hr - base_hr < rules.hr_drop, rules.hr_drop_score, 0)
+            risk_score += np.where(sdnn - base_sdnn > rules.sdnn_rise, rules.sdnn_rise_score, 0)
+
+        # 4. Levels
+        risk_level, alert_needed = rules.risk_levels_batch(risk_score)
+
+        return {
+            "risk_score": risk_score,
+            "risk_level": risk_level,
+            "alert_needed": alert_needed
+        }
+
+    def _medical_queries(self, features):
+        """Medical knowledge keywords the rules below will look up"""
+        symptoms = []
+        if features['heart_rate'] < self.rules.hr_low:
+            symptoms.append("low_hr")
+        if features['hrv_sdnn'] > self.rules.sdnn_high:
+            symptoms.append("high_hrv")
+        return symptoms
 
+    def _decide(self, features, tool_results, medical, driver_id=None):
+        """
+        Score features and context, determine the risk level and build the report
+
+        Args:
+            features: dict, feature data from Agent 2
+            tool_results: Context lookups ('weather', 'time_risk',
+                          'duration_risk'); missing ones contribute nothing
+            medical: Medical knowledge per keyword (see _medical_queries)
+            driver_id: Driver identifier for the stored baseline
+
+        Returns:
+            decision: DecisionResult (dict-like) with risk assessment; the report is rendered on demand
+        """
         # Initialize risk score
+        rules = self.rules
         risk_score = 0
         reasons = []
-        tool_results = {}
 
-        # === 1. Query MCP Tools ===
         self.decision_log.append("--- Querying Context Information ---")
 
-        # 1.1 Query weather
-        weather = self.tools.get_weather()
-        tool_results['weather'] = weather
-        self.decision_log.append(f"Weather: {weather['description']}")
+        # 1.1 Weather
+        if 'weather' in tool_results:
+            weather = tool_results['weather']
+            self.decision_log.append(f"Weather: {weather['description']}")
 
-        if weather['fatigue_factor'] == "High":
-            risk_score += 15
-            reasons.append(f"Weather factor: {weather['condition']}, {weather['temperature']}C, hot environment increases fatigue")
-        elif weather['fatigue_factor'] == "Medium":
-            risk_score += 5
-            reasons.append(f"Weather factor: {weather['condition']}, slight impact")
+            if weather['fatigue_factor'] == "High":
+                risk_score += rules.weather_scores["High"]
+                reasons.append(f"Weather factor: {weather['condition']}, {weather['temperature']}C, hot environment increases fatigue")
+            elif weather['fatigue_factor'] == "Medium":
+                risk_score += rules.weather_scores["Medium"]
+                reasons.append(f"Weather factor: {weather['condition']}, slight impact")
 
-        # 1.2 Query time risk
-        time_risk = self.tools.get_time_risk()
-        tool_results['time_risk'] = time_risk
-        self.decision_log.append(f"Time: {time_risk['current_time']} ({time_risk['risk_level']})")
+        # 1.2 Time risk (scored with this agent's rules, the tool supplies the hour)
+        if 'time_risk' in tool_results:
+            time_risk = tool_results['time_risk']
+            if 'hour' in time_risk:
+                time_risk = tool_results['time_risk'] = dict(
+                    time_risk, **dict(zip(RISK_KEYS, rules.time_risk(time_risk['hour']))))
+            self.decision_log.append(f"Time: {time_risk['current_time']} ({time_risk['risk_level']})")
 
-        risk_score += time_risk['risk_score']
-        if time_risk['risk_score'] > 0:
-            reasons.append(f"Time factor: {time_risk['reason']}")
+            risk_score += time_risk['risk_score']
+            if time_risk['risk_score'] > 0:
+                reasons.append(f"Time factor: {time_risk['reason']}")
 
-        # 1.3 Query driving duration risk
-        if driving_duration_minutes > 0:
-            duration_risk = self.tools.get_driving_duration_risk(driving_duration_minutes)
-            tool_results['duration_risk'] = duration_risk
+        # 1.3 Driving duration risk (scored with this agent's rules)
+        if 'duration_risk' in tool_results:
+            duration_risk = tool_results['duration_risk']
+            if 'duration_minutes' in duration_risk:
+                duration_risk = tool_results['duration_risk'] = dict(
+                    duration_risk, **dict(zip(RISK_KEYS, rules.duration_risk(duration_risk['duration_minutes']))))
             self.decision_log.append(f"Driving duration: {duration_risk['duration_hours']:.1f} hours ({duration_risk['risk_level']})")
 
             risk_score += duration_risk['risk_score']
@@ -111,175 +531,65 @@ class DecisionAgent:
         self.decision_log.append(f"HRV (RMSSD): {rmssd} ms")
 
         # 2.1 Heart rate assessment
-        if hr < 60:
-            risk_score += 30
+        if hr < rules.hr_low:
+            risk_score += rules.hr_low_score
             reasons.append(f"Low heart rate ({hr} bpm), may indicate relaxation or fatigue")
-            # Query medical knowledge
-            med_info = self.tools.get_medical_info("low_hr")
-            self.decision_log.append(f"   Medical info: {med_info['meaning']}")
-        elif hr > 90:
-            risk_score -= 10  # High HR may indicate alertness
+            if "low_hr" in medical:
+                self.decision_log.append(f"   Medical info: {medical['low_hr']['meaning']}")
+        elif hr > rules.hr_high:
+            risk_score += rules.hr_high_score  # High HR may indicate alertness
             self.decision_log.append("   [OK] Heart rate slightly elevated, maintaining alertness")
 
         # 2.2 HRV assessment
-        if sdnn > 80:
-            risk_score += 35
+        if sdnn > rules.sdnn_high:
+            risk_score += rules.sdnn_high_score
             reasons.append(f"High HRV (SDNN={sdnn} ms), parasympathetic active, fatigue sign")
-            # Query medical knowledge
-            med_info = self.tools.get_medical_info("high_hrv")
-            self.decision_log.append(f"   Medical info: {med_info['meaning']}")
-        elif sdnn < 30:
-            risk_score -= 5
+            if "high_hrv" in medical:
+                self.decision_log.append(f"   Medical info: {medical['high_hrv']['meaning']}")
+        elif sdnn < rules.sdnn_low:
+            risk_score += rules.sdnn_low_score
             self.decision_log.append("   [OK] Low HRV, may indicate alert state")
 
-        # 2.3 Compare with baseline (if set)
-        if self.baseline:
+        # 2.3 Compare with baseline (the driver's stored one, else the one set)
+        baseline = self.baseline
+        learn_baseline = driver_id is not None and self.baseline_store is not None
+        if learn_baseline:
+            hour = tool_results.get('time_risk', {}).get('hour', datetime.now().hour)
+            baseline = self.baseline_store.get(driver_id, hour)
+            if baseline is None:
+                self.decision_log.append(f"\n[WARN] No baseline yet for driver {driver_id}, still learning")
+
+        if baseline:
             self.decision_log.append("\n--- Comparing with Personal Baseline ---")
 
-            hr_diff = hr - self.baseline['heart_rate']
-            sdnn_diff = sdnn - self.baseline['hrv_sdnn']
+            hr_diff = hr - baseline['heart_rate']
+            sdnn_diff = sdnn - baseline['hrv_sdnn']
 
-            if hr_diff < -10:
-                risk_score += 15
+            if hr_diff < rules.hr_drop:
+                risk_score += rules.hr_drop_score
                 reasons.append(f"Heart rate {abs(hr_diff):.1f} bpm below baseline, deviation from personal normal")
                 self.decision_log.append(f"   [WARN] Heart rate {abs(hr_diff):.1f} bpm below baseline")
 
-            if sdnn_diff > 20:
-                risk_score += 15
+            if sdnn_diff > rules.sdnn_rise:
+                risk_score += rules.sdnn_rise_score
                 reasons.append(f"HRV {sdnn_diff:.1f} ms above baseline, increased variability")
                 self.decision_log.append(f"   [WARN] HRV {sdnn_diff:.1f} ms above baseline")
 
         # === 3. Determine Risk Level ===
         self.decision_log.append(f"\n--- Risk Score: {risk_score} ---")
 
-        if risk_score >= 70:
-            risk_level = "Very High"
-            alert_needed = True
-        elif risk_score >= 50:
-            risk_level = "High"
-            alert_needed = True
-        elif risk_score >= 30:
-            risk_level = "Medium"
-            alert_needed = False
-        else:
-            risk_level = "Low"
-            alert_needed = False
-
-        # === 4. Generate Analysis Report ===
-        analysis = self._generate_report(
-            features,
-            tool_results,
-            reasons,
-            risk_level,
-            risk_score
-        )
-
-        self.status = "Done"
-
-        return {
-            "risk_level": risk_level,
-            "risk_score": risk_score,
-            "alert_needed": alert_needed,
-            "analysis": analysis,
-            "reasons": reasons,
-            "tool_results": tool_results
-        }
-
-    def _generate_report(self, features, tool_results, reasons, risk_level, risk_score):
-        """
-        Generate detailed analysis report (AI-style)
-
-        Args:
-            features: Physiological features
-            tool_results: Tool query results
-            reasons: Risk factor list
-            risk_level: Risk level
-            risk_score: Risk score
-
-        Returns:
-            str: Analysis report
-        """
-        report = "## Multi-Modal Analysis Report\n\n"
-
-        # 1. Physiological metrics assessment
-        report += "### 1. Physiological Metrics Assessment\n\n"
-        report += f"- **Heart Rate**: {features['heart_rate']} bpm\n"
-        report += f"- **HRV (SDNN)**: {features['hrv_sdnn']} ms\n"
-        report += f"- **HRV (RMSSD)**: {features['hrv_rmssd']} ms\n"
-        report += f"- **Detected Beats**: {features['num_beats']}\n\n"
+        risk_level, alert_needed = rules.risk_level(risk_score)
 
-        # 2. Environmental context analysis
-        report += "### 2. Environmental Context Analysis\n\n"
-
-        if 'weather' in tool_results:
-            weather = tool_results['weather']
-            report += f"**Weather Condition**: {weather['description']}\n"
-            report += f"- Fatigue Impact Factor: {weather['fatigue_factor']}\n\n"
-
-        if 'time_risk' in tool_results:
-            time_risk = tool_results['time_risk']
-            report += f"**Time Risk**: {time_risk['current_time']}\n"
-            report += f"- Risk Level: {time_risk['risk_level']}\n"
-            report += f"- Description: {time_risk['reason']}\n\n"
+        # Only windows without an alert are learned, so drowsy stretches
+        # do not pull the driver's baseline toward fatigue
+        if learn_baseline and not alert_needed:
+            count = self.baseline_store.update(driver_id, features, hour)
+            self.decision_log.append(f"[OK] Baseline updated for driver {driver_id} ({count} windows)")
 
-        if 'duration_risk' in tool_results:
-            duration_risk = tool_results['duration_risk']
-            report += f"**Driving Duration**: {duration_risk['duration_hours']:.1f} hours\n"
-            report += f"- Risk Level: {duration_risk['risk_level']}\n"
-            report += f"- Description: {duration_risk['reason']}\n\n"
-
-        # 3. Risk factor identification
-        report += "### 3. Risk Factor Identification\n\n"
-        if reasons:
-            for reason in reasons:
-                report += f"- {reason}\n"
-        else:
-            report += "- No significant risk factors identified\n"
-
-        report += "\n"
-
-        # 4. Comprehensive assessment
-        report += f"### 4. Comprehensive Assessment\n\n"
-        report += f"**Risk Score**: {risk_score} / 100\n\n"
-        report += f"**Risk Level**: {risk_level}\n\n"
-
-        # 5. Recommended actions
-        report += "### 5. Recommended Actions\n\n"
-
-        if risk_level == "Very High":
-            report += "**IMMEDIATE ACTION REQUIRED!**\n\n"
-            report += "1. Find a safe place to stop immediately\n"
-            report += "2. Rest for at least 20-30 minutes\n"
-            report += "3. Get out and stretch your body\n"
-            report += "4. Stay hydrated, avoid excessive caffeine\n"
-            report += "5. If fatigue persists, find a place to sleep\n\n"
-
-            # Provide nearest rest areas
-            if 'weather' in tool_results:
-                rest_areas = self.tools.get_rest_area()
-                report += "**Nearest Rest Areas**:\n"
-                for area in rest_areas[:2]:
-                    report += f"- {area['name']} ({area['distance']}, approx. {area['eta']})\n"
-
-        elif risk_level == "High":
-            report += "**ATTENTION NEEDED!**\n\n"
-            report += "1. Stay highly alert\n"
-            report += "2. Consider stopping at the next rest area\n"
-            report += "3. Stay hydrated\n"
-            report += "4. Adjust car environment (music, temperature, ventilation)\n"
-            report += "5. If traveling with others, consider switching drivers\n"
-
-        elif risk_level == "Medium":
-            report += "**STAY ALERT**\n\n"
-            report += "1. Pay attention to road conditions, avoid distractions\n"
-            report += "2. If driving over 2 hours, consider taking a break\n"
-            report += "3. Ensure comfortable car temperature\n"
-
-        else:
-            report += "**CURRENT STATUS: GOOD**\n\n"
-            report += "Continue safe driving. Recommended to take a break every 2 hours.\n"
+        # === 4. Analysis Report (rendered when first read) ===
+        self.status = "Done"
 
-        return report
+        return DecisionResult(risk_level, risk_score, alert_needed, reasons, tool_results, features, self.tools)
 
     def get_log(self):
         """Get decision log"""
@@ -338,6 +648,228 @@ if __name__ == "__main__":
     print(f"Risk Score: {decision_normal['risk_score']}")
     print(f"Alert Needed: {'Yes' if decision_normal['alert_needed'] else 'No'}")
 
+    # Concurrent lookups: latency follows the slowest tool, late tools count as neutral
+    print("\n" + "=" * 50)
+    print("\n=== Test Case 3: Concurrent Tool Queries ===\n")
+
+    import time
+
+    class SlowTools(MCPTools):
+        """Every lookup takes 0.2 s, weather takes 2 s"""
+
+        @staticmethod
+        def get_weather(location="Tainan"):
+            time.sleep(2.0)
+            return MCPTools.get_weather(location)
+
+        @staticmethod
+        def get_time_risk():
+            time.sleep(0.2)
+            return MCPTools.get_time_risk()
+
+        @staticmethod
+        def get_driving_duration_risk(duration_minutes):
+            time.sleep(0.2)
+            return MCPTools.get_driving_duration_risk(duration_minutes)
+
+        @staticmethod
+        def get_medical_info(symptom):
+            time.sleep(0.2)
+            return MCPTools.get_medical_info(symptom)
+
+    agent3_async = DecisionAgent(tools=SlowTools())
+    start = time.perf_counter()
+    decision_async = agent3_async.analyze_concurrent(test_features_drowsy, driving_duration_minutes=150,
+                                                     timeouts={"weather": 0.5})
+    elapsed = time.perf_counter() - start
+
+    # Same score as the sequential path without the weather contribution
+    agent3_sync = DecisionAgent(tools=MCPTools())
+    agent3_sync.tools.get_weather = lambda location="Tainan": dict(MCPTools.get_weather(location), fatigue_factor="Low")
+    decision_sync = agent3_sync.analyze(test_features_drowsy, driving_duration_minutes=150)
+
+    print(f"Elapsed: {elapsed:.2f} s (sequential: 2.8 s)")
+    print(f"Timed out: {decision_async['tool_results']['timed_out']}")
+    print(f"Risk Score: {decision_async['risk_score']} (sequential, neutral weather: {decision_sync['risk_score']})")
+    assert elapsed < 1.0
+    assert decision_async['tool_results']['timed_out'] == ['weather']
+    assert decision_async['risk_score'] == decision_sync['risk_score']
+    print("[OK] Bounded by the slowest tool within its deadline")
+
+    # A hanging provider keeps one worker, the other tools keep answering
+    release = threading.Event()
+
+    class HangingTools(MCPTools):
+        """Weather never answers until released"""
+
+        @staticmethod
+        def get_weather(location="Tainan"):
+            release.wait()
+            return MCPTools.get_weather(location)
+
+    with DecisionAgent(tools=HangingTools()) as agent3_hang:
+        for window in range(20):
+            decision_hang = agent3_hang.analyze_concurrent(test_features_drowsy, driving_duration_minutes=150,
+                                                           timeouts={"weather": 0.05})
+            assert decision_hang['tool_results']['timed_out'] == ['weather']
+            assert 'time_risk' in decision_hang['tool_results']
+        busy = sum(not future.done() for future in agent3_hang.in_flight.values())
+        print(f"20 windows with a hanging weather tool: {busy} worker busy, other tools answered every window")
+        assert busy == 1
+        release.set()
+    print("[OK] Hanging tool does not exhaust the worker pool")
+
+    # Batch scoring must match analyze row by row
+    print("\n" + "=" * 50)
+    print("\n=== Test Case 4: Batch Scoring ===\n")
+
+    rng = np.random.default_rng(0)
+    n_rows = 500
+    features_table = {"heart_rate": rng.uniform(45, 110, n_rows).round(2),
+                      "hrv_sdnn": rng.uniform(15, 120, n_rows).round(2)}
+    context_table = {"weather_fatigue_factor": rng.choice(["High", "Medium", "Low"], n_rows),
+                     "hour": rng.integers(0, 24, n_rows),
+                     "driving_duration_minutes": rng.choice([0, 30, 60, 119, 120, 179, 180, 300], n_rows)}
+
+    class FixedContextTools(MCPTools):
+        """Tools answering with one row of a context table (default: context_table)"""
+
+        def __init__(self, row, table=None):
+            self.row = row
+            self.table = table if table is not None else context_table
+
+        def get_weather(self, location="Tainan"):
+            return dict(MCPTools.get_weather(location), fatigue_factor=self.table["weather_fatigue_factor"][self.row])
+
+        def get_time_risk(self, hour=None):
+            return MCPTools.get_time_risk(int(self.table["hour"][self.row]))
+
+    agent3_batch = DecisionAgent(tools=MCPTools())
+    agent3_batch.set_baseline({"heart_rate": 75, "hrv_sdnn": 50, "hrv_rmssd": 30})
+    batch = agent3_batch.analyze_batch(features_table, context_table)
+    for row in range(n_rows):
+        agent3_batch.tools = FixedContextTools(row)
+        features_row = {"heart_rate": features_table["heart_rate"][row], "hrv_sdnn": features_table["hrv_sdnn"][row],
+                        "hrv_rmssd": 30, "num_beats": 100}
+        scalar = agent3_batch.analyze(features_row, int(context_table["driving_duration_minutes"][row]))
+        assert batch["risk_score"][row] == scalar["risk_score"]
+        assert batch["risk_level"][row] == scalar["risk_level"]
+        assert batch["alert_needed"][row] == scalar["alert_needed"]
+    print(f"[OK] {n_rows} rows match the scalar path")
+
+    # A day of 10-second windows for 100 drivers
+    n_fleet = 8640 * 100
+    fleet_features = {"heart_rate": rng.uniform(45, 110, n_fleet), "hrv_sdnn": rng.uniform(15, 120, n_fleet)}
+    fleet_context = {"weather_fatigue_factor": rng.choice(["High", "Medium", "Low"], n_fleet),
+                     "hour": np.repeat(np.arange(24), n_fleet // 24),
+                     "driving_duration_minutes": rng.uniform(0, 300, n_fleet)}
+    start = time.perf_counter()
+    fleet = agent3_batch.analyze_batch(fleet_features, fleet_context)
+    elapsed_ms = (time.perf_counter() - start) * 1000
+    print(f"Scored {n_fleet:,} windows in {elapsed_ms:.0f} ms "
+          f"({np.count_nonzero(fleet['alert_needed']):,} alerts)")
+
+    # Tuned rule file: no code changes needed
+    print("\n" + "=" * 50)
+    print("\n=== Test Case 5: Custom Rule File ===\n")
+
+    import json
+    import tempfile
+
+    with open(os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), "tools", "risk_rules.json")) as f:
+        custom = json.load(f)
+    custom["heart_rate"]["low"]["below"] = 65
+    custom["levels"][1]["min_score"] = 45
+    with tempfile.NamedTemporaryFile("w", suffix=".json", delete=False) as f:
+        json.dump(custom, f)
+    agent3_custom = DecisionAgent(tools=MCPTools(), rules=f.name)
+    os.unlink(f.name)
+
+    hr_62 = {"heart_rate": [62.0], "hrv_sdnn": [50.0]}
+    quiet_context = {"hour": [10], "weather_fatigue_factor": ["Low"], "driving_duration_minutes": [0]}
+    default_score = DecisionAgent(tools=MCPTools()).analyze_batch(hr_62, quiet_context)["risk_score"][0]
+    custom_result = agent3_custom.analyze_batch(hr_62, quiet_context)
+    assert default_score == 0 and custom_result["risk_score"][0] == 30
+    assert agent3_custom.rules.risk_level(45) == ("High", True)
+    print(f"HR 62 bpm: default rules {default_score}, custom rules {custom_result['risk_score'][0]}")
+
+    # Time and duration scores follow the agent's rules on both paths
+    for period in custom["time_risk"]["periods"]:
+        period["risk_score"] = 0
+    custom["duration_risk"][0]["risk_score"] = 5
+    custom["duration_risk"][-1]["risk_score"] = 99
+    agent3_custom = DecisionAgent(tools=MCPTools(), rules=RiskRules(custom))
+    custom_context = {"weather_fatigue_factor": np.full(72, "Low"), "hour": np.tile(np.arange(24), 3),
+                      "driving_duration_minutes": np.repeat([0, 30, 300], 24)}
+    custom_batch = agent3_custom.analyze_batch({"heart_rate": np.full(72, 75.0), "hrv_sdnn": np.full(72, 50.0)},
+                                               custom_context)
+    expected = np.repeat([0, 5, 99], 24)
+    for row in range(72):
+        agent3_custom.tools = FixedContextTools(row, custom_context)
+        scalar = agent3_custom.analyze(test_features_normal, int(custom_context["driving_duration_minutes"][row]))
+        assert scalar["risk_score"] == custom_batch["risk_score"][row] == expected[row]
+    print("Time scores 0, duration bands 5 / 99, no duration: analyze and analyze_batch agree")
+    print("[OK] Rule file changes take effect without code edits")
+
+    # The report is rendered on first read and cached
+    print("\n" + "=" * 50)
+    print("\n=== Test Case 6: Lazy Report ===\n")
+
+    assert isinstance(decision_drowsy, DecisionResult) and decision_drowsy._analysis is None
+    report = decision_drowsy["analysis"]
+    assert report.startswith("## Multi-Modal Analysis Report") and decision_drowsy.get("analysis") is report
+    assert set(decision_drowsy.to_dict()) == set(DecisionResult.KEYS)
+
+    # A reused features dict must not change an earlier decision's report
+    reused_features = dict(test_features_drowsy)
+    reused_decision = agent3_batch.analyze(reused_features, driving_duration_minutes=150)
+    reused_features.update(heart_rate=99, hrv_sdnn=11)
+    reused_report = reused_decision["analysis"]
+    assert "**Heart Rate**: 58 bpm" in reused_report and "**HRV (SDNN)**: 85 ms" in reused_report
+
+    start = time.perf_counter()
+    for _ in range(2000):
+        agent3_batch.analyze(test_features_drowsy, driving_duration_minutes=150)["risk_score"]
+    score_only_us = (time.perf_counter() - start) / 2000 * 1e6
+    start = time.perf_counter()
+    for _ in range(2000):
+        agent3_batch.analyze(test_features_drowsy, driving_duration_minutes=150)["analysis"]
+    with_report_us = (time.perf_counter() - start) / 2000 * 1e6
+    print(f"analyze: {score_only_us:.0f} us (score only), {with_report_us:.0f} us (with report)")
+    print("[OK] Report rendered on demand and cached")
+
+    # Per-driver baselines learned from alert windows, persisted across restarts
+    print("\n" + "=" * 50)
+    print("\n=== Test Case 7: Per-Driver Baselines ===\n")
+
+    baseline_path = os.path.join(tempfile.mkdtemp(), "baselines.db")
+    quiet_tools = FixedContextTools(0)
+    context_table["weather_fatigue_factor"][0], context_table["hour"][0] = "Low", 10
+
+    agent3_learn = DecisionAgent(tools=quiet_tools, baseline_store=baseline_path)
+    for window in range(30):
+        agent3_learn.analyze({"heart_rate": 80 + window % 3, "hrv_sdnn": 40, "hrv_rmssd": 28, "num_beats": 100},
+                             driver_id="driver-7")
+    agent3_learn.close()
+
+    # After a restart the learned baseline (HR 81) flags a drop to 68 bpm
+    agent3_restart = DecisionAgent(tools=quiet_tools, baseline_store=baseline_path)
+    drop = {"heart_rate": 68, "hrv_sdnn": 40, "hrv_rmssd": 28, "num_beats": 100}
+    stored = agent3_restart.baseline_store.get("driver-7", hour=10)
+    scored = agent3_restart.analyze(drop, driver_id="driver-7")
+    unknown = agent3_restart.analyze(drop, driver_id="driver-8")
+    print(f"Stored baseline: HR={stored['heart_rate']} bpm from {stored['count']} windows")
+    print(f"HR 68 bpm: driver-7 score {scored['risk_score']}, new driver score {unknown['risk_score']}")
+    assert stored['count'] == 30 and stored['heart_rate'] == 81.0
+    assert scored['risk_score'] == unknown['risk_score'] + agent3_restart.rules.hr_drop_score
+
+    batch_scores = agent3_restart.analyze_batch(
+        {"heart_rate": [68, 68], "hrv_sdnn": [40, 40]},
+        {"driver_id": ["driver-7", "driver-8"], "hour": [10, 10], "weather_fatigue_factor": ["Low", "Low"]})
+    assert batch_scores["risk_score"].tolist() == [scored['risk_score'], unknown['risk_score']]
+    agent3_restart.close()
+    print("[OK] Baseline survives restart and matches in batch scoring")
+
     print("\n" + "=" * 50)
     print("[OK] Agent 3 test complete!")
     print("=" * 50)
@@ -0,0 +1,304 @@
+"""
+Baseline Store
+Per-driver physiological baselines learned window by window and kept in SQLite
+"""
+
+from datetime import datetime
+import sqlite3
+import threading
+import time
+
+import numpy as np
+
+# Metrics tracked per (driver, hour bucket)
+BASELINE_METRICS = ("heart_rate", "hrv_sdnn", "hrv_rmssd")
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS baselines (
+    driver_id TEXT NOT NULL,
+    hour_bucket INTEGER NOT NULL,
+    count INTEGER NOT NULL,
+    heart_rate_mean REAL NOT NULL,
+    heart_rate_var REAL NOT NULL,
+    hrv_sdnn_mean REAL NOT NULL,
+    hrv_sdnn_var REAL NOT NULL,
+    hrv_rmssd_mean REAL NOT NULL,
+    hrv_rmssd_var REAL NOT NULL,
+    updated_at REAL NOT NULL,
+    PRIMARY KEY (driver_id, hour_bucket)
+) WITHOUT ROWID
+"""
+
+UPSERT = """
+INSERT INTO baselines VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?)
+ON CONFLICT (driver_id, hour_bucket) DO UPDATE SET
+    count = excluded.count,
+    heart_rate_mean = excluded.heart_rate_mean, heart_rate_var = excluded.heart_rate_var,
+    hrv_sdnn_mean = excluded.hrv_sdnn_mean, hrv_sdnn_var = excluded.hrv_sdnn_var,
+    hrv_rmssd_mean = excluded.hrv_rmssd_mean, hrv_rmssd_var = excluded.hrv_rmssd_var,
+    updated_at = excluded.updated_at
+"""
+
+class BaselineStore:
+    """
+    Incremental per-driver baselines
+
+    Each (driver_id, hour bucket) keeps a window count plus the running
+    mean and variance of HR, SDNN and RMSSD. Updates follow Welford's
+    method until max_count windows, after which the weight of a new
+    window stays at 1/max_count (an exponentially weighted mean/variance),
+    so the baseline keeps tracking slow changes.
+
+    Rows live in SQLite under the primary key (driver_id, hour_bucket);
+    a driver's rows are read once into a dict, so later lookups and
+    updates are dict operations and only writes touch the database.
+    """
+
+    def __init__(self, path=":memory:", bucket_hours=3, min_windows=10, max_count=720, commit_every=1):
+        """
+        Args:
+            path: SQLite database file (default: in-memory, not persisted)
+            bucket_hours: Width of a time-of-day bucket (hours, divides 24)
+            min_windows: Windows needed before a bucket is used as baseline
+                         (fewer: the driver's pooled all-day baseline)
+            max_count: Window count after which updates become an EWMA
+                       with weight 1/max_count (720 = 2 h of 10 s windows)
+            commit_every: Updates between commits (default: every update,
+                          so nothing is lost if the store is never closed;
+                          raise for bulk loads and call flush/close)
+        """
+        if 24 % bucket_hours:
+            raise ValueError(f"bucket_hours must divide 24, got {bucket_hours}")
+        self.path = str(path)
+        self.bucket_hours = bucket_hours
+        self.min_windows = min_windows
+        self.max_count = max_count
+        self.commit_every = commit_every
+
+        self.lock = threading.Lock()
+        self.connection = sqlite3.connect(self.path, check_same_thread=False)
+        if self.path != ":memory:":
+            self.connection.execute("PRAGMA journal_mode=WAL")
+            self.connection.execute("PRAGMA synchronous=NORMAL")
+        self.connection.execute(SCHEMA)
+        self.connection.commit()
+
+        # driver_id -> {hour_bucket: [count, means (list), variances (list)]}
+        self.drivers = {}
+        self.pending = 0
+
+    def hour_bucket(self, hour=None):
+        """Time-of-day bucket of an hour (default: now)"""
+        return (datetime.now().hour if hour is None else int(hour)) // self.bucket_hours
+
+    def _buckets(self, driver_id):
+        """Rows of a driver, read from SQLite on first use"""
+        buckets = self.drivers.get(driver_id)
+        if buckets is None:
+            rows = self.connection.execute(
+                "SELECT * FROM baselines WHERE driver_id = ?", (driver_id,)).fetchall()
+            buckets = {row[1]: [row[2], list(row[3:9:2]), list(row[4:10:2])] for row in rows}
+            self.drivers[driver_id] = buckets
+        return buckets
+
+    def update(self, driver_id, features, hour=None):
+        """
+        Add one feature window to a driver's baseline
+
+        Args:
+            driver_id: Driver identifier
+            features: Feature dictionary (heart_rate, hrv_sdnn, hrv_rmssd)
+            hour: Hour of day of the window (default: now)
+
+        Returns:
+            int: Windows counted in the bucket so far
+        """
+        bucket = self.hour_bucket(hour)
+        values = [float(features[metric]) for metric in BASELINE_METRICS]
+
+        with self.lock:
+            buckets = self._buckets(driver_id)
+            entry = buckets.get(bucket)
+            if entry is None:
+                entry = buckets[bucket] = [0, list(values), [0.0] * len(values)]
+            entry[0] += 1
+            weight = 1.0 / min(entry[0], self.max_count)
+            means, variances = entry[1], entry[2]
+            for i, value in enumerate(values):
+                delta = value - means[i]
+                means[i] += weight * delta
+                variances[i] += weight * (delta * (value - means[i]) - variances[i])
+
+            self.connection.execute(UPSERT, (driver_id, bucket, entry[0],
+                                             means[0], variances[0], means[1], variances[1],
+                                             means[2], variances[2], time.time()))
+            self.pending += 1
+            if self.pending >= self.commit_every:
+                self.connection.commit()
+                self.pending = 0
+        return entry[0]
+
+    def get(self, driver_id, hour=None):
+        """
+        Baseline of a driver at an hour of day
+
+        Uses the hour bucket once it has min_windows windows, otherwise
+        the driver's windows pooled over all buckets.
+
+        Args:
+            driver_id: Driver identifier
+            hour: Hour of day (default: now)
+
+        Returns:
+            dict: heart_rate, hrv_sdnn, hrv_rmssd (means), their *_std,
+                  count and hour_bucket (None when pooled), or None when
+                  the driver has fewer than min_windows windows
+        """
+        bucket = self.hour_bucket(hour)
+        with self.lock:
+            buckets = self._buckets(driver_id)
+            entry = buckets.get(bucket)
+            if entry is not None and entry[0] >= self.min_windows:
+                count, means, variances = entry[0], entry[1], entry[2]
+            else:
+                bucket = None
+                count, means, variances = self._pooled(buckets.values())
+        if count < self.min_windows:
+            return None
+
+        baseline = {metric: round(mean, 2) for metric, mean in zip(BASELINE_METRICS, means)}
+        for metric, variance in zip(BASELINE_METRICS, variances):
+            baseline[f"{metric}_std"] = round(max(variance, 0.0) ** 0.5, 2)
+        baseline["count"] = count
+        baseline["hour_bucket"] = bucket
+        return baseline
+
+    @staticmethod
+    def _pooled(entries):
+        """Combined count, means and variances of several buckets"""
+        entries = list(entries)
+        total = sum(entry[0] for entry in entries)
+        if total == 0:
+            return 0, [], []
+        mean = [sum(entry[0] * entry[1][i] for entry in entries) / total for i in range(len(BASELINE_METRICS))]
+        variance = [sum(entry[0] * (entry[2][i] + (entry[1][i] - mean[i]) ** 2) for entry in entries) / total
+                    for i in range(len(BASELINE_METRICS))]
+        return total, mean, variance
+
+    def baseline_columns(self, driver_ids, hours):
+        """
+        Per-row baselines for DecisionAgent.analyze_batch
+
+        Args:
+            driver_ids: Driver identifier of each row
+            hours: Hour of day of each row
+
+        Returns:
+            dict: baseline_heart_rate, baseline_hrv_sdnn (float arrays,
+                  NaN where the driver has no baseline yet)
+        """
+        buckets = np.asarray(hours, dtype=np.int64) // self.bucket_hours
+        keys, inverse = np.unique(np.stack([np.asarray(driver_ids).astype(str), buckets.astype(str)]),
+                                  axis=1, return_inverse=True)
+        inverse = np.asarray(inverse).ravel()
+        base_hr = np.full(keys.shape[1], np.nan)
+        base_sdnn = np.full(keys.shape[1], np.nan)
+        for i, (driver_id, bucket) in enumerate(keys.T):
+            baseline = self.get(driver_id, int(bucket) * self.bucket_hours)
+            if baseline is not None:
+                base_hr[i], base_sdnn[i] = baseline["heart_rate"], baseline["hrv_sdnn"]
+        return {"baseline_heart_rate": base_hr[inverse], "baseline_hrv_sdnn": base_sdnn[inverse]}
+
+    def num_drivers(self):
+        """Number of drivers with a stored baseline"""
+        with self.lock:
+            return self.connection.execute("SELECT COUNT(DISTINCT driver_id) FROM baselines").fetchone()[0]
+
+    def flush(self):
+        """Commit pending updates"""
+        with self.lock:
+            self.connection.commit()
+            self.pending = 0
+
+    def close(self):
+        """Commit pending updates and close the database"""
+        self.flush()
+        self.connection.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
+# Test program
+if __name__ == "__main__":
+    import os
+    import tempfile
+
+    print("=" * 50)
+    print("Baseline Store Test")
+    print("=" * 50)
+
+    rng = np.random.default_rng(0)
+    path = os.path.join(tempfile.mkdtemp(), "baselines.db")
+
+    # Welford updates must match numpy over the same windows
+    windows = np.column_stack([rng.normal(72, 5, 200), rng.normal(45, 8, 200), rng.normal(30, 6, 200)])
+    with BaselineStore(path) as store:
+        for row in windows:
+            store.update("driver-1", dict(zip(BASELINE_METRICS, row)), hour=9)
+        baseline = store.get("driver-1", hour=10)
+    print(f"Baseline (09:00-12:00, {baseline['count']} windows): HR={baseline['heart_rate']} bpm, "
+          f"SDNN={baseline['hrv_sdnn']} ms, RMSSD={baseline['hrv_rmssd']} ms")
+    assert np.allclose([baseline[m] for m in BASELINE_METRICS], windows.mean(axis=0), atol=0.01)
+    assert np.allclose([baseline[f"{m}_std"] for m in BASELINE_METRICS], windows.std(axis=0), atol=0.01)
+    print("[OK] Running mean/std match numpy")
+
+    # Survives a restart; other buckets fall back to the pooled baseline
+    with BaselineStore(path) as store:
+        reopened = store.get("driver-1", hour=10)
+        pooled = store.get("driver-1", hour=3)
+        assert reopened == baseline
+        assert pooled["hour_bucket"] is None and pooled["heart_rate"] == baseline["heart_rate"]
+        assert store.get("driver-2") is None
+    print("[OK] Baseline restored after reopening the database")
+
+    # Default store commits every update: nothing lost without close()
+    unclosed = BaselineStore(path)
+    for row in windows[:12]:
+        unclosed.update("driver-3", dict(zip(BASELINE_METRICS, row)), hour=9)
+    del unclosed
+    with BaselineStore(path) as store:
+        assert store.get("driver-3", hour=9)["count"] == 12
+    print("[OK] Updates persisted without close()")
+
+    # Thousands of drivers: learning and O(1) lookups (bulk load, batched commits)
+    n_drivers, n_windows = 5000, 20
+    with BaselineStore(path, commit_every=1000) as store:
+        start = time.perf_counter()
+        for w in range(n_windows):
+            for d in range(n_drivers):
+                store.update(f"fleet-{d}", {"heart_rate": 60 + d % 30, "hrv_sdnn": 40.0, "hrv_rmssd": 25.0},
+                             hour=8)
+        update_us = (time.perf_counter() - start) / (n_drivers * n_windows) * 1e6
+    with BaselineStore(path) as store:
+        start = time.perf_counter()
+        for d in range(n_drivers):
+            store.get(f"fleet-{d}", hour=8)
+        first_us = (time.perf_counter() - start) / n_drivers * 1e6
+        start = time.perf_counter()
+        for d in range(n_drivers):
+            assert store.get(f"fleet-{d}", hour=8)["heart_rate"] == 60 + d % 30
+        cached_us = (time.perf_counter() - start) / n_drivers * 1e6
+        print(f"{store.num_drivers():,} drivers: update {update_us:.1f} us, "
+              f"lookup {first_us:.1f} us (after restart), {cached_us:.1f} us (cached)")
+
+        columns = store.baseline_columns(["fleet-3", "fleet-4", "unknown", "fleet-3"], [8, 8, 8, 23])
+        assert columns["baseline_heart_rate"][[0, 1, 3]].tolist() == [63, 64, 63]
+        assert np.isnan(columns["baseline_heart_rate"][2])
+    print("[OK] Batch baseline columns")
+
+    print("\n" + "=" * 50)
+    print("[OK] Baseline store test complete!")
+    print("=" * 50)
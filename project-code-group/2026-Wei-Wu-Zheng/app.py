@@ -76,7 +76,8 @@ def init_agents():
     """Initialize three Agents"""
     agent1 = SignalFilterAgent()
     agent2 = FeatureExtractionAgent()
-    agent3 = DecisionAgent()
+    # Per-driver baselines persist across restarts in data/baselines.db
+    agent3 = DecisionAgent(baseline_store=Path(__file__).parent / "data" / "baselines.db")
     return agent1, agent2, agent3
 
 # Main title
@@ -112,6 +113,12 @@ with st.sidebar:
         help="Time already spent driving"
     )
 
+    driver_id = st.text_input(
+        "Driver ID",
+        value="",
+        help="Learns and uses this driver's personal baseline (leave empty to skip)"
+    ).strip() or None
+
     st.markdown("---")
     st.header("System Status")
 
@@ -144,14 +151,17 @@ if uploaded_file is not None:
         # Read data
         df = pd.read_csv(uploaded_file)
 
-        # Assume first column is ECG signal
-        if len(df.columns) > 0:
-            raw_signal = df.iloc[:, 0].values
+        # Every numeric column is an ECG lead; the first one is shown and checked for artifacts
+        leads = df.select_dtypes(include=np.number).values.T
+        if len(leads) > 0:
+            raw_signal = leads[0]
         else:
             st.error("CSV file format error: No data column found")
             st.stop()
+        multi_lead = len(leads) > 1
 
-        st.success(f"Data loaded successfully: {len(raw_signal)} samples ({len(raw_signal)/sampling_rate:.1f} seconds)")
+        st.success(f"Data loaded successfully: {len(raw_signal)} samples ({len(raw_signal)/sampling_rate:.1f} seconds)"
+                   + (f", {len(leads)} leads" if multi_lead else ""))
 
         # Initialize Agents
         agent1, agent2, agent3 = init_agents()
@@ -168,7 +178,9 @@ if uploaded_file is not None:
                 time.sleep(0.3)
                 progress_bar.progress(33)
 
-                cleaned_signal = agent1.filter_ecg(raw_signal, sampling_rate)
+                # All leads are filtered in one call
+                cleaned_leads = agent1.filter_ecg(leads if multi_lead else raw_signal, sampling_rate)
+                cleaned_signal = cleaned_leads[0] if multi_lead else cleaned_leads
 
                 progress_bar.progress(100)
                 time.sleep(0.2)
@@ -183,7 +195,7 @@ if uploaded_file is not None:
                     st.text(log)
 
             # Detect artifacts
-            artifacts = agent1.detect_artifacts(raw_signal)
+            artifacts = agent1.detect_artifacts(raw_signal, sampling_rate=sampling_rate)
             if len(artifacts) > 0:
                 with st.expander("Detected Artifacts"):
                     for artifact in artifacts:
@@ -198,7 +210,10 @@ if uploaded_file is not None:
                 time.sleep(0.3)
                 progress_bar.progress(50)
 
-                features = agent2.extract_features(cleaned_signal, sampling_rate)
+                if multi_lead:
+                    features = agent2.extract_features_multilead(cleaned_leads, sampling_rate)
+                else:
+                    features = agent2.extract_features(cleaned_signal, sampling_rate)
 
                 progress_bar.progress(100)
                 time.sleep(0.2)
@@ -215,6 +230,8 @@ if uploaded_file is not None:
             st.metric("HRV (RMSSD)", f"{features['hrv_rmssd']} ms",
                      help="Root mean square of successive RR interval differences")
             st.metric("Beat Count", features['num_beats'])
+            if multi_lead:
+                st.caption(f"R-peaks fused from {features['num_leads']} leads (SQI: {features['lead_sqi']})")
 
             # Feature interpretation
             with st.expander("Feature Interpretation"):
@@ -231,7 +248,7 @@ if uploaded_file is not None:
                 time.sleep(0.3)
                 progress_bar.progress(25)
 
-                decision = agent3.analyze(features, driving_duration_minutes=driving_duration)
+                decision = agent3.analyze(features, driving_duration_minutes=driving_duration, driver_id=driver_id)
 
                 progress_bar.progress(100)
                 time.sleep(0.2)
@@ -254,6 +271,14 @@ if uploaded_file is not None:
             st.markdown(f"### Risk Level: {risk_level}")
             st.metric("Risk Score", f"{risk_score} / 100")
 
+            if driver_id:
+                baseline = agent3.baseline_store.get(driver_id)
+                if baseline:
+                    st.caption(f"Baseline for {driver_id}: HR {baseline['heart_rate']} bpm, "
+                               f"SDNN {baseline['hrv_sdnn']} ms ({baseline['count']} windows)")
+                else:
+                    st.caption(f"Learning baseline for {driver_id}")
+
         # === Signal Visualization ===
         st.markdown("---")
         st.subheader("ECG Signal Visualization")
@@ -300,6 +325,15 @@ if uploaded_file is not None:
         fig.update_layout(height=600, showlegend=False)
         st.plotly_chart(fig, use_container_width=True)
 
+        # === Feature Trend (30 s windows, 10 s hop) ===
+        if len(cleaned_signal) / sampling_rate >= 60:
+            trend = agent2.extract_features_windowed(cleaned_signal, sampling_rate, window_s=30, hop_s=10)
+            trend_df = pd.DataFrame(trend).set_index("window_start_s")
+
+            with st.expander("Feature Trend (30 s windows)"):
+                st.line_chart(trend_df[["heart_rate"]])
+                st.line_chart(trend_df[["hrv_sdnn", "hrv_rmssd"]])
+
         # === Risk Gauge ===
         st.markdown("---")
         st.subheader("Fatigue Risk Gauge")
@@ -2,6 +2,7 @@
 Tools package for MCP integration
 """
 
-from .mcp_tools import MCPTools
+from .mcp_tools import MCPTools, CachedMCPTools, ContextCache
+from .risk_rules import RiskRules, load_rules
 
-__all__ = ['MCPTools']
+__all__ = ['MCPTools', 'CachedMCPTools', 'ContextCache', 'RiskRules', 'load_rules']
@@ -5,6 +5,50 @@ Provides multi-modal context query functions
 
 from datetime import datetime
 import random
+import threading
+import time
+
+try:
+    from tools.risk_rules import load_rules
+except ImportError:
+    from risk_rules import load_rules
+
+# Medical knowledge base (built once at import, see MCPTools.get_medical_info)
+MEDICAL_DB = {
+    "high_hrv": {
+        "description": "High HRV usually indicates parasympathetic nervous system activation",
+        "meaning": "In driving context, may indicate body entering relaxation or fatigue state",
+        "note": "Should be combined with other metrics (like heart rate) for comprehensive assessment"
+    },
+    "low_hr": {
+        "description": "Decreased heart rate may indicate body entering rest mode",
+        "meaning": "If accompanied by elevated HRV, likely a sign of fatigue",
+        "note": "Normal resting heart rate varies by individual, requires personalized baseline"
+    },
+    "hrv_increase": {
+        "description": "HRV increase indicates greater heart rate interval variability",
+        "meaning": "Parasympathetic nervous system (relaxation system) becoming dominant",
+        "note": "This is a danger signal while driving, indicates decreased alertness"
+    },
+    "baseline_deviation": {
+        "description": "Deviation from personal baseline",
+        "meaning": "Physiological state has changed",
+        "note": "Even if values are within normal range, deviation from baseline may be significant"
+    }
+}
+
+UNKNOWN_MEDICAL_INFO = {
+    "description": "No related information",
+    "meaning": "Please query other keywords",
+    "note": ""
+}
+
+# Seconds before a cached context lookup is refreshed (see ContextCache)
+DEFAULT_TTLS = {
+    "weather": 600,
+    "time_risk": 3600,
+    "rest_area": 300
+}
 
 class MCPTools:
     """Model Context Protocol Tool Set"""
@@ -44,44 +88,29 @@ class MCPTools:
         }
 
     @staticmethod
-    def get_time_risk():
+    def get_time_risk(hour=None):
         """
         Assess fatigue risk based on current time
 
         Late night (02:00-05:00) is highest risk
         Afternoon (14:00-16:00) is second highest
+        (periods and scores come from risk_rules.json)
+
+        Args:
+            hour: Hour of day to assess (default: now)
 
         Returns:
             dict: Time risk information
         """
-        current_hour = datetime.now().hour
-        current_time = datetime.now().strftime("%H:%M")
-
-        # Determine risk based on time
-        if 2 <= current_hour <= 5:
-            risk = "Very High"
-            reason = "Late night period (02:00-05:00), circadian low point, prone to fatigue"
-            risk_score = 40
-        elif 23 <= current_hour or current_hour <= 1:
-            risk = "High"
-            reason = "Late night period (23:00-01:00), recommended to rest"
-            risk_score = 30
-        elif 14 <= current_hour <= 16:
-            risk = "High"
-            reason = "Afternoon period (14:00-16:00), prone to fatigue"
-            risk_score = 25
-        elif 22 <= current_hour:
-            risk = "Medium"
-            reason = "Evening period, stay alert"
-            risk_score = 15
-        elif 12 <= current_hour <= 13:
-            risk = "Medium"
-            reason = "Post-lunch period, maintain focus"
-            risk_score = 10
+        if hour is None:
+            current_hour = datetime.now().hour
+            current_time = datetime.now().strftime("%H:%M")
         else:
-            risk = "Normal"
-            reason = "Normal daytime period"
-            risk_score = 0
+            current_hour = hour
+            current_time = f"{hour:02d}:00"
+
+        # Determine risk based on time (hour table from the rule file)
+        risk, reason, risk_score = load_rules().time_risk(current_hour)
 
         return {
             "current_time": current_time,
@@ -142,34 +171,7 @@ class MCPTools:
         Returns:
             dict: Medical information
         """
-        medical_db = {
-            "high_hrv": {
-                "description": "High HRV usually indicates parasympathetic nervous system activation",
-                "meaning": "In driving context, may indicate body entering relaxation or fatigue state",
-                "note": "Should be combined with other metrics (like heart rate) for comprehensive assessment"
-            },
-            "low_hr": {
-                "description": "Decreased heart rate may indicate body entering rest mode",
-                "meaning": "If accompanied by elevated HRV, likely a sign of fatigue",
-                "note": "Normal resting heart rate varies by individual, requires personalized baseline"
-            },
-            "hrv_increase": {
-                "description": "HRV increase indicates greater heart rate interval variability",
-                "meaning": "Parasympathetic nervous system (relaxation system) becoming dominant",
-                "note": "This is a danger signal while driving, indicates decreased alertness"
-            },
-            "baseline_deviation": {
-                "description": "Deviation from personal baseline",
-                "meaning": "Physiological state has changed",
-                "note": "Even if values are within normal range, deviation from baseline may be significant"
-            }
-        }
-
-        info = medical_db.get(symptom, {
-            "description": "No related information",
-            "meaning": "Please query other keywords",
-            "note": ""
-        })
+        info = MEDICAL_DB.get(symptom, UNKNOWN_MEDICAL_INFO)
 
         return info
 
@@ -178,28 +180,15 @@ class MCPTools:
         """
         Assess risk based on driving duration
 
+        Duration bands and scores come from risk_rules.json
+
         Args:
             duration_minutes: Driving duration in minutes
 
         Returns:
             dict: Duration risk information
         """
-        if duration_minutes < 60:
-            risk = "Low"
-            reason = "Short driving duration"
-            risk_score = 0
-        elif 60 <= duration_minutes < 120:
-            risk = "Medium"
-            reason = "Driving over 1 hour, consider taking a break"
-            risk_score = 10
-        elif 120 <= duration_minutes < 180:
-            risk = "High"
-            reason = "Driving over 2 hours, strongly recommended to rest"
-            risk_score = 25
-        else:
-            risk = "Very High"
-            reason = "Driving over 3 hours, must rest!"
-            risk_score = 40
+        risk, reason, risk_score = load_rules().duration_risk(duration_minutes)
 
         return {
             "duration_minutes": duration_minutes,
@@ -209,6 +198,149 @@ class MCPTools:
             "risk_score": risk_score
         }
 
+class ContextCache:
+    """
+    Per-tool TTL cache with stale-while-refresh
+
+    Entries are keyed by (tool, key), e.g. ("weather", "Tainan") or
+    ("time_risk", 14). A fresh entry is returned as is. An expired entry
+    is still returned immediately while one background thread reloads
+    it, so callers only wait on the very first lookup of a key (or
+    never, if it was prefetched). A failed refresh keeps the stale value
+    and is retried on the next lookup.
+    """
+
+    def __init__(self, ttls=None, clock=time.monotonic):
+        """
+        Args:
+            ttls: Seconds to live per tool name (default DEFAULT_TTLS)
+            clock: Time source in seconds
+        """
+        self.ttls = dict(DEFAULT_TTLS, **(ttls or {}))
+        self.clock = clock
+        self.entries = {}
+        self.refreshing = set()
+        self.lock = threading.Lock()
+
+    def get(self, tool, key, loader):
+        """
+        Cached value of loader() for (tool, key)
+
+        Args:
+            tool: Tool name (selects the TTL)
+            key: Cache key within the tool
+            loader: Callable producing a fresh value
+
+        Returns:
+            Cached value, possibly stale while a refresh runs
+        """
+        cache_key = (tool, key)
+        with self.lock:
+            entry = self.entries.get(cache_key)
+            if entry is not None:
+                value, loaded_at = entry
+                expired = self.clock() - loaded_at >= self.ttls.get(tool, 0)
+                if expired and cache_key not in self.refreshing:
+                    self._start_refresh(cache_key, loader)
+                return value
+
+        # Cold miss: load in the caller once
+        return self._load(cache_key, loader)
+
+    def prefetch(self, tool, key, loader):
+        """Load (tool, key) in the background unless cached or already loading"""
+        cache_key = (tool, key)
+        with self.lock:
+            if cache_key not in self.entries and cache_key not in self.refreshing:
+                self._start_refresh(cache_key, loader)
+
+    def _start_refresh(self, cache_key, loader):
+        """Start a background reload (caller holds the lock)"""
+        self.refreshing.add(cache_key)
+        threading.Thread(target=self._refresh, args=(cache_key, loader), daemon=True).start()
+
+    def _refresh(self, cache_key, loader):
+        try:
+            self._load(cache_key, loader)
+        except Exception:
+            pass  # keep serving the stale value, retry on the next lookup
+        finally:
+            with self.lock:
+                self.refreshing.discard(cache_key)
+
+    def _load(self, cache_key, loader):
+        value = loader()
+        with self.lock:
+            self.entries[cache_key] = (value, self.clock())
+        return value
+
+    def clear(self):
+        """Drop all cached entries"""
+        with self.lock:
+            self.entries.clear()
+
+class CachedMCPTools:
+    """
+    MCPTools behind a ContextCache
+
+    Same methods as MCPTools. Weather and rest areas are cached per
+    location, time risk per hour of day (current_time is filled in on
+    every call); duration risk and medical info are cheap and pure, so
+    they are passed through. `tools` can be any object with the MCPTools
+    interface, e.g. a client for a real weather service or a local stub.
+    """
+
+    def __init__(self, tools=None, ttls=None, location="Tainan", prefetch=True):
+        """
+        Args:
+            tools: Underlying tool provider (default MCPTools)
+            ttls: Per-tool TTL overrides (seconds)
+            location: Default location
+            prefetch: Start loading weather and time risk in the background now
+        """
+        self.tools = tools if tools is not None else MCPTools()
+        self.cache = ContextCache(ttls)
+        self.location = location
+
+        if prefetch:
+            self.cache.prefetch("weather", location, lambda: self.tools.get_weather(location))
+            self._prefetch_time_risk(datetime.now().hour)
+
+    def get_weather(self, location=None):
+        """Cached weather for a location (see MCPTools.get_weather)"""
+        location = location or self.location
+        return self.cache.get("weather", location, lambda: self.tools.get_weather(location))
+
+    def get_time_risk(self):
+        """
+        Cached time risk for the current hour (see MCPTools.get_time_risk)
+
+        Each entry is loaded for its own hour, and the next hour is
+        prefetched, so the hour change is not a cold miss in the caller.
+        """
+        now = datetime.now()
+        hour = now.hour
+        time_risk = self.cache.get("time_risk", hour, lambda: self.tools.get_time_risk(hour))
+        self._prefetch_time_risk((hour + 1) % 24)
+        return dict(time_risk, current_time=now.strftime("%H:%M"))
+
+    def _prefetch_time_risk(self, hour):
+        """Load the time risk of an hour in the background unless cached"""
+        self.cache.prefetch("time_risk", hour, lambda: self.tools.get_time_risk(hour))
+
+    def get_rest_area(self, location=None):
+        """Cached rest areas near a location (see MCPTools.get_rest_area)"""
+        location = location or self.location
+        return self.cache.get("rest_area", location, lambda: self.tools.get_rest_area(location))
+
+    def get_medical_info(self, symptom):
+        """See MCPTools.get_medical_info"""
+        return self.tools.get_medical_info(symptom)
+
+    def get_driving_duration_risk(self, duration_minutes):
+        """See MCPTools.get_driving_duration_risk"""
+        return self.tools.get_driving_duration_risk(duration_minutes)
+
 # Test program
 if __name__ == "__main__":
     print("=" * 50)
@@ -245,6 +377,53 @@ if __name__ == "__main__":
     print(f"   Meaning: {info['meaning']}")
     print()
 
+    # Test context cache: stale values are served while a slow provider refreshes
+    print("5. Context Cache (stale-while-refresh):")
+
+    class SlowWeather(MCPTools):
+        calls = 0
+
+        @staticmethod
+        def get_weather(location="Tainan"):
+            SlowWeather.calls += 1
+            time.sleep(0.2)
+            return dict(MCPTools.get_weather(location), version=SlowWeather.calls)
+
+    cached = CachedMCPTools(SlowWeather(), ttls={"weather": 0.3}, prefetch=False)
+    first = cached.get_weather()
+    start = time.perf_counter()
+    again = cached.get_weather()
+    assert again is first and SlowWeather.calls == 1
+    time.sleep(0.35)
+    stale = cached.get_weather()
+    stale_ms = (time.perf_counter() - start - 0.35) * 1000
+    assert stale["version"] == 1 and stale_ms < 100
+    time.sleep(0.3)
+    assert cached.get_weather()["version"] == 2 and SlowWeather.calls == 2
+    assert cached.get_time_risk()["hour"] == datetime.now().hour
+
+    assert MCPTools.get_medical_info("low_hr") is MEDICAL_DB["low_hr"]
+    print(f"   Expired entry served in {stale_ms:.1f} ms while refreshing (provider takes 200 ms)")
+
+    # Time risk entries are loaded for their own hour, the next one ahead of time
+    class RecordingTime(MCPTools):
+        hours = []
+
+        @staticmethod
+        def get_time_risk(hour=None):
+            RecordingTime.hours.append(hour)
+            return MCPTools.get_time_risk(hour)
+
+    cached_time = CachedMCPTools(RecordingTime(), prefetch=False)
+    current_hour = datetime.now().hour
+    assert cached_time.get_time_risk()["hour"] == current_hour
+    time.sleep(0.05)
+    next_hour = (current_hour + 1) % 24
+    assert cached_time.cache.entries[("time_risk", next_hour)][0]["hour"] == next_hour
+    assert None not in RecordingTime.hours
+    print(f"   Time risk loaded for hour {current_hour}, hour {next_hour} prefetched")
+    print()
+
     print("=" * 50)
     print("[OK] All tools test complete!")
     print("=" * 50)
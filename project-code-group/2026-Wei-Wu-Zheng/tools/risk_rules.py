@@ -0,0 +1,113 @@
+"""
+Risk Rules
+Loads the risk weights and thresholds from a rule file and compiles them
+into lookup tables shared by MCPTools and the Decision Agent
+"""
+
+from bisect import bisect_right
+from functools import lru_cache
+import json
+from pathlib import Path
+
+import numpy as np
+
+# Resolved once, so default lookups (every MCPTools call) skip the filesystem
+DEFAULT_RULES_PATH = str(Path(__file__).with_name("risk_rules.json").resolve())
+
+class RiskRules:
+    """
+    Compiled rule set
+
+    Built once from the rule file:
+    - time risk as 24-entry hour tables (score, level, reason)
+    - duration risk and risk levels as sorted bounds with score/level arrays
+    - HR, SDNN and baseline thresholds as plain numbers
+
+    Scalar lookups are an index or a bisect; batch lookups use the same
+    tables as numpy arrays.
+    """
+
+    def __init__(self, rules):
+        """
+        Args:
+            rules: Parsed rule file (dict)
+        """
+        # Time risk: first matching period wins, then the default
+        time_rules = rules["time_risk"]
+        hour_entries = [time_rules["default"]] * 24
+        for period in reversed(time_rules["periods"]):
+            for hour in period["hours"]:
+                hour_entries[hour] = period
+        self.hour_scores = np.array([entry["risk_score"] for entry in hour_entries])
+        self.hour_levels = [entry["risk_level"] for entry in hour_entries]
+        self.hour_reasons = [entry["reason"] for entry in hour_entries]
+
+        # Duration risk: bands sorted by upper bound (the last one is open)
+        bands = rules["duration_risk"]
+        self.duration_bounds = [band["below_minutes"] for band in bands[:-1]]
+        self.duration_scores = np.array([band["risk_score"] for band in bands])
+        self.duration_levels = [band["risk_level"] for band in bands]
+        self.duration_reasons = [band["reason"] for band in bands]
+
+        self.weather_scores = dict(rules["weather"])
+
+        self.hr_low = rules["heart_rate"]["low"]["below"]
+        self.hr_low_score = rules["heart_rate"]["low"]["score"]
+        self.hr_high = rules["heart_rate"]["high"]["above"]
+        self.hr_high_score = rules["heart_rate"]["high"]["score"]
+        self.sdnn_high = rules["hrv_sdnn"]["high"]["above"]
+        self.sdnn_high_score = rules["hrv_sdnn"]["high"]["score"]
+        self.sdnn_low = rules["hrv_sdnn"]["low"]["below"]
+        self.sdnn_low_score = rules["hrv_sdnn"]["low"]["score"]
+        self.hr_drop = rules["baseline"]["heart_rate_drop"]["below"]
+        self.hr_drop_score = rules["baseline"]["heart_rate_drop"]["score"]
+        self.sdnn_rise = rules["baseline"]["hrv_sdnn_rise"]["above"]
+        self.sdnn_rise_score = rules["baseline"]["hrv_sdnn_rise"]["score"]
+
+        # Risk levels in ascending order of their minimum score
+        levels = sorted(rules["levels"], key=lambda level: -np.inf if level["min_score"] is None else level["min_score"])
+        self.level_bounds = [level["min_score"] for level in levels[1:]]
+        self.level_names = np.array([level["risk_level"] for level in levels])
+        self.level_alerts = np.array([level["alert"] for level in levels])
+
+    def time_risk(self, hour):
+        """Risk (level, reason, score) of an hour of day"""
+        return self.hour_levels[hour], self.hour_reasons[hour], int(self.hour_scores[hour])
+
+    def duration_risk(self, duration_minutes):
+        """Risk (level, reason, score) of a driving duration in minutes"""
+        band = bisect_right(self.duration_bounds, duration_minutes)
+        return self.duration_levels[band], self.duration_reasons[band], int(self.duration_scores[band])
+
+    def risk_level(self, risk_score):
+        """Risk level name and alert flag of a total score"""
+        index = bisect_right(self.level_bounds, risk_score)
+        return str(self.level_names[index]), bool(self.level_alerts[index])
+
+    def duration_scores_batch(self, duration_minutes):
+        """Duration risk scores of an array of durations"""
+        return self.duration_scores[np.searchsorted(self.duration_bounds, duration_minutes, side='right')]
+
+    def risk_levels_batch(self, risk_scores):
+        """Risk level names and alert flags of an array of scores"""
+        index = np.searchsorted(self.level_bounds, risk_scores, side='right')
+        return self.level_names[index], self.level_alerts[index]
+
+@lru_cache(maxsize=8)
+def _load_rules_file(path):
+    with open(path) as f:
+        return RiskRules(json.load(f))
+
+def load_rules(path=None):
+    """
+    Load and compile a rule file (compiled once per path)
+
+    Args:
+        path: Rule file (default: risk_rules.json next to this module)
+
+    Returns:
+        RiskRules: Compiled rule set
+    """
+    if path is None:
+        return _load_rules_file(DEFAULT_RULES_PATH)
+    return _load_rules_file(str(Path(path).resolve()))
@@ -0,0 +1,281 @@
+"""
+Fleet batch runner
+Runs the three-agent pipeline headlessly over many recordings on a process pool
+"""
+
+import argparse
+from importlib.util import find_spec
+import sys
+import os
+import time
+from concurrent.futures import ProcessPoolExecutor
+from pathlib import Path
+
+import numpy as np
+import pandas as pd
+
+# Ensure agents can be imported
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from agents.agent1_filter import SignalFilterAgent
+from agents.agent2_features import FeatureExtractionAgent
+from agents.agent3_decision import DecisionAgent
+from tools.mcp_tools import MCPTools
+
+# Recording file types picked up from a directory
+RECORDING_SUFFIXES = (".csv", ".npy")
+
+# Feature columns copied into the result table
+FEATURE_COLUMNS = ["heart_rate", "hrv_sdnn", "hrv_rmssd", "num_beats", "mean_rr", "min_hr", "max_hr"]
+
+# Engines pandas can write Parquet with
+PARQUET_ENGINES = ("pyarrow", "fastparquet")
+
+# Weather fatigue factors a manifest may record
+WEATHER_FACTORS = ("High", "Medium", "Low")
+
+# Agents of the current worker process (created once by _init_worker)
+_worker_agents = None
+
+class RecordedContextTools(MCPTools):
+    """
+    Context recorded with a session instead of live lookups
+
+    Re-scoring must not depend on when or where the batch runs, so the
+    hour and weather come from the manifest. Context that was not
+    recorded is neutral: no time risk and "Low" weather impact.
+    """
+
+    def __init__(self, hour=None, weather=None):
+        """
+        Args:
+            hour: Hour of day the session was recorded (0-23, None: not recorded)
+            weather: Weather fatigue factor ("High"/"Medium"/"Low", None: not recorded)
+        """
+        self.hour = hour
+        self.weather = weather
+
+    def get_weather(self, location="Tainan"):
+        """Recorded weather impact (neutral if not recorded)"""
+        if self.weather is None:
+            return {"location": location, "temperature": "-", "condition": "Not recorded", "humidity": "-",
+                    "fatigue_factor": "Low", "description": "Weather not recorded (neutral)"}
+        return {"location": location, "temperature": "-", "condition": "Recorded", "humidity": "-",
+                "fatigue_factor": self.weather, "description": f"Recorded weather impact: {self.weather}"}
+
+    def get_time_risk(self, hour=None):
+        """Time risk of the recorded hour (no time risk if not recorded)"""
+        if self.hour is None:
+            return {"current_time": "not recorded", "risk_level": "Normal",
+                    "reason": "Hour not recorded, time risk not scored", "risk_score": 0}
+        return MCPTools.get_time_risk(self.hour)
+
+def _optional(value, convert):
+    """Manifest cell as a value, or None if empty"""
+    return None if value is None or pd.isna(value) else convert(value)
+
+def load_jobs(source, sampling_rate=250, driving_duration=0, hour=None, weather=None):
+    """
+    Build the job list from a directory or a manifest
+
+    A manifest is a CSV with a `path` column and optional `sampling_rate`,
+    `driving_duration`, `hour` (0-23) and `weather` ("High"/"Medium"/"Low")
+    columns (relative paths are resolved against the manifest's folder).
+    Empty hour/weather cells fall back to the defaults.
+
+    Args:
+        source: Directory of recordings or manifest CSV
+        sampling_rate: Default sampling rate (Hz)
+        driving_duration: Default driving duration (minutes)
+        hour: Default recording hour (None: time risk not scored)
+        weather: Default weather fatigue factor (None: neutral)
+
+    Returns:
+        list: Job dicts with path, sampling_rate, driving_duration, hour and weather
+    """
+    source = Path(source)
+
+    if source.is_dir():
+        paths = sorted(p for p in source.iterdir() if p.suffix in RECORDING_SUFFIXES)
+        return [
+            {"path": str(p), "sampling_rate": sampling_rate, "driving_duration": driving_duration,
+             "hour": hour, "weather": weather}
+            for p in paths
+        ]
+
+    manifest = pd.read_csv(source)
+    if "path" not in manifest.columns:
+        raise ValueError(f"Manifest {source} has no 'path' column")
+
+    jobs = []
+    for row in manifest.itertuples(index=False):
+        path = Path(row.path)
+        if not path.is_absolute():
+            path = source.parent / path
+        row_hour = _optional(getattr(row, "hour", None), int)
+        row_weather = _optional(getattr(row, "weather", None), str)
+        if row_hour is not None and not 0 <= row_hour <= 23:
+            raise ValueError(f"{path}: hour must be 0-23, got {row_hour}")
+        if row_weather is not None and row_weather not in WEATHER_FACTORS:
+            raise ValueError(f"{path}: weather must be one of {WEATHER_FACTORS}, got {row_weather}")
+        jobs.append({
+            "path": str(path),
+            "sampling_rate": int(getattr(row, "sampling_rate", sampling_rate)),
+            "driving_duration": float(getattr(row, "driving_duration", driving_duration)),
+            "hour": hour if row_hour is None else row_hour,
+            "weather": weather if row_weather is None else row_weather
+        })
+    return jobs
+
+def load_recording(path):
+    """Load one recording (first column of a CSV, as in app.py, or a .npy array)"""
+    path = Path(path)
+    if path.suffix == ".npy":
+        data = np.load(path)
+        return data[:, 0] if data.ndim > 1 else data
+    return pd.read_csv(path).iloc[:, 0].to_numpy(dtype=np.float64)
+
+def _init_worker():
+    """Create one set of agents per worker process"""
+    global _worker_agents
+    _worker_agents = (SignalFilterAgent(), FeatureExtractionAgent(), DecisionAgent(tools=RecordedContextTools()))
+
+def run_job(job):
+    """
+    Run Agent 1 -> Agent 2 -> Agent 3 on one recording
+
+    Agent 3 sees the job's recorded hour and weather (RecordedContextTools),
+    not the wall clock or a live weather lookup, so scores are reproducible.
+
+    Args:
+        job: Job dict from load_jobs
+
+    Returns:
+        dict: One result table row (features, risk, timings, error)
+    """
+    if _worker_agents is None:
+        _init_worker()
+    agent1, agent2, agent3 = _worker_agents
+
+    row = {
+        "recording": job["path"],
+        "sampling_rate": job["sampling_rate"],
+        "driving_duration_minutes": job["driving_duration"],
+        "hour": job.get("hour"),
+        "weather": job.get("weather"),
+        "error": ""
+    }
+    start = time.perf_counter()
+
+    try:
+        raw_signal = load_recording(job["path"])
+        row["n_samples"] = len(raw_signal)
+        loaded = time.perf_counter()
+
+        cleaned_signal = agent1.filter_ecg(raw_signal, job["sampling_rate"])
+        filtered = time.perf_counter()
+
+        features = agent2.extract_features(cleaned_signal, job["sampling_rate"])
+        extracted = time.perf_counter()
+
+        agent3.tools = RecordedContextTools(job.get("hour"), job.get("weather"))
+        decision = agent3.analyze(features, driving_duration_minutes=job["driving_duration"])
+        decided = time.perf_counter()
+
+        row.update({key: features[key] for key in FEATURE_COLUMNS})
+        row.update({
+            "risk_score": decision["risk_score"],
+            "risk_level": decision["risk_level"],
+            "alert_needed": decision["alert_needed"],
+            "load_s": loaded - start,
+            "filter_s": filtered - loaded,
+            "features_s": extracted - filtered,
+            "decision_s": decided - extracted
+        })
+
+    except Exception as e:
+        row["error"] = str(e)
+
+    row["total_s"] = time.perf_counter() - start
+    return row
+
+def run_batch(jobs, workers=None):
+    """
+    Run all jobs on a process pool
+
+    Args:
+        jobs: Job dicts from load_jobs
+        workers: Worker processes (default: all cores)
+
+    Returns:
+        pandas.DataFrame: One row per recording, in job order
+    """
+    workers = workers or os.cpu_count() or 1
+
+    if workers == 1:
+        rows = [run_job(job) for job in jobs]
+    else:
+        chunksize = max(1, len(jobs) // (workers * 4))
+        with ProcessPoolExecutor(max_workers=workers, initializer=_init_worker) as pool:
+            rows = list(pool.map(run_job, jobs, chunksize=chunksize))
+
+    return pd.DataFrame(rows)
+
+def check_output(out_path):
+    """
+    Fail before any work if the result table cannot be written
+
+    Raises:
+        ImportError: .parquet output without pyarrow or fastparquet
+    """
+    if Path(out_path).suffix == ".parquet" and not any(find_spec(engine) for engine in PARQUET_ENGINES):
+        raise ImportError(f"Writing {out_path} needs pyarrow or fastparquet "
+                          "(pip install pyarrow), or use a .csv output")
+
+def save_results(results, out_path):
+    """Write the result table as Parquet (.parquet) or CSV (anything else)"""
+    out_path = Path(out_path)
+    if out_path.suffix == ".parquet":
+        results.to_parquet(out_path, index=False)
+    else:
+        results.to_csv(out_path, index=False)
+
+def main():
+    """Main function: Re-score a fleet of recordings"""
+    parser = argparse.ArgumentParser(description="Run the three-agent pipeline over many recordings")
+    parser.add_argument("source", help="Directory of recordings (.csv/.npy) or manifest CSV")
+    parser.add_argument("--out", default="results.csv", help="Result table (.csv or .parquet)")
+    parser.add_argument("--workers", type=int, default=None, help="Worker processes (default: all cores)")
+    parser.add_argument("--sampling-rate", type=int, default=250, help="Default sampling rate (Hz)")
+    parser.add_argument("--driving-duration", type=float, default=0, help="Default driving duration (minutes)")
+    parser.add_argument("--hour", type=int, choices=range(24), default=None,
+                        help="Default recording hour 0-23 (default: time risk not scored)")
+    parser.add_argument("--weather", choices=WEATHER_FACTORS, default=None,
+                        help="Default weather fatigue factor (default: neutral)")
+    args = parser.parse_args()
+
+    try:
+        check_output(args.out)
+    except ImportError as e:
+        parser.error(str(e))
+
+    print("=" * 50)
+    print("Fleet Batch Runner")
+    print("=" * 50)
+    print()
+
+    jobs = load_jobs(args.source, args.sampling_rate, args.driving_duration, args.hour, args.weather)
+    print(f"Recordings: {len(jobs)}")
+
+    start = time.perf_counter()
+    results = run_batch(jobs, args.workers)
+    elapsed = time.perf_counter() - start
+
+    save_results(results, args.out)
+
+    n_failed = int((results["error"] != "").sum()) if len(results) else 0
+    print(f"Processed: {len(results) - n_failed} ok, {n_failed} failed in {elapsed:.1f} s")
+    print(f"[OK] Results written to {args.out}")
+
+if __name__ == "__main__":
+    main()
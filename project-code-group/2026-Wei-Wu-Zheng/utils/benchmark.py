@@ -0,0 +1,303 @@
+"""
+Performance benchmark suite
+Times every agent stage at realistic input sizes and stores results as JSON
+"""
+
+import argparse
+import json
+import platform
+import sys
+import os
+import time
+import tracemalloc
+from datetime import datetime
+
+import numpy as np
+import scipy
+from scipy import signal
+
+# Ensure agents can be imported
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from agents.agent1_filter import SignalFilterAgent
+from agents.agent2_features import FeatureExtractionAgent
+from agents.agent3_decision import DecisionAgent
+from utils.data_generator import ECGDataGenerator
+
+# Benchmark input lengths (label, seconds)
+DURATIONS = [
+    ("30 s", 30),
+    ("1 h", 3600),
+    ("24 h", 24 * 3600),
+]
+
+# Stage suite input lengths (label, seconds) and sampling rates (Hz)
+SUITE_DURATIONS = [
+    ("30s", 30),
+    ("10min", 600),
+    ("1h", 3600),
+    ("24h", 24 * 3600),
+]
+SUITE_RATES = [250, 500, 1000]
+
+# Inputs above this size are timed once per stage
+LARGE_INPUT_SAMPLES = 1_000_000
+
+# Extra repeats for stages whose cost does not grow with the input
+FAST_STAGE_REPEATS = 100
+
+def legacy_filter_ecg(raw_signal, sampling_rate=250):
+    """
+    Original Agent 1 filter chain (reference for the benchmark)
+
+    Redesigns all filters on every call and runs three separate passes.
+    """
+    sos_high = signal.butter(4, 0.5, 'highpass', fs=sampling_rate, output='sos')
+    signal_high = signal.sosfilt(sos_high, raw_signal)
+    sos_low = signal.butter(4, 40, 'lowpass', fs=sampling_rate, output='sos')
+    signal_filtered = signal.sosfilt(sos_low, signal_high)
+    b_notch, a_notch = signal.iirnotch(50, 30, sampling_rate)
+    cleaned_signal = signal.filtfilt(b_notch, a_notch, signal_filtered)
+    return (cleaned_signal - np.mean(cleaned_signal)) / np.std(cleaned_signal)
+
+def _time_call(func, repeats):
+    """Return the best wall-clock time of several calls (seconds)"""
+    best = float('inf')
+    for _ in range(repeats):
+        start = time.perf_counter()
+        func()
+        best = min(best, time.perf_counter() - start)
+    return best
+
+def benchmark_filter(durations=DURATIONS, sampling_rate=250, repeats=3):
+    """
+    Compare samples/sec of the legacy and fused filter paths
+
+    Args:
+        durations: List of (label, seconds) input lengths
+        sampling_rate: Sampling rate (Hz)
+        repeats: Calls per measurement (best time is kept)
+
+    Returns:
+        list: One result dict per input length
+    """
+    agent = SignalFilterAgent()
+    rng = np.random.default_rng(0)
+    results = []
+
+    for label, seconds in durations:
+        n_samples = int(seconds * sampling_rate)
+        raw_signal = rng.standard_normal(n_samples)
+
+        # Long inputs are slow enough that one call is a stable measurement
+        n_repeats = repeats if n_samples < 1_000_000 else 1
+
+        before = _time_call(lambda: legacy_filter_ecg(raw_signal, sampling_rate), n_repeats)
+        after = _time_call(lambda: agent.filter_ecg(raw_signal, sampling_rate), n_repeats)
+
+        results.append({
+            "duration": label,
+            "samples": n_samples,
+            "before_samples_per_sec": n_samples / before,
+            "after_samples_per_sec": n_samples / after,
+            "speedup": before / after
+        })
+
+    return results
+
+def stage_calls(agent1, agent2, agent3, raw_signal, cleaned_signal, features, sampling_rate):
+    """
+    Stages timed by the suite
+
+    Returns:
+        dict: stage name -> (callable, scales with input length)
+    """
+    return {
+        "filter_ecg": (lambda: agent1.filter_ecg(raw_signal, sampling_rate), True),
+        "detect_artifacts": (lambda: agent1.detect_artifacts(raw_signal, sampling_rate=sampling_rate), True),
+        "extract_features": (lambda: agent2.extract_features(cleaned_signal, sampling_rate), True),
+        "nonlinear_hrv": (lambda: agent2.calculate_nonlinear_features(features["rr_intervals"]), True),
+        "analyze": (lambda: agent3.analyze(features, driving_duration_minutes=60), False),
+    }
+
+def _measure(func, repeats):
+    """Return (latencies in seconds, peak traced memory in bytes) of a call"""
+    latencies = []
+    for _ in range(repeats):
+        start = time.perf_counter()
+        func()
+        latencies.append(time.perf_counter() - start)
+
+    # Memory is traced in a separate call so tracing does not skew timings
+    tracemalloc.start()
+    try:
+        func()
+        peak = tracemalloc.get_traced_memory()[1]
+    finally:
+        tracemalloc.stop()
+
+    return np.array(latencies), peak
+
+def benchmark_stages(durations=SUITE_DURATIONS, rates=SUITE_RATES, repeats=5, seed=0):
+    """
+    Time every agent stage on synthetic ECG of several lengths and rates
+
+    Args:
+        durations: List of (label, seconds) input lengths
+        rates: Sampling rates (Hz)
+        repeats: Timed calls per stage (inputs above LARGE_INPUT_SAMPLES use 1)
+        seed: Random seed for the data generator
+
+    Returns:
+        list: One result dict per (rate, duration, stage)
+    """
+    agent1 = SignalFilterAgent()
+    agent2 = FeatureExtractionAgent()
+    agent3 = DecisionAgent()
+    results = []
+
+    for sampling_rate in rates:
+        generator = ECGDataGenerator(sampling_rate=sampling_rate)
+
+        for label, seconds in durations:
+            np.random.seed(seed)
+            raw_signal = generator.generate_ecg(duration=seconds)
+            n_samples = len(raw_signal)
+
+            # Warm-up also produces the inputs of the later stages
+            cleaned_signal = agent1.filter_ecg(raw_signal, sampling_rate)
+            features = agent2.extract_features(cleaned_signal, sampling_rate)
+
+            calls = stage_calls(agent1, agent2, agent3, raw_signal, cleaned_signal, features, sampling_rate)
+            for stage, (func, scales) in calls.items():
+                if not scales:
+                    n_repeats = FAST_STAGE_REPEATS
+                elif n_samples > LARGE_INPUT_SAMPLES:
+                    n_repeats = 1
+                else:
+                    n_repeats = repeats
+
+                latencies, peak = _measure(func, n_repeats)
+                p50, p95, p99 = np.percentile(latencies, [50, 95, 99])
+
+                results.append({
+                    "stage": stage,
+                    "sampling_rate": sampling_rate,
+                    "duration": label,
+                    "samples": n_samples,
+                    "repeats": n_repeats,
+                    "throughput_samples_per_sec": n_samples / p50 if scales else None,
+                    "latency_ms": {
+                        "p50": p50 * 1000,
+                        "p95": p95 * 1000,
+                        "p99": p99 * 1000,
+                        "mean": float(np.mean(latencies)) * 1000
+                    },
+                    "peak_memory_mb": peak / 1e6
+                })
+
+            del raw_signal, cleaned_signal
+
+    return results
+
+def save_results(results, path):
+    """Write results and environment details to a JSON file"""
+    report = {
+        "timestamp": datetime.now().isoformat(timespec="seconds"),
+        "python": platform.python_version(),
+        "numpy": np.__version__,
+        "scipy": scipy.__version__,
+        "platform": platform.platform(),
+        "cpu_count": os.cpu_count(),
+        "results": results
+    }
+    with open(path, "w") as f:
+        json.dump(report, f, indent=2)
+
+def compare_results(results, previous_path):
+    """
+    Compare p50 latency against a previous JSON run
+
+    Returns:
+        list: (stage, sampling_rate, duration, previous p50 ms, current p50 ms, ratio)
+    """
+    with open(previous_path) as f:
+        previous = json.load(f)["results"]
+
+    index = {(r["stage"], r["sampling_rate"], r["duration"]): r for r in previous}
+    rows = []
+    for r in results:
+        old = index.get((r["stage"], r["sampling_rate"], r["duration"]))
+        if old is None:
+            continue
+        before = old["latency_ms"]["p50"]
+        after = r["latency_ms"]["p50"]
+        rows.append((r["stage"], r["sampling_rate"], r["duration"], before, after, before / after))
+    return rows
+
+def print_stage_results(results):
+    """Print the stage suite results as a table"""
+    print(f"{'Stage':<18} {'Rate':>5} {'Input':>6} {'Throughput (S/s)':>17} "
+          f"{'p50 ms':>9} {'p95 ms':>9} {'p99 ms':>9} {'Peak MB':>8}")
+    for r in results:
+        throughput = r["throughput_samples_per_sec"]
+        throughput = f"{throughput:,.0f}" if throughput is not None else "-"
+        latency = r["latency_ms"]
+        print(f"{r['stage']:<18} {r['sampling_rate']:>5} {r['duration']:>6} {throughput:>17} "
+              f"{latency['p50']:>9.2f} {latency['p95']:>9.2f} {latency['p99']:>9.2f} "
+              f"{r['peak_memory_mb']:>8.1f}")
+
+def print_filter_results(results):
+    """Print the filter before/after comparison as a table"""
+    print(f"{'Input':>6} {'Samples':>12} {'Before (S/s)':>14} {'After (S/s)':>14} {'Speedup':>8}")
+    for r in results:
+        print(f"{r['duration']:>6} {r['samples']:>12,} "
+              f"{r['before_samples_per_sec']:>14,.0f} {r['after_samples_per_sec']:>14,.0f} "
+              f"{r['speedup']:>7.2f}x")
+
+def main():
+    """Main function: Run the benchmark suite"""
+    duration_labels = [label for label, _ in SUITE_DURATIONS]
+
+    parser = argparse.ArgumentParser(description="Agent pipeline benchmark suite")
+    parser.add_argument("--filter-comparison", action="store_true",
+                        help="Only compare the legacy and fused Agent 1 filter")
+    parser.add_argument("--durations", nargs="+", default=duration_labels, choices=duration_labels,
+                        help="Input lengths to run")
+    parser.add_argument("--rates", nargs="+", type=int, default=SUITE_RATES, help="Sampling rates (Hz)")
+    parser.add_argument("--repeats", type=int, default=5, help="Timed calls per stage")
+    parser.add_argument("--output", default="benchmark_results.json", help="JSON results file")
+    parser.add_argument("--compare", default=None, help="Previous JSON results to compare against")
+    parser.add_argument("--sampling-rate", type=int, default=250, help="Sampling rate for --filter-comparison")
+    parser.add_argument("--skip-24h", action="store_true", help="Skip 24 h inputs")
+    args = parser.parse_args()
+
+    print("=" * 50)
+    print("Agent Pipeline Benchmark")
+    print("=" * 50)
+    print()
+
+    if args.filter_comparison:
+        durations = [d for d in DURATIONS if not (args.skip_24h and d[1] >= 24 * 3600)]
+        print_filter_results(benchmark_filter(durations, sampling_rate=args.sampling_rate))
+    else:
+        durations = [d for d in SUITE_DURATIONS
+                     if d[0] in args.durations and not (args.skip_24h and d[1] >= 24 * 3600)]
+        results = benchmark_stages(durations, args.rates, repeats=args.repeats)
+        print_stage_results(results)
+
+        if args.compare:
+            print(f"\nComparison with {args.compare} (p50 latency):")
+            for stage, rate, duration, before, after, ratio in compare_results(results, args.compare):
+                print(f"  {stage:<18} {rate:>5} {duration:>6} {before:>9.2f} -> {after:>9.2f} ms ({ratio:.2f}x)")
+
+        save_results(results, args.output)
+        print(f"\n[OK] Results saved to {args.output}")
+
+    print()
+    print("=" * 50)
+    print("[OK] Benchmark complete!")
+    print("=" * 50)
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,123 @@
+"""
+Long recording support
+Reads multi-hour ECG recordings in chunks and runs Agent 1 and Agent 2 out of core
+"""
+
+import argparse
+import sys
+import os
+import time
+from pathlib import Path
+
+import numpy as np
+import pandas as pd
+
+# Ensure agents can be imported
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from agents.agent1_filter import SignalFilterAgent
+from agents.agent2_features import FeatureExtractionAgent, FeatureResult
+
+# Samples read per chunk
+DEFAULT_CHUNK_SIZE = 1_000_000
+
+def open_recording(path, dtype="float32"):
+    """
+    Memory-map a recording without loading it
+
+    Args:
+        path: .npy file, or raw binary file of dtype samples
+        dtype: Sample dtype of raw binary files
+
+    Returns:
+        numpy array backed by the file (first column if 2-D)
+    """
+    path = Path(path)
+    if path.suffix == ".npy":
+        data = np.load(path, mmap_mode="r")
+    else:
+        data = np.memmap(path, dtype=dtype, mode="r")
+    return data[:, 0] if data.ndim > 1 else data
+
+def iter_chunks(path, chunk_size=DEFAULT_CHUNK_SIZE, dtype="float32"):
+    """
+    Yield a recording as consecutive 1-D chunks
+
+    CSV files are read with pandas in chunks (first column is ECG, as in
+    app.py); .npy and raw binary files are memory-mapped.
+
+    Args:
+        path: Recording path (.csv, .npy or raw binary)
+        chunk_size: Samples per chunk
+        dtype: Sample dtype of raw binary files
+
+    Yields:
+        numpy array: Next chunk of raw samples
+    """
+    path = Path(path)
+    if path.suffix == ".csv":
+        for frame in pd.read_csv(path, chunksize=chunk_size, usecols=[0]):
+            yield frame.iloc[:, 0].to_numpy(dtype=np.float64)
+    else:
+        data = open_recording(path, dtype)
+        for start in range(0, len(data), chunk_size):
+            yield np.asarray(data[start:start + chunk_size])
+
+def process_long_recording(path, sampling_rate=250, out_path=None, window_seconds=60,
+                           chunk_size=DEFAULT_CHUNK_SIZE, dtype="float32"):
+    """
+    Run Agent 1 and Agent 2 over a long recording with bounded memory
+
+    Args:
+        path: Recording path (.csv, .npy or raw binary)
+        sampling_rate: Sampling rate (Hz)
+        out_path: Cleaned output file (default: <path>.cleaned.f32)
+        window_seconds: Agent 2 window length (seconds)
+        chunk_size: Samples per input chunk
+        dtype: Sample dtype of raw binary input files
+
+    Returns:
+        tuple: (features dict, cleaned memmap, agent1, agent2)
+    """
+    if out_path is None:
+        out_path = str(path) + ".cleaned.f32"
+
+    agent1 = SignalFilterAgent()
+    agent2 = FeatureExtractionAgent()
+
+    cleaned = agent1.filter_to_file(iter_chunks(path, chunk_size, dtype), out_path, sampling_rate)
+    features = agent2.extract_features_long(cleaned, sampling_rate, window_seconds)
+
+    return features, cleaned, agent1, agent2
+
+def main():
+    """Main function: Process a long recording from the command line"""
+    parser = argparse.ArgumentParser(description="Out-of-core processing of long ECG recordings")
+    parser.add_argument("path", help="Recording (.csv, .npy or raw binary)")
+    parser.add_argument("--sampling-rate", type=int, default=250, help="Sampling rate (Hz)")
+    parser.add_argument("--out", default=None, help="Cleaned output file (raw float32)")
+    parser.add_argument("--window", type=float, default=60, help="Agent 2 window length (seconds)")
+    parser.add_argument("--dtype", default="float32", help="Sample dtype of raw binary input")
+    args = parser.parse_args()
+
+    print("=" * 50)
+    print("Long Recording Processing")
+    print("=" * 50)
+    print()
+
+    start = time.perf_counter()
+    features, cleaned, agent1, agent2 = process_long_recording(
+        args.path, args.sampling_rate, args.out, args.window, dtype=args.dtype)
+    elapsed = time.perf_counter() - start
+
+    for log in agent1.get_log() + agent2.get_log():
+        print(f"  {log}")
+
+    print(f"\nDuration: {len(cleaned) / args.sampling_rate / 3600:.2f} hours ({elapsed:.1f} s to process)")
+    print("\nExtracted features:")
+    for key, value in features.items():
+        if key not in FeatureResult.SERIES_KEYS:
+            print(f"  {key}: {value}")
+
+if __name__ == "__main__":
+    main()